@@ -0,0 +1,107 @@
+"""
+bench_backends.py
+
+Speed and accuracy comparison of transcription backends on a fixed local fixture set.
+
+Usage (from the repository root):
+    python benchmarks/bench_backends.py benchmarks/fixtures \
+        openai-whisper@medium faster-whisper@medium faster-whisper@small
+
+The fixture directory holds audio files, each with a reference transcript of
+the same name and a .txt extension (lecture01.mp3 + lecture01.txt). Files
+without a reference are skipped.
+
+Each backend is given as NAME@MODEL, where NAME is a registered backend or a
+"module:Class" path. Its model is loaded once before timing starts and every
+fixture is transcribed in a single call (no chunking), so the numbers reflect
+the engine itself. Reports per backend:
+
+- RTF: transcription time divided by audio length (lower is faster).
+- WER: word error rate against the references, after lower-casing and
+  stripping punctuation.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import preprocess
+import transcription
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.mp4', '.webm', '.ogg', '.flac')
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s']", ' ', text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Returns the word-level edit distance between two word lists."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1]
+
+
+def load_fixtures(directory):
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(directory, '*'))):
+        base, extension = os.path.splitext(path)
+        if extension.lower() in AUDIO_EXTENSIONS and os.path.exists(base + '.txt'):
+            with open(base + '.txt', 'r', encoding='utf-8') as f:
+                reference = normalize(f.read())
+            fixtures.append((os.path.basename(path), preprocess.decode_audio(path), reference))
+    return fixtures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fixtures', help="Directory of audio files with .txt reference transcripts")
+    parser.add_argument('backends', nargs='+', help="Backends to compare, as NAME@MODEL")
+    parser.add_argument('--threads', type=int, default=None, help="CPU threads per backend (default: engine default)")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        sys.exit(f"No audio files with reference transcripts found in {args.fixtures}")
+    total_audio = sum(len(audio) for _, audio, _ in fixtures) / transcription.SAMPLE_RATE
+    print(f"{len(fixtures)} fixture(s), {total_audio:.1f}s of audio\n")
+
+    rows = []
+    for spec in args.backends:
+        name, _, model_name = spec.rpartition('@')
+        if not name:
+            name, model_name = model_name, transcription.WHISPER_MODEL_NAME
+        started = time.perf_counter()
+        backend = transcription.load_backend(name, model_name, threads=args.threads)
+        load_seconds = time.perf_counter() - started
+
+        elapsed, errors, reference_words = 0.0, 0, 0
+        for filename, audio, reference in fixtures:
+            started = time.perf_counter()
+            segments = backend.transcribe(audio)['segments']
+            seconds = time.perf_counter() - started
+            hypothesis = normalize(" ".join(s['text'] for s in segments))
+            file_errors = word_errors(reference, hypothesis)
+            print(f"  {spec:<32} {filename:<28} RTF {seconds / (len(audio) / transcription.SAMPLE_RATE):5.2f}  "
+                  f"WER {file_errors / max(1, len(reference)):6.1%}")
+            elapsed += seconds
+            errors += file_errors
+            reference_words += len(reference)
+        rows.append((spec, load_seconds, elapsed / total_audio, errors / max(1, reference_words)))
+        del backend
+
+    print(f"\n{'backend':<32} {'load':>8} {'RTF':>6} {'WER':>7}")
+    for spec, load_seconds, rtf, wer in rows:
+        print(f"{spec:<32} {load_seconds:7.1f}s {rtf:6.2f} {wer:7.1%}")
+
+
+if __name__ == '__main__':
+    main()
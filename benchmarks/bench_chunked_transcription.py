@@ -0,0 +1,70 @@
+"""
+bench_chunked_transcription.py
+
+Wall-clock benchmark of chunked, parallel transcription against a single Whisper call.
+
+Usage (from the repository root):
+    python benchmarks/bench_chunked_transcription.py path/to/lecture.m4a --processes 4
+
+Both runs use the same model. Model loading is excluded from the timings: the
+baseline model is loaded before its clock starts and the chunk pool is warmed
+up with a short clip before the chunked run is timed.
+"""
+
+import argparse
+import os
+import sys
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import transcription
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio', help="Audio or video file to transcribe")
+    parser.add_argument('--backend', default=transcription.TRANSCRIBE_BACKEND)
+    parser.add_argument('--model', default=transcription.WHISPER_MODEL_NAME)
+    parser.add_argument('--processes', type=int, default=transcription.TRANSCRIBE_PROCESSES)
+    parser.add_argument('--chunk-seconds', type=int, default=transcription.CHUNK_SECONDS)
+    parser.add_argument('--skip-baseline', action='store_true', help="Only time the chunked run")
+    args = parser.parse_args()
+
+    transcription.CHUNK_SECONDS = args.chunk_seconds
+    transcription.MIN_CHUNKED_SECONDS = 0
+    audio = transcription.preprocess.decode_audio(args.audio)
+    audio_seconds = len(audio) / transcription.SAMPLE_RATE
+    print(f"Audio length: {audio_seconds:.1f}s")
+
+    baseline_text = None
+    if not args.skip_baseline:
+        backend = transcription.load_backend(args.backend, args.model)
+        started = time.perf_counter()
+        baseline_text = " ".join(s['text'].strip() for s in backend.transcribe(audio)['segments'])
+        baseline_seconds = time.perf_counter() - started
+        print(f"Single call:  {baseline_seconds:8.1f}s  (real-time factor {baseline_seconds / audio_seconds:.2f})")
+        del backend
+
+    pool = transcription.get_chunk_pool(processes=args.processes, backend=args.backend, model_name=args.model)
+    warmup = [pool.submit(transcription._transcribe_chunk, np.zeros(transcription.SAMPLE_RATE, dtype=np.float32), 0, 1, 0)
+              for _ in range(args.processes)]
+    for future in warmup:
+        future.result()
+
+    started = time.perf_counter()
+    chunked_text = transcription.transcribe_audio(audio, pool=pool)['text']
+    chunked_seconds = time.perf_counter() - started
+    print(f"Chunked x{args.processes}: {chunked_seconds:8.1f}s  (real-time factor {chunked_seconds / audio_seconds:.2f})")
+    transcription.shutdown_chunk_pool()
+
+    if baseline_text is not None:
+        similarity = SequenceMatcher(None, baseline_text.split(), chunked_text.split()).ratio()
+        print(f"Speedup:      {baseline_seconds / chunked_seconds:8.2f}x")
+        print(f"Word-level similarity to the single-call transcript: {similarity:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+bench_db_pool.py
+
+Micro-benchmark of request-path database latency under concurrent polling.
+
+Usage (from the repository root):
+    python benchmarks/bench_db_pool.py --clients 16 --seconds 10
+
+Runs the same workload twice against freshly seeded databases in a temporary
+directory:
+
+- legacy: a new sqlite3 connection per request, default rollback journal.
+- pooled: connections borrowed from database.ConnectionPool, WAL journal.
+
+Each simulated client repeatedly performs what a browser triggers most (a job
+status lookup and a history load) while a writer thread updates job progress
+and heartbeats the way a busy queue worker does. Reports per-request latency
+percentiles and throughput for readers and the writer.
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import database
+
+
+def seed(database_file, wal, transcripts=500, jobs=20):
+    database.init_db(database_file)
+    conn = sqlite3.connect(database_file)
+    if not wal:
+        conn.execute("PRAGMA journal_mode = DELETE")
+    conn.executemany("INSERT INTO transcripts (filename, data_path, folder_id) VALUES (?, ?, 1)",
+                     [(f"lecture {i}", f"data/{i}") for i in range(transcripts)])
+    conn.executemany("INSERT INTO transcription_queue (audio_path, original_filename) VALUES (?, ?)",
+                     [(f"uploads/{i}", f"upload {i}") for i in range(jobs)])
+    conn.commit()
+    conn.close()
+
+
+def legacy_connect(database_file):
+    conn = sqlite3.connect(database_file)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+
+def run(mode, database_file, clients, seconds):
+    pool = database.ConnectionPool(database_file, size=clients + 1) if mode == 'pooled' else None
+
+    def acquire():
+        return pool.acquire() if pool else legacy_connect(database_file)
+
+    stop = threading.Event()
+    read_latencies, write_latencies, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader(client):
+        local = []
+        job_id = client % 20 + 1
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                db = acquire()
+                db.execute(database.JOB_STATUS_QUERY, (job_id,)).fetchone()
+                db.close()
+                db = acquire()
+                db.execute(database.HISTORY_FOLDERS_QUERY).fetchall()
+                db.execute(database.HISTORY_TRANSCRIPTS_QUERY).fetchall()
+                db.close()
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            read_latencies.extend(local)
+
+    def writer():
+        job_id = 1
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                db = acquire()
+                db.execute("UPDATE transcription_queue SET progress = progress + 1, heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+                db.commit()
+                db.close()
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            write_latencies.append(time.perf_counter() - started)
+            job_id = job_id % 20 + 1
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(clients)] + [threading.Thread(target=writer)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    def describe(label, samples):
+        ms = [s * 1000 for s in samples]
+        print(f"  {label:<7} n={len(ms):<7} {len(ms) / seconds:8.0f}/s  "
+              f"mean={statistics.fmean(ms) if ms else float('nan'):6.2f}ms  p50={percentile(ms, 0.5):6.2f}ms  "
+              f"p95={percentile(ms, 0.95):6.2f}ms  p99={percentile(ms, 0.99):6.2f}ms")
+
+    print(f"{mode}:")
+    describe('reads', read_latencies)
+    describe('writes', write_latencies)
+    if errors:
+        print(f"  errors: {len(errors)} (e.g. {errors[0]})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('legacy', 'pooled'):
+            database_file = os.path.join(tmp, f"{mode}.db")
+            seed(database_file, wal=(mode == 'pooled'))
+            run(mode, database_file, args.clients, args.seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+bench_preprocess.py
+
+Before/after timings for the audio pre-processing stage.
+
+Usage (from the repository root):
+    python benchmarks/bench_preprocess.py path/to/lecture.mp4 [--transcribe]
+
+Reports, for one upload:
+
+- before: decoding the original file the way the transcriber used to (ffmpeg
+  resampling the full upload on every transcription).
+- prepare: the one-off cost of the pre-processing stage (decode, trim, write).
+- after: loading the prepared artifact, which is what the transcriber now does.
+- how much audio silence trimming removed.
+
+With --transcribe, the original and the prepared audio are also transcribed
+with the configured chunk pool, so the saving on Whisper time is measured too.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import preprocess
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<24} {elapsed:8.2f}s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('audio', help="Audio or video file as uploaded")
+    parser.add_argument('--transcribe', action='store_true', help="Also time transcription of both inputs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upload = os.path.join(tmp, os.path.basename(args.audio))
+        shutil.copyfile(args.audio, upload)
+
+        print("Decode:")
+        original, _ = timed("before (ffmpeg decode)", preprocess.decode_audio, upload)
+        prepared, _ = timed("prepare (one-off)", preprocess.prepare_audio, upload)
+        trimmed, _ = timed("after (load artifact)", preprocess.load_prepared, prepared['prepared_path'])
+
+        removed = prepared['original_seconds'] - prepared['prepared_seconds']
+        print(f"Audio: {prepared['original_seconds']:.1f}s -> {prepared['prepared_seconds']:.1f}s "
+              f"({removed / max(prepared['original_seconds'], 1e-9):.1%} silence removed, "
+              f"{len(prepared['timeline'])} kept interval(s))")
+        print(f"Artifact: {os.path.getsize(upload) / 1e6:.1f} MB upload -> "
+              f"{os.path.getsize(prepared['prepared_path']) / 1e6:.1f} MB prepared")
+
+        if args.transcribe:
+            import transcription
+            transcription.get_chunk_pool()
+            print("Transcription:")
+            timed("before (original)", transcription.transcribe_audio, original)
+            timed("after (prepared)", transcription.transcribe_audio, trimmed)
+            transcription.shutdown_chunk_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,402 @@
+"""
+loadtest.py
+
+End-to-end throughput and latency benchmark of the running application.
+
+Usage (from the repository root):
+    python benchmarks/loadtest.py --clients 32 --seconds 60 --uploads 10
+    python benchmarks/loadtest.py --json results/before.json
+
+Everything runs locally in a temporary directory, so no models or GPU are needed:
+
+- A fake Ollama server answers /api/generate (streaming or not) after a fixed
+  latency, at a fixed token rate (--llm-latency, --llm-tokens-per-second).
+- The application is started under waitress the way packaged.py starts it
+  (--threads=32 --call scripts.app:create_app), with its database and uploads
+  in the temporary directory and FakeTranscriber below as the transcription
+  backend. FakeTranscriber sleeps for --transcribe-rtf times the audio length
+  and returns lecture-like text, so pre-processing, queueing, checkpointing,
+  note generation and storage all run for real.
+- A few sessions are uploaded and processed first, so there is something to
+  load, search and chat about.
+
+Then --clients simulated browsers poll job status, the queue and the history,
+open sessions, page through transcripts, search and chat (plain and streamed)
+for --seconds, while --uploads new recordings go through the whole pipeline.
+Reports per endpoint the request count, errors, throughput and p50/p95/p99
+latency (for streamed chat, the time until the answer is complete), and for
+the pipeline the time from upload to transcript and to notes.
+
+Needs waitress, requests, numpy and ffmpeg on the PATH (pre-processing
+decodes every upload with it). Worker counts and other settings are read from
+the usual LECTURESCRIBE_* environment variables, so a run can be repeated with
+different ones. --json writes the results to a file for comparison between runs.
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+SCRIPTS_DIR = os.path.join(REPO_ROOT, 'scripts')
+sys.path.insert(0, SCRIPTS_DIR)
+import transcription
+
+SAMPLE_RATE = 16000
+VOCABULARY = ("entropy gradient descent matrix eigenvalue theorem proof lemma variance distribution "
+              "protocol latency compiler recursion invariant derivative integral equilibrium enzyme "
+              "photosynthesis momentum torque voltage capacitor algorithm heap graph vertex").split()
+CHAT_QUESTIONS = ("What was said about entropy?", "Summarize the part on gradient descent.",
+                  "Which theorem was proved?", "Explain the example with the capacitor.")
+
+
+# --- Fake Transcriber ---
+class FakeTranscriber(transcription.TranscriptionBackend):
+    """Sleeps in proportion to the audio length and returns made-up lecture text."""
+
+    name = 'loadtest-fake'
+
+    def __init__(self, model_name=transcription.WHISPER_MODEL_NAME, threads=None):
+        super().__init__(model_name, threads)
+        self.rtf = float(os.environ.get('LOADTEST_TRANSCRIBE_RTF', '0.02'))
+
+    def transcribe(self, audio):
+        seconds = len(audio) / SAMPLE_RATE
+        time.sleep(seconds * self.rtf)
+        words = random.Random(len(audio))
+        segments, start = [], 0.0
+        while start < seconds:
+            end = min(seconds, start + 5.0)
+            segments.append({'start': start, 'end': end, 'text': " " + " ".join(words.choice(VOCABULARY) for _ in range(12)) + "."})
+            start = end
+        return {'segments': segments}
+
+
+# --- Fake Ollama ---
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    tokens_per_second = 50.0
+    output_tokens = 60
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        prompt = payload.get('prompt')
+        if not prompt:
+            # A load request (warm-up): no generation.
+            return self._send_json({'model': payload.get('model'), 'done': True})
+        words = [random.choice(VOCABULARY) for _ in range(self.output_tokens)]
+        text = "## Summary\n\n" + " ".join(words) if 'notes' in prompt.lower() else " ".join(words)
+        final = {'done': True, 'prompt_eval_count': len(prompt) // 4, 'eval_count': self.output_tokens}
+        time.sleep(self.latency)
+        if not payload.get('stream'):
+            time.sleep(self.output_tokens / self.tokens_per_second)
+            return self._send_json({'response': text, **final})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        for word in text.split(' '):
+            time.sleep(1 / self.tokens_per_second)
+            self.wfile.write(json.dumps({'response': word + ' ', 'done': False}).encode() + b'\n')
+            self.wfile.flush()
+        self.wfile.write(json.dumps({'response': '', **final}).encode() + b'\n')
+
+    def _send_json(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_fake_ollama(latency, tokens_per_second):
+    FakeOllamaHandler.latency = latency
+    FakeOllamaHandler.tokens_per_second = tokens_per_second
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --- Application Server ---
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(workdir, ollama_url, transcribe_rtf, threads):
+    """Starts the app under waitress with its data in workdir; returns the process, base URL and log path."""
+    port = free_port()
+    env = dict(os.environ,
+               LECTURESCRIBE_DATA_DIR=os.path.join(workdir, 'data'),
+               LECTURESCRIBE_UPLOAD_DIR=os.path.join(workdir, 'uploads'),
+               LECTURESCRIBE_OLLAMA_URL=ollama_url,
+               LECTURESCRIBE_TRANSCRIBE_BACKEND='loadtest:FakeTranscriber',
+               LOADTEST_TRANSCRIBE_RTF=str(transcribe_rtf),
+               PYTHONPATH=os.pathsep.join(filter(None, (BENCHMARK_DIR, SCRIPTS_DIR, REPO_ROOT, os.environ.get('PYTHONPATH')))))
+    log_path = os.path.join(workdir, 'server.log')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'waitress', f'--listen=127.0.0.1:{port}', f'--threads={threads}',
+         '--call', 'scripts.app:create_app'],
+        cwd=REPO_ROOT, env=env, stdout=open(log_path, 'w'), stderr=subprocess.STDOUT)
+    return process, f"http://127.0.0.1:{port}", log_path
+
+
+def wait_until_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The application exited during startup")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"The application was not ready after {timeout}s")
+
+
+# --- Recordings ---
+def make_recording(seconds, seed):
+    """A WAV file of noise bursts separated by pauses; every seed gives different audio, so nothing is deduplicated."""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    position = 0
+    while position < len(audio):
+        burst = int(rng.uniform(2, 8) * SAMPLE_RATE)
+        audio[position:position + burst] = rng.normal(0, 0.2, min(burst, len(audio) - position))
+        position += burst + int(rng.uniform(0.3, 3) * SAMPLE_RATE)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+# --- Measurements ---
+class Recorder:
+    """Collects latencies and errors per endpoint from many threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def timed(self, endpoint, func):
+        started = time.perf_counter()
+        try:
+            response = func()
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        return response if ok else None
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else float('nan')
+
+
+def upload(recorder, client, base_url, audio, filename, priority='normal'):
+    response = recorder.timed('POST /transcribe', lambda: client.post(
+        f"{base_url}/transcribe", files={'audio': (filename, audio, 'audio/wav')}, data={'priority': priority}, timeout=120))
+    return response.json() if response is not None else None
+
+
+def track_upload(recorder, client, base_url, result, started, deadline):
+    """Polls a job until its notes are done; returns (seconds to transcript, seconds to notes) or None."""
+    if result is None:
+        return None
+    if result.get('transcript_id') and not result.get('job_id'):
+        return (0.0, 0.0)
+    job_id, transcribed_at = result['job_id'], None
+    while time.monotonic() < deadline:
+        response = recorder.timed('GET /status/<id>', lambda: client.get(f"{base_url}/status/{job_id}", timeout=30))
+        status = response.json() if response is not None else {}
+        if status.get('transcript_id') and transcribed_at is None:
+            transcribed_at = time.monotonic() - started
+        if status.get('status') == 'completed':
+            return (transcribed_at if transcribed_at is not None else time.monotonic() - started, time.monotonic() - started)
+        if status.get('status') in ('failed', 'cancelled'):
+            return None
+        time.sleep(0.5)
+    return None
+
+
+def seed_sessions(base_url, count, audio_seconds, timeout):
+    recorder, client = Recorder(), requests.Session()
+    deadline = time.monotonic() + timeout
+    results = [upload(recorder, client, base_url, make_recording(audio_seconds, 10_000 + i), f"seed {i}.wav")
+               for i in range(count)]
+    for result in results:
+        if track_upload(recorder, client, base_url, result, time.monotonic(), deadline) is None:
+            raise RuntimeError("A seed recording was not processed; see the server log")
+
+
+def browse(recorder, base_url, stop, seed):
+    """One simulated browser: a weighted mix of what the web page does."""
+    rng = random.Random(seed)
+    client = requests.Session()
+    history = recorder.timed('GET /history', lambda: client.get(f"{base_url}/history", timeout=30))
+    sessions = [t['id'] for folder in history.json()['folders'] for t in folder['transcripts']] if history is not None else []
+    sessions += [t['id'] for t in history.json().get('unfiled', [])] if history is not None else []
+    if not sessions:
+        return
+    current = None
+    actions = [
+        (30, 'poll'), (15, 'history'), (15, 'session'), (10, 'transcript'), (10, 'queue'),
+        (8, 'search'), (6, 'chat'), (6, 'chat_stream'),
+    ]
+    choices, weights = zip(*actions)
+    while not stop.is_set():
+        action = rng.choices(choices, weights)[0]
+        if action == 'poll':
+            recorder.timed('GET /status/<id>', lambda: client.get(f"{base_url}/status/{rng.randint(1, 50)}", timeout=30))
+        elif action == 'history':
+            recorder.timed('GET /history', lambda: client.get(f"{base_url}/history", timeout=30))
+        elif action == 'queue':
+            recorder.timed('GET /queue_status', lambda: client.get(f"{base_url}/queue_status", timeout=30))
+        elif action == 'session' or current is None:
+            current = rng.choice(sessions)
+            recorder.timed('GET /session/<id>', lambda: client.get(f"{base_url}/session/{current}", timeout=30))
+        elif action == 'transcript':
+            recorder.timed('GET /session/<id>/transcript', lambda: client.get(
+                f"{base_url}/session/{current}/transcript", params={'page': rng.randint(0, 2)}, timeout=30))
+        elif action == 'search':
+            recorder.timed('GET /search', lambda: client.get(f"{base_url}/search", params={'q': rng.choice(VOCABULARY)}, timeout=30))
+        elif action == 'chat':
+            recorder.timed('POST /chat', lambda: client.post(f"{base_url}/chat", json={'message': rng.choice(CHAT_QUESTIONS)}, timeout=120))
+        else:
+            def stream_answer():
+                response = client.post(f"{base_url}/chat/stream", json={'message': rng.choice(CHAT_QUESTIONS)}, stream=True, timeout=120)
+                for _ in response.iter_lines():
+                    pass
+                return response
+            recorder.timed('POST /chat/stream', stream_answer)
+        time.sleep(rng.uniform(0.05, 0.3))
+
+
+def feed_uploads(recorder, base_url, count, audio_seconds, interval, deadline, pipeline):
+    client = requests.Session()
+    trackers = []
+    for i in range(count):
+        started = time.monotonic()
+        result = upload(recorder, client, base_url, make_recording(audio_seconds, i), f"lecture {i}.wav")
+        tracker = threading.Thread(target=lambda r=result, s=started: pipeline.append(
+            track_upload(recorder, requests.Session(), base_url, r, s, deadline)))
+        tracker.start()
+        trackers.append(tracker)
+        time.sleep(interval)
+    for tracker in trackers:
+        tracker.join()
+
+
+def report(recorder, pipeline, seconds, uploads):
+    results = {'endpoints': {}, 'pipeline': {}}
+    print(f"\n{'endpoint':<32} {'n':>7} {'err':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for endpoint in sorted(recorder.latencies):
+        ms = [s * 1000 for s in recorder.latencies[endpoint]]
+        row = {'requests': len(ms), 'errors': recorder.errors.get(endpoint, 0), 'per_second': len(ms) / seconds,
+               'p50_ms': percentile(ms, 0.5), 'p95_ms': percentile(ms, 0.95), 'p99_ms': percentile(ms, 0.99)}
+        results['endpoints'][endpoint] = row
+        print(f"{endpoint:<32} {row['requests']:>7} {row['errors']:>5} {row['per_second']:>8.1f} "
+              f"{row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms {row['p99_ms']:>7.1f}ms")
+
+    done = [times for times in pipeline if times is not None]
+    results['pipeline'] = {
+        'uploads': uploads, 'completed': len(done),
+        'transcript_p50_s': percentile([t for t, _ in done], 0.5), 'transcript_p95_s': percentile([t for t, _ in done], 0.95),
+        'notes_p50_s': percentile([n for _, n in done], 0.5), 'notes_p95_s': percentile([n for _, n in done], 0.95),
+    }
+    p = results['pipeline']
+    print(f"\npipeline: {p['completed']}/{uploads} uploads completed; upload to transcript p50 {p['transcript_p50_s']:.1f}s "
+          f"p95 {p['transcript_p95_s']:.1f}s, to notes p50 {p['notes_p50_s']:.1f}s p95 {p['notes_p95_s']:.1f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help="Simulated browsers (default: 16)")
+    parser.add_argument('--seconds', type=float, default=30, help="Length of the measured phase (default: 30)")
+    parser.add_argument('--uploads', type=int, default=5, help="Recordings uploaded during the measured phase (default: 5)")
+    parser.add_argument('--upload-interval', type=float, default=2, help="Seconds between those uploads (default: 2)")
+    parser.add_argument('--seed-sessions', type=int, default=3, help="Sessions processed before measuring (default: 3)")
+    parser.add_argument('--audio-seconds', type=float, default=120, help="Length of each generated recording (default: 120)")
+    parser.add_argument('--transcribe-rtf', type=float, default=0.02, help="Fake transcription time per second of audio (default: 0.02)")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Fake Ollama delay before the first token (default: 0.5)")
+    parser.add_argument('--llm-tokens-per-second', type=float, default=50, help="Fake Ollama generation rate (default: 50)")
+    parser.add_argument('--threads', type=int, default=32, help="waitress threads (default: 32, as in packaged.py)")
+    parser.add_argument('--startup-timeout', type=float, default=120)
+    parser.add_argument('--drain-timeout', type=float, default=300, help="Longest wait for the uploads to finish after the measured phase")
+    parser.add_argument('--json', help="Also write the results to this file")
+    parser.add_argument('--keep', action='store_true', help="Keep the temporary directory (database and server log)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lecturescribe-loadtest-')
+    ollama, ollama_url = start_fake_ollama(args.llm_latency, args.llm_tokens_per_second)
+    process, base_url, log_path = start_app(workdir, ollama_url, args.transcribe_rtf, args.threads)
+    try:
+        print(f"Starting the application at {base_url} (log: {log_path})...")
+        wait_until_ready(base_url, process, args.startup_timeout)
+        print(f"Processing {args.seed_sessions} seed session(s)...")
+        seed_sessions(base_url, args.seed_sessions, args.audio_seconds, args.drain_timeout)
+
+        print(f"Measuring {args.clients} client(s) for {args.seconds:.0f}s with {args.uploads} upload(s)...")
+        recorder, pipeline, stop = Recorder(), [], threading.Event()
+        deadline = time.monotonic() + args.seconds + args.drain_timeout
+        clients = [threading.Thread(target=browse, args=(recorder, base_url, stop, i)) for i in range(args.clients)]
+        feeder = threading.Thread(target=feed_uploads, args=(recorder, base_url, args.uploads, args.audio_seconds,
+                                                             args.upload_interval, deadline, pipeline))
+        started = time.monotonic()
+        for thread in clients + [feeder]:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in clients:
+            thread.join()
+        measured = time.monotonic() - started
+        feeder.join()
+
+        results = report(recorder, pipeline, measured, args.uploads)
+        results['settings'] = vars(args)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        ollama.shutdown()
+        if args.keep:
+            print(f"Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,13 +7,18 @@ This module implements the web interface for the LectureScribe note-taking and t
 
 - Audio transcription using Whisper AI.
 - Automated note generation from transcripts using Ollama LLM.
-- Session management for multiple transcripts and notes stored in physical folders.
-- RESTful API endpoints for transcript, note, and chat history management.
-- Interactive chat assistant grounded in user notes and transcripts.
-- Secure upload and deletion of audio files and session data.
+- Session management for multiple transcripts, notes and chat histories stored in the database, with transcripts and chat served in pages.
+- RESTful API endpoints for transcript, note, and chat history management, including a time-range API over the transcript's timestamped segments.
+- Ranked full-text search with highlighted snippets across every session's notes and transcript.
+- Interactive chat assistant grounded in user notes and transcripts, with answers streamed over Server-Sent Events.
+- Retrieval of the relevant lecture passages per chat turn, so prompts stay small as conversations grow.
+- Secure upload and deletion of audio files and session data, with duplicate uploads resolved by content hash.
+- Resumable chunked uploads that stream straight to disk and survive dropped connections.
 - Integration with database operations in database.py.
-- Persistent, database-backed background transcription queue.
-- Real-time queue status endpoint.
+- Persistent, database-backed background queue with separate pre-processing, transcription and note-generation stages, each served by its own configurable pool of workers.
+- Priority and fair-share scheduling of queued jobs, with positions and ETAs estimated from recent throughput.
+- Real-time queue status endpoint and a Server-Sent Events stream that pushes job progress, queue and history changes.
+- An application factory with optional model warm-up at startup and a /health readiness endpoint for load balancers.
 
 The architecture separates web presentation, business logic, and data access, supporting extensibility and robust error handling. Security features include session-based access control and file validation. The application is designed for deployment in a secure, internal environment.
 
@@ -24,53 +29,107 @@ Status: Production
 """
 
 import os
+import sys
 import uuid
-import torch
-import whisper
-import requests
+import re
+import atexit
+import hashlib
 import json
-import sqlite3
+import html
 import shutil
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
+import sqlite3
+from flask import Flask, Response, g, render_template, request, jsonify, session, send_from_directory, stream_with_context
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import socket
+import signal
 import time
 
+# Make sibling modules importable when the app is loaded as 'scripts.app' (e.g. by waitress)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from database import (
+    init_db, get_connection, claim_next_job, owns_job, heartbeat_job, release_job, reclaim_stale_jobs,
+    bump_data_version, get_data_version,
+    find_cached_transcript, find_queued_duplicate, record_cached_transcript,
+    save_transcript, save_notes, load_session_document, load_transcript_page, load_transcript,
+    load_segment_index, load_segments,
+    append_chat_message, load_chat_messages, load_chat_context_messages, delete_session_documents,
+    search_sessions, SEARCH_HIGHLIGHT,
+    share_key_for, scheduled_job_ids, record_job_run, stage_throughput, QUEUE_STAGES, ACTIVE_STATUSES, PRIORITY_LEVELS,
+    schedule_retry, fail_job, cancel_job, retry_job, purge_cancelled_jobs, purge_job_history,
+    save_job_checkpoint, load_job_checkpoints, delete_job_checkpoints,
+    job_spans, span_histograms, job_run_counts, queue_status_counts,
+    save_model_residency, load_model_residency, clear_model_residency,
+    JOB_STATUS_QUERY, QUEUE_SNAPSHOT_QUERY, HISTORY_FOLDERS_QUERY, HISTORY_TRANSCRIPTS_QUERY, SESSION_PATH_QUERY
+)
+import transcription
+import preprocess
+import llm_client
+import retrieval
+import chat_cache
+import metrics
+from metrics import span
+from events import broker, format_sse, format_sse_comment, format_sse_retry, KEEPALIVE_SECONDS, STREAM_MAX_SECONDS
+
 # --- Configuration ---
-UPLOAD_FOLDER = '../uploads'
-DATA_FOLDER = '../data'
-DATABASE_FILE = '../data/lecturescribe.db'
+UPLOAD_FOLDER = os.environ.get('LECTURESCRIBE_UPLOAD_DIR', '../uploads')
+DATA_FOLDER = os.environ.get('LECTURESCRIBE_DATA_DIR', '../data')
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(DATA_FOLDER, exist_ok=True)
 
-# --- Global variables for the background queue processor ---
-queue_lock = threading.Lock()
-new_job_event = threading.Event()
+# --- Queue Worker Configuration ---
+QUEUE_WORKER_COUNT = int(os.environ.get('LECTURESCRIBE_QUEUE_WORKERS', '1'))
+NOTES_WORKER_COUNT = int(os.environ.get('LECTURESCRIBE_NOTES_WORKERS', '1'))
+PREPARE_WORKER_COUNT = int(os.environ.get('LECTURESCRIBE_PREPARE_WORKERS', '1'))
+JOB_LEASE_SECONDS = 300         # An active job without a heartbeat for this long is reclaimed
+HEARTBEAT_INTERVAL_SECONDS = 30
+QUEUE_POLL_SECONDS = 15         # Workers re-check the queue at least this often, even without a wake-up
+WORKER_STOP_SECONDS = 10        # How long stopping waits for transcription workers to finish their job before terminating them
+EVENT_POLL_SECONDS = 1          # How often the queue monitor checks for changes while clients are listening
+MAX_JOB_ATTEMPTS = int(os.environ.get('LECTURESCRIBE_JOB_ATTEMPTS', '3'))     # Tries per stage for transient failures
+RETRY_BACKOFF_SECONDS = 30      # Delay before the first automatic retry; doubles with each attempt
+MAX_RETRY_BACKOFF_SECONDS = 600
+CANCELLED_RETENTION_SECONDS = 300   # Cancelled jobs stay visible to clients this long
+JOB_HISTORY_RETENTION_SECONDS = int(os.environ.get('LECTURESCRIBE_HISTORY_DAYS', '90')) * 86400   # Per-run timings kept for /jobs/<id>/timings
+
+# --- ETA Estimation ---
+# Until job_history has completed runs for a stage, these rough priors are used instead.
+DEFAULT_STAGE_SECONDS_PER_AUDIO_SECOND = {'prepare': 0.02, 'transcribe': 0.3, 'notes': 0.05}
+DEFAULT_AUDIO_SECONDS = 3600    # Assumed length of a recording that has not been decoded yet
+THROUGHPUT_REFRESH_SECONDS = 30
+ETA_ROUND_SECONDS = 10          # ETAs are rounded so they do not change on every snapshot
+
+# --- Warm-up Configuration ---
+WARMUP_ENABLED = os.environ.get('LECTURESCRIBE_WARMUP', '1') != '0'
+OLLAMA_KEEP_ALIVE = os.environ.get('LECTURESCRIBE_OLLAMA_KEEP_ALIVE', '30m')   # How long Ollama keeps the model loaded after a request
+OLLAMA_WARMUP_ATTEMPTS = 30
+OLLAMA_WARMUP_RETRY_SECONDS = 10
+OLLAMA_WARMUP_TIMEOUT_SECONDS = 300
+
+# --- Global variables for the background queue workers ---
+# Created by start_queue_workers() and shared with every worker process.
+prepare_job_event = None    # Set when an upload is waiting for pre-processing
+new_job_event = None        # Set when a job is waiting for transcription
+notes_job_event = None      # Set when a transcript is waiting for notes
+worker_stop_event = None    # Set to ask the transcription worker processes to exit
+queue_worker_processes = []
+prepare_worker_threads = []
+notes_worker_threads = []
+transcription_ready_events = []   # One per worker process, set once its models are loaded
+ollama_ready = threading.Event()
+_startup_lock = threading.Lock()
+_started = False
 
 # --- Flask App Initialization ---
 STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
 app = Flask(__name__, static_folder=STATIC_FOLDER)
 app.secret_key = os.urandom(24)
 
-# --- AI Model Management (Lazy Loading) ---
-whisper_model = None
-def get_whisper_model():
-    """Loads the Whisper model on the first request and caches it globally."""
-    global whisper_model
-    if whisper_model is None:
-        print("Loading Whisper model for the first time...")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Whisper is using device: {device}")
-        try:
-            whisper_model = whisper.load_model("medium", device=device)
-            print("Whisper model loaded successfully.")
-        except Exception as e:
-            print(f"Error loading Whisper model: {e}")
-            whisper_model = None
-    return whisper_model
-
 # --- Ollama Configuration ---
-OLLAMA_ENDPOINT = "http://localhost:11434/api/generate"
 OLLAMA_CONFIG = {
     "model": "gpt-oss:20b",
     "stream": False,
@@ -79,6 +138,9 @@ OLLAMA_CONFIG = {
         "top_p": 0.9
     }
 }
+# Shared, pooled client for every Ollama call (see llm_client.py for timeouts, retries and limits).
+llm = llm_client.OllamaClient(OLLAMA_CONFIG["model"], OLLAMA_CONFIG["options"], keep_alive=OLLAMA_KEEP_ALIVE)
+answer_cache = chat_cache.AnswerCache()
 
 
 NOTES_PROMPT_TEMPLATE = """You are an expert note-taker. 
@@ -124,24 +186,92 @@ Guidelines:
 - Use proper Markdown syntax throughout.
 - Make detailed notes yet easy to read.
 - Create a section for potential questions that the professor referred to being on the exam in lecture (if any).
+- If the transcript contains [M:SS] timestamps, cite the nearest one next to examples and other key moments.
 
 Transcript:
 {transcript}
 """
 
+# --- Long Transcript (Map-Reduce) Notes Configuration ---
+# Transcripts longer than NOTES_SINGLE_PASS_TOKENS are split into sections of at most
+# NOTES_SECTION_TOKENS, noted concurrently, and merged in a final reduce pass.
+NOTES_CONTEXT_TOKENS = 16384    # num_ctx requested from Ollama for note generation
+NOTES_SINGLE_PASS_TOKENS = 8000
+NOTES_SECTION_TOKENS = int(os.environ.get('LECTURESCRIBE_NOTES_SECTION_TOKENS', '4000'))
+NOTES_MAP_CONCURRENCY = int(os.environ.get('LECTURESCRIBE_NOTES_CONCURRENCY', '2'))
+CHARS_PER_TOKEN = 4             # Rough estimate for English text
+NOTES_TIMESTAMP_SECONDS = 60    # Transcripts sent for notes carry a [M:SS] marker about this often
+
+SECTION_NOTES_PROMPT_TEMPLATE = """You are an expert note-taker.
+Your task: Turn part {index} of {count} of a lecture transcript into **detailed Markdown notes**. These notes will later be merged with the notes for the other parts.
+
+Requirements:
+- Use headings and bullet points; **bold** key terms.
+- Capture key concepts, definitions, step-by-step explanations, equations (in ```math``` blocks), code examples (in code blocks), examples, and anything the professor said could be on the exam.
+- Do not write a title or TL;DR.
+- Preserve any **code or formulas** exactly as shown in the transcript.
+- Do not invent information not present in the transcript, and do not skip any of it.
+- If the transcript contains [M:SS] timestamps, keep the nearest one next to examples and other key moments.
+
+Transcript (part {index} of {count}):
+{transcript}
+"""
+
+MERGE_NOTES_PROMPT_TEMPLATE = """You are an expert note-taker.
+Your task: Merge the following partial notes, written for consecutive parts of one lecture, into a single set of **clear, exam-ready notes**.
+
+Requirements:
+- Format in **Markdown** with headings and bullet points.
+- Start with a short **Title** and a **2 to 3 sentence TL;DR** covering the whole lecture.
+- Organize the content under these sections: ## Key Concepts, ## Important Definitions, ## Step-by-Step Explanations, ## Equations / Formulas (if any), ## Code Examples / Snippets (if applicable), ## Examples (with timestamps if mentioned), ## Potential Exam Questions.
+- Remove repetition between parts but keep every distinct fact, definition, formula and example.
+- Preserve any **code or formulas** exactly as shown in the partial notes, and keep their [M:SS] timestamps.
+- Do not invent information not present in the partial notes.
+
+Partial notes:
+{notes}
+"""
+
+# --- Chat Context Configuration ---
+CHAT_TOP_K_PASSAGES = 6         # Lecture passages retrieved per question
+CHAT_HISTORY_WINDOW = 6         # Most recent messages sent verbatim
+CHAT_HISTORY_SUMMARY_QUESTIONS = 10  # Older questions listed in the history summary
+CHAT_PAGE_SIZE = 50             # Chat messages sent when a session is opened, and per "load earlier" request
+CHAT_NOTES_PREFIX_TOKENS = 6000     # Notes up to this size are sent whole, as the reusable start of every chat prompt
+# The same num_ctx as note generation, so Ollama keeps one runner for both instead of reloading the
+# model, and a prompt that starts with the notes is never truncated from the front.
+CHAT_CONTEXT_TOKENS = NOTES_CONTEXT_TOKENS
+
+# --- Segment API Configuration ---
+SEGMENT_PAGE_SIZE = 200         # Segments returned per /segments request by default
+SEGMENT_MAX_PAGE_SIZE = 1000
+SEGMENT_MAX_SECONDS = 2 ** 31 / 1000    # Segment times are stored as int32 milliseconds
+
+# --- Search Configuration ---
+SEARCH_DEFAULT_RESULTS = 20
+SEARCH_MAX_RESULTS = 100
+SEARCH_MAX_QUERY_CHARS = 200
+
+# Everything up to and including the notes is identical for every question about a session, so
+# Ollama can reuse that already-processed prefix (the model stays loaded for OLLAMA_KEEP_ALIVE)
+# and only has to read the excerpts, history and question of each turn.
 CHAT_PROMPT_TEMPLATE = """
 You are a careful and precise assistant.
 
 Rules:
-- Use ONLY the information in the provided lecture notes and conversation history.
+- Use ONLY the information in the provided lecture notes, lecture excerpts and conversation history.
 - Do NOT add, guess, or infer details that are not explicitly stated.
 - If the information is missing or unclear, respond with: "I can't answer that based on the provided notes."
 - Prefer bullet points and concise phrasing when summarizing.
 - Maintain the original meaning of the notes without reinterpreting.
+- When an excerpt you rely on is labelled with a time (e.g. "Transcript at 12:34"), mention that time so the user can find it in the recording.
 
 --- Lecture Notes ---
 {notes}
 
+--- Relevant Lecture Excerpts ---
+{excerpts}
+
 --- Conversation History ---
 {history}
 
@@ -150,251 +280,1358 @@ Rules:
 """
 
 
+# --- Transcription Engine Selection ---
+# The backend and default model are fixed at startup; uploads may ask for any model in this list.
+TRANSCRIBE_MODEL_CHOICES = [name.strip() for name in os.environ.get(
+    'LECTURESCRIBE_TRANSCRIBE_MODELS', f"tiny,base,small,{transcription.WHISPER_MODEL_NAME}").split(',') if name.strip()]
+
+def resolve_transcribe_model(requested):
+    """Returns the model to use for an upload, or None if the requested one is not allowed."""
+    if not requested:
+        return transcription.WHISPER_MODEL_NAME
+    return requested if requested in TRANSCRIBE_MODEL_CHOICES else None
+
+def resolve_priority(requested):
+    """Returns the numeric priority for a level name (default: normal), or None if unknown."""
+    if not requested:
+        return PRIORITY_LEVELS['normal']
+    return PRIORITY_LEVELS.get(str(requested).lower())
+
+def request_owner():
+    """
+    Identifies who submitted a request, for fair sharing of the queue: the user
+    authenticated by a fronting proxy or the WSGI server, else a per-browser id.
+    """
+    if request.remote_user:
+        return request.remote_user
+    if 'owner_id' not in session:
+        session['owner_id'] = uuid.uuid4().hex
+    return session['owner_id']
+
+# --- Pipeline Version ---
+# Identifies everything that shapes a session's transcript and notes. Cached results are
+# only reused for identical audio processed with the same version.
+def pipeline_version(backend=transcription.TRANSCRIBE_BACKEND, model_name=transcription.WHISPER_MODEL_NAME):
+    return hashlib.sha256(json.dumps([
+        backend,
+        model_name,
+        [preprocess.SILENCE_RELATIVE_DB, preprocess.SILENCE_FLOOR_DB, preprocess.MAX_SILENCE_SECONDS, preprocess.KEEP_SILENCE_SECONDS],
+        OLLAMA_CONFIG,
+        NOTES_TIMESTAMP_SECONDS,
+        NOTES_PROMPT_TEMPLATE,
+        SECTION_NOTES_PROMPT_TEMPLATE,
+        MERGE_NOTES_PROMPT_TEMPLATE,
+    ], sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# --- Chunked Upload Configuration ---
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024         # Chunk size suggested to clients
+MAX_UPLOAD_CHUNK_BYTES = 64 * 1024 * 1024    # Largest single chunk accepted
+MAX_UPLOAD_BYTES = int(os.environ.get('LECTURESCRIBE_MAX_UPLOAD_BYTES', str(8 * 1024 ** 3)))
+UPLOAD_EXPIRY_SECONDS = 24 * 60 * 60         # Unfinished uploads idle for this long are discarded
+
 # --- Database Connection ---
 def get_db():
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrows a pooled connection; close() returns it to the pool."""
+    return get_connection()
 
 # --- AI Helper Functions ---
-def generate_notes_with_ollama(transcript):
-    prompt = NOTES_PROMPT_TEMPLATE.format(transcript=transcript)
-    try:
-        response = requests.post(
-            OLLAMA_ENDPOINT,
-            data=json.dumps({"prompt": prompt, **OLLAMA_CONFIG}),
-            headers={'Content-Type': 'application/json'}
-        )
-        response.raise_for_status()
-        return json.loads(response.text).get('response', "Error: Could not parse response.")
-    except Exception as e:
-        return f"## Error\nCould not connect to Ollama: {e}"
+def _ollama_generate(prompt, **options):
+    """Sends a single non-streaming notes prompt to Ollama and returns the response text."""
+    return llm.generate(prompt, traffic='notes', **options)
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def split_transcript_sections(transcript, max_tokens=NOTES_SECTION_TOKENS):
+    """Splits a transcript into sections of at most max_tokens, breaking between sentences where possible."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    sections, current = [], ""
+    for sentence in re.split(r'(?<=[.!?])\s+', transcript.strip()):
+        # A single overlong sentence (Whisper sometimes emits few stops) is split on words.
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                sections.append(current)
+                current = ""
+            sections.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            sections.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        sections.append(current)
+    return sections
+
+def _merge_notes(partial_notes, executor):
+    """
+    Reduces partial notes to one document. If the partial notes are too long to
+    merge in one prompt, neighbouring groups are merged concurrently first.
+    """
+    while len(partial_notes) > 1 and estimate_tokens("\n\n".join(partial_notes)) > NOTES_SINGLE_PASS_TOKENS:
+        groups, group = [], []
+        for notes in partial_notes:
+            if group and estimate_tokens("\n\n".join(group + [notes])) > NOTES_SINGLE_PASS_TOKENS:
+                groups.append(group)
+                group = []
+            group.append(notes)
+        groups.append(group)
+        if len(groups) == len(partial_notes):
+            break  # Every part is already at the budget; merging pairs would not shrink anything.
+        partial_notes = list(executor.map(
+            lambda g: g[0] if len(g) == 1 else _ollama_generate(MERGE_NOTES_PROMPT_TEMPLATE.format(notes="\n\n---\n\n".join(g)), num_ctx=NOTES_CONTEXT_TOKENS),
+            groups
+        ))
+    return _ollama_generate(MERGE_NOTES_PROMPT_TEMPLATE.format(notes="\n\n---\n\n".join(partial_notes)), num_ctx=NOTES_CONTEXT_TOKENS)
+
+def add_timestamp_markers(transcript, segment_index, every=NOTES_TIMESTAMP_SECONDS):
+    """
+    Inserts a [M:SS] marker before the first segment of every stretch of about every
+    seconds, so the notes can cite times. Transcripts without timing are returned as is.
+    """
+    if not segment_index:
+        return transcript
+    pieces, position, next_mark = [], 0, 0.0
+    for start_ms, offset in zip(segment_index['starts_ms'], segment_index['offsets']):
+        start = start_ms / 1000
+        if start < next_mark or offset < position:
+            continue
+        pieces.append(transcript[position:offset])
+        pieces.append(f"[{retrieval.format_timestamp(start)}] ")
+        position = offset
+        next_mark = start + every
+    pieces.append(transcript[position:])
+    return "".join(pieces)
 
-def get_chat_response(question, notes, history):
-    history_str = "\n".join([f"{msg['sender'].title()}: {msg['message']}" for msg in history])
-    prompt = CHAT_PROMPT_TEMPLATE.format(question=question, notes=notes, history=history_str)
+def generate_notes_with_ollama(transcript):
+    """
+    Generates notes for a transcript. Short transcripts use a single prompt; long ones
+    are split into token-budgeted sections that are noted concurrently and then merged.
+    Raises llm_client.LLMError if Ollama cannot be reached, so the job can be retried.
+    """
+    if estimate_tokens(transcript) <= NOTES_SINGLE_PASS_TOKENS:
+        prompt = NOTES_PROMPT_TEMPLATE.format(transcript=transcript)
+        return _ollama_generate(prompt, num_ctx=NOTES_CONTEXT_TOKENS)
+
+    sections = split_transcript_sections(transcript)
+    print(f"Transcript is too long for one prompt; generating notes for {len(sections)} sections.")
+    with ThreadPoolExecutor(max_workers=NOTES_MAP_CONCURRENCY) as executor:
+        section_notes = list(executor.map(
+            lambda item: _ollama_generate(
+                SECTION_NOTES_PROMPT_TEMPLATE.format(index=item[0], count=len(sections), transcript=item[1]),
+                num_ctx=NOTES_CONTEXT_TOKENS
+            ),
+            enumerate(sections, start=1)
+        ))
+        return _merge_notes(section_notes, executor)
+
+def summarize_chat_history(history):
+    """
+    Bounds the history sent with each question: the most recent messages are kept
+    verbatim and older ones are reduced to a short list of what the user asked.
+    """
+    recent = history[-CHAT_HISTORY_WINDOW:]
+    older_questions = [msg['message'] for msg in history[:-CHAT_HISTORY_WINDOW] if msg['sender'] == 'user']
+    lines = []
+    if older_questions:
+        asked = "; ".join(q if len(q) <= 100 else q[:97] + "..." for q in older_questions[-CHAT_HISTORY_SUMMARY_QUESTIONS:])
+        lines.append(f"(Earlier in this conversation the user asked: {asked})")
+    lines.extend(f"{msg['sender'].title()}: {msg['message']}" for msg in recent)
+    return "\n".join(lines)
+
+def build_chat_prompt(question, context):
+    """Builds the chat prompt: the session's notes first, then the retrieved excerpts, a bounded view of the history and the question."""
+    return CHAT_PROMPT_TEMPLATE.format(notes=context['notes'], excerpts=context['excerpts'],
+                                       history=summarize_chat_history(context['history']), question=question)
+
+def get_chat_response(question, context):
+    """Returns the answer to a chat question, from the answer cache when the same question was answered before."""
+    cached = answer_cache.get(context['cache_key'])
+    if cached is not None:
+        return cached
     try:
-        response = requests.post(
-            OLLAMA_ENDPOINT,
-            data=json.dumps({"prompt": prompt, **OLLAMA_CONFIG}),
-            headers={'Content-Type': 'application/json'}
-        )
-        response.raise_for_status()
-        return json.loads(response.text).get('response', "Error: Could not parse chat response.")
+        answer = llm.generate(build_chat_prompt(question, context), traffic='chat', num_ctx=CHAT_CONTEXT_TOKENS)
     except Exception as e:
         return f"Error connecting to Ollama for chat: {e}"
-
-# --- Background Queue Processor ---
-def queue_processor():
+    answer_cache.put(context['cache_key'], answer)
+    return answer
+
+def stream_chat_response(question, context):
+    """Yields the chat answer piece by piece as Ollama generates it; a cached answer is yielded at once."""
+    cached = answer_cache.get(context['cache_key'])
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    for text in llm.stream(build_chat_prompt(question, context), traffic='chat', num_ctx=CHAT_CONTEXT_TOKENS):
+        parts.append(text)
+        yield text
+    # Only answers that were generated to the end are cached.
+    answer_cache.put(context['cache_key'], "".join(parts))
+
+# --- Background Queue Workers ---
+class LeaseLost(Exception):
+    """Raised inside a worker when its job was cancelled or reclaimed by another worker."""
+
+def _heartbeat_loop(job_id, worker_id, stop_event):
+    """Keeps the lease on a claimed job alive while the worker is busy with it."""
+    while not stop_event.wait(HEARTBEAT_INTERVAL_SECONDS):
+        db = get_db()
+        still_owned = heartbeat_job(db, job_id, worker_id)
+        db.close()
+        if not still_owned:
+            print(f"[{worker_id}] Lost the lease on job {job_id}.")
+            return
+
+def run_queue_worker(stage, worker_id, job_event, process_job, on_idle=None, should_stop=None):
     """
-    A worker function that runs in a background thread.
-    It checks the database for queued transcription jobs and processes them one by one.
+    Main loop shared by the workers of every pipeline stage.
+    Reclaims stale jobs, claims the next job waiting for this stage atomically and
+    processes it, sleeping on the stage's job event (with a polling fallback) when idle.
+    on_idle, if given, is called each time the worker finds nothing to do; the loop
+    ends once should_stop, if given, returns True between jobs.
     """
-    print("Queue processor thread started.")
-    while True:
-        new_job_event.wait()
-
-        with queue_lock:
-            print("Queue processor checking for a new job...")
+    print(f"[{worker_id}] {stage.title()} worker started.")
+    while not (should_stop and should_stop()):
+        job_event.clear()
+        db = get_db()
+        reclaimed = reclaim_stale_jobs(db, JOB_LEASE_SECONDS)
+        if reclaimed:
+            print(f"[{worker_id}] Reclaimed {reclaimed} stale job(s).")
+        purge_cancelled_jobs(db, CANCELLED_RETENTION_SECONDS)
+        purge_job_history(db, JOB_HISTORY_RETENTION_SECONDS)
+        job_row = claim_next_job(db, worker_id, stage)
+        db.close()
+
+        if job_row is None:
+            if on_idle:
+                on_idle()
+            job_event.wait(QUEUE_POLL_SECONDS)
+            continue
+
+        stop_heartbeat = threading.Event()
+        heartbeat_thread = threading.Thread(target=_heartbeat_loop, args=(job_row['id'], worker_id, stop_heartbeat), daemon=True)
+        heartbeat_thread.start()
+        started = time.monotonic()
+        outcome = 'completed'
+        try:
+            with metrics.record_spans() as spans:
+                process_job(job_row, worker_id)
+        except LeaseLost:
+            outcome = 'abandoned'
+            print(f"[{worker_id}] Stopped working on job {job_row['id']}.")
+        except Exception as e:
+            print(f"[{worker_id}] An error occurred while processing job {job_row['id']}: {e}")
+            outcome = handle_job_failure(job_row, worker_id, stage, e)
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+        db = get_db()
+        record_job_run(db, job_row, stage, time.monotonic() - started, outcome, spans.spans)
+        cancelled = db.execute("SELECT id FROM transcription_queue WHERE id = ? AND status = 'cancelled'", (job_row['id'],)).fetchone()
+        db.commit()
+        db.close()
+        if cancelled:
+            discard_job_files(job_row)
+
+def process_prepare_job(job_row, worker_id, transcribe_event):
+    """
+    Stage one: decodes the upload once to 16 kHz mono, trims dead air and stores the
+    artifact, then hands the job on to the transcription stage.
+    """
+    job_id = job_row['id']
+    started = time.monotonic()
+    prepared = preprocess.prepare_audio(job_row['audio_path'])
+    print(f"[{worker_id}] Prepared job {job_id}: {prepared['original_seconds']:.0f}s of audio trimmed to "
+          f"{prepared['prepared_seconds']:.0f}s in {time.monotonic() - started:.1f}s.")
+
+    with span('db_write'):
+        db = get_db()
+        if not owns_job(db, job_id, worker_id):
+            print(f"[{worker_id}] Job {job_id} was cancelled or reclaimed by another worker; discarding prepared audio.")
+            db.close()
+            os.remove(prepared['prepared_path'])
+            raise LeaseLost(job_id)
+        release_job(db, job_id, 'prepared', prepared_path=prepared['prepared_path'],
+                    speech_timeline=preprocess.dump_timeline(prepared['timeline']),
+                    audio_duration=prepared['original_seconds'])
+        db.commit()
+        db.close()
+    transcribe_event.set()
+
+def process_transcription_job(job_row, worker_id, notes_event):
+    """
+    Stage two: transcribes a prepared job and stores the session with its transcript,
+    then hands the job on to the note-generation stage.
+    """
+    job_id = job_row['id']
+    audio_path = job_row['audio_path']
+    prepared_path = job_row['prepared_path']
+    original_filename = job_row['original_filename']
+
+    print(f"[{worker_id}] Transcribing job {job_id}: {original_filename}")
+    def report_progress(fraction):
+        with span('progress_write'):
             db = get_db()
-            processing_job = db.execute("SELECT id FROM transcription_queue WHERE status = 'processing'").fetchone()
+            db.execute("UPDATE transcription_queue SET progress = ? WHERE id = ?", (round(fraction * 100, 1), job_id))
+            db.commit()
+            db.close()
 
-            if processing_job:
-                print(f"Job {processing_job['id']} is already being processed. Worker will wait.")
+    def save_checkpoint(chunk_result):
+        # Also the point where a cancelled job stops: no further chunks are started.
+        with span('checkpoint_write'):
+            db = get_db()
+            try:
+                if not owns_job(db, job_id, worker_id):
+                    raise LeaseLost(job_id)
+                save_job_checkpoint(db, job_id, chunk_result)
+                db.commit()
+            finally:
                 db.close()
-                new_job_event.clear()
-                continue
 
-            job_row = db.execute("SELECT * FROM transcription_queue WHERE status = 'queued' ORDER BY created_at ASC LIMIT 1").fetchone()
+    with span('db_read'):
+        db = get_db()
+        completed_chunks = load_job_checkpoints(db, job_id)
+        db.close()
+    if completed_chunks:
+        print(f"[{worker_id}] Resuming job {job_id} from {len(completed_chunks)} checkpointed chunk(s).")
+
+    from_prepared = bool(prepared_path and os.path.exists(prepared_path))
+    if from_prepared:
+        print(f"--- Starting Transcription for {prepared_path} ---")
+        with span('load_audio'):
+            audio = preprocess.load_prepared(prepared_path)
+    else:
+        # Jobs queued before pre-processing existed go straight from the original upload.
+        print(f"--- Starting Transcription for {audio_path} ---")
+        with span('decode'):
+            audio = preprocess.decode_audio(audio_path)
+    # Nested spans (progress and checkpoint writes) are also counted in 'transcribe'.
+    with span('transcribe'):
+        result = transcription.transcribe_audio(audio, progress_callback=report_progress,
+                                                backend=job_row['transcribe_backend'], model_name=job_row['transcribe_model'],
+                                                completed_chunks=completed_chunks, chunk_callback=save_checkpoint)
+    if from_prepared:
+        # Segment times refer to the trimmed audio; map them back onto the original recording.
+        result['segments'] = preprocess.restore_timestamps(result['segments'], json.loads(job_row['speech_timeline'] or '[]'))
+    transcript_text = result['text']
+    print("--- Transcription Finished ---")
+
+    with span('db_write'):
+        db = get_db()
+        # Only the worker that still holds the lease may finalize the stage.
+        if not owns_job(db, job_id, worker_id):
+            print(f"[{worker_id}] Job {job_id} was cancelled or reclaimed by another worker; discarding result.")
+            db.close()
+            raise LeaseLost(job_id)
+
+        # The session goes into the folder chosen at upload, if it still exists.
+        folder = db.execute("SELECT id FROM folders WHERE id = ?", (job_row['folder_id'],)).fetchone() if job_row['folder_id'] else None
+        folder = folder or db.execute("SELECT id FROM folders WHERE name = 'Unorganized'").fetchone()
+        default_folder_id = folder['id'] if folder else None
+
+        # Save the session with its transcript now; the notes are written by the next stage.
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO transcripts (filename, data_path, folder_id) VALUES (?, '', ?)",
+                       (original_filename, default_folder_id))
+        transcript_id = cursor.lastrowid
+        save_transcript(db, transcript_id, transcript_text, result['segments'])
+        save_notes(db, transcript_id, '')
+        release_job(db, job_id, 'transcribed', transcript_id=transcript_id, progress=100)
+        delete_job_checkpoints(db, job_id)
+        bump_data_version(db)
+        db.commit()
+        db.close()
+
+    with span('file_cleanup'):
+        for path in (audio_path, prepared_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    notes_event.set()
+    print(f"[{worker_id}] Job {job_id} transcribed; queued for note generation.")
+
+def process_notes_job(job_row, worker_id):
+    """Stage three: generates notes for a transcribed job and removes it from the queue."""
+    job_id = job_row['id']
+    transcript_id = job_row['transcript_id']
+    with span('db_read'):
+        db = get_db()
+        transcript_row = db.execute("SELECT id FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+        transcript_text = add_timestamp_markers(load_transcript(db, transcript_id), load_segment_index(db, transcript_id)) if transcript_row else None
+        db.close()
 
-            if job_row:
-                job_id = job_row['id']
-                audio_path = job_row['audio_path']
-                original_filename = job_row['original_filename']
+    if transcript_row:
+        print(f"[{worker_id}] --- Generating Notes with Ollama for job {job_id} ---")
+        with span('notes_llm'):
+            notes_md = generate_notes_with_ollama(transcript_text)
+        print(f"[{worker_id}] --- Notes Generation Finished ---")
 
-                print(f"Processing job {job_id}: {original_filename}")
-                db.execute("UPDATE transcription_queue SET status = 'processing' WHERE id = ?", (job_id,))
+        with span('db_write'):
+            db = get_db()
+            if not owns_job(db, job_id, worker_id):
+                print(f"[{worker_id}] Job {job_id} was cancelled or reclaimed by another worker; discarding notes.")
+                db.close()
+                raise LeaseLost(job_id)
+            if db.execute("SELECT id FROM transcripts WHERE id = ?", (transcript_id,)).fetchone() is None:
+                print(f"[{worker_id}] Session for job {job_id} was deleted while its notes were generated.")
+                db.execute("DELETE FROM transcription_queue WHERE id = ?", (job_id,))
                 db.commit()
                 db.close()
+                return
+            save_notes(db, transcript_id, notes_md)
+            if job_row['content_hash']:
+                record_cached_transcript(db, job_row['content_hash'], job_row['pipeline_version'], transcript_id)
+            db.commit()
+            db.close()
+    else:
+        print(f"[{worker_id}] Session for job {job_id} was deleted before its notes were generated.")
 
-                model = get_whisper_model()
-                if not model:
-                    handle_transcription_failure(job_id, "Whisper model not available.")
-                    continue
+    db = get_db()
+    db.execute("DELETE FROM transcription_queue WHERE id = ?", (job_id,))
+    db.commit()
+    db.close()
+    print(f"[{worker_id}] Job {job_id} finalized and removed from queue.")
 
-                try:
-                    print(f"--- Starting Transcription for {audio_path} ---")
-                    result = model.transcribe(audio_path, verbose=True)
-                    transcript_text = result['text']
-                    print("--- Transcription Finished ---")
-                    
-                    print("--- Generating Notes with Ollama ---")
-                    notes_md = generate_notes_with_ollama(transcript_text)
-                    print("--- Notes Generation Finished ---")
-
-                    db = get_db()
-                    default_folder = db.execute("SELECT id FROM folders WHERE name = 'Unorganized'").fetchone()
-                    default_folder_id = default_folder['id'] if default_folder else None
-
-                    # Create a new directory for the session data
-                    session_folder_name = f"{original_filename}_{str(uuid.uuid4())[:8]}"
-                    session_folder_path = os.path.join(DATA_FOLDER, session_folder_name)
-                    os.makedirs(session_folder_path, exist_ok=True)
-
-                    # Save transcript, notes, and chat history to files
-                    with open(os.path.join(session_folder_path, 'transcript.txt'), 'w', encoding='utf-8') as f:
-                        f.write(transcript_text)
-                    with open(os.path.join(session_folder_path, 'notes.md'), 'w', encoding='utf-8') as f:
-                        f.write(notes_md)
-                    with open(os.path.join(session_folder_path, 'chat_history.json'), 'w', encoding='utf-8') as f:
-                        json.dump([], f) # Start with an empty chat history
-
-                    cursor = db.cursor()
-                    cursor.execute("INSERT INTO transcripts (filename, data_path, folder_id) VALUES (?, ?, ?)",
-                                   (original_filename, session_folder_path, default_folder_id))
-                    transcript_id = cursor.lastrowid
-                    
-                    db.commit()
-                    
-                    db.execute("UPDATE transcription_queue SET status = 'completed', transcript_id = ? WHERE id = ?", (transcript_id, job_id))
-                    db.commit()
-                    db.close()
-
-                    if os.path.exists(audio_path):
-                        os.remove(audio_path)
-
-                    db = get_db()
-                    db.execute("DELETE FROM transcription_queue WHERE id = ?", (job_id,))
-                    db.commit()
-                    db.close()
-                    print(f"Job {job_id} finalized and removed from queue.")
-
-                except Exception as e:
-                    print(f"An error occurred during transcription for job {job_id}: {e}")
-                    handle_transcription_failure(job_id, str(e))
+def _exit_worker(signum, frame):
+    raise SystemExit(0)
 
-            else:
-                print("No queued jobs found. Worker is going to sleep.")
-                new_job_event.clear()
-                db.close()
+def queue_worker(worker_index, job_event, notes_event, worker_count, ready_event=None, warm_up=False, stop_event=None):
+    """
+    Entry point of a transcription worker process. Exits when stop_event is set or the
+    server process has gone away (after its current job), or when it is terminated,
+    ending its chunk processes either way.
+    """
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_index}"
+    signal.signal(signal.SIGTERM, _exit_worker)
+    # Forked workers inherit the server's handlers; Ctrl+C in a terminal reaches them directly.
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    parent = multiprocessing.parent_process()
+
+    def should_stop():
+        # A server killed without running its handlers (SIGKILL, TerminateProcess on Windows) cannot set stop_event.
+        return (stop_event is not None and stop_event.is_set()) or (parent is not None and not parent.is_alive())
 
-def handle_transcription_failure(job_id, error_message):
-    """Updates the queue with failure information."""
+    try:
+        _run_transcription_worker(worker_id, job_event, notes_event, worker_count, ready_event, warm_up, should_stop)
+    finally:
+        transcription.shutdown_chunk_pool(terminate=True)
+        try:
+            publish_model_residency(worker_id)
+        except sqlite3.Error:
+            pass
+        print(f"[{worker_id}] Transcription worker stopped.")
+
+def _run_transcription_worker(worker_id, job_event, notes_event, worker_count, ready_event, warm_up, should_stop):
+    """Loads the transcription models, then runs the transcription stage until should_stop returns True."""
+    # Split the CPU and the model memory budget between every worker instead of letting each use all of it.
+    chunk_processes = max(1, worker_count) * transcription.TRANSCRIBE_PROCESSES
+    transcription.models.budget_mb = transcription.MODEL_MEMORY_BUDGET_MB / max(1, worker_count)
+    pool = transcription.get_chunk_pool(threads=max(1, (os.cpu_count() or 1) // chunk_processes))
+    if warm_up:
+        started = time.monotonic()
+        try:
+            transcription.warm_up_chunk_pool(pool)
+            print(f"[{worker_id}] Transcription models loaded in {time.monotonic() - started:.1f}s.")
+        except Exception as e:
+            print(f"[{worker_id}] Transcription warm-up failed: {e}")
+            ready_event = None
+    publish_model_residency(worker_id)
+    if ready_event is not None:
+        ready_event.set()
+
+    def transcribe_job(job_row, worker_id):
+        try:
+            process_transcription_job(job_row, worker_id, notes_event)
+        finally:
+            publish_model_residency(worker_id)
+
+    def release_idle_models():
+        # Models load again on demand, when the next job arrives.
+        unloaded = transcription.models.release_idle()
+        if unloaded:
+            print(f"[{worker_id}] Unloaded idle transcription model(s): {', '.join(f'{b}/{m}' for b, m in unloaded)}.")
+            publish_model_residency(worker_id)
+
+    run_queue_worker('transcribe', worker_id, job_event, transcribe_job, on_idle=release_idle_models, should_stop=should_stop)
+
+def publish_model_residency(worker_id):
+    """Records this worker's loaded models and their memory use for /models and /metrics."""
+    db = get_db()
+    save_model_residency(db, worker_id, transcription.models.residency())
+    db.commit()
+    db.close()
+
+def prepare_worker(worker_index, job_event, transcribe_event):
+    """Entry point of a pre-processing worker thread; decoding runs in an ffmpeg subprocess, so threads suffice."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-prepare-{worker_index}"
+    run_queue_worker('prepare', worker_id, job_event,
+                     lambda job_row, worker_id: process_prepare_job(job_row, worker_id, transcribe_event))
+
+def notes_worker(worker_index, job_event):
+    """Entry point of a note-generation worker thread; these only wait on Ollama, so threads suffice."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-notes-{worker_index}"
+    run_queue_worker('notes', worker_id, job_event, process_notes_job)
+
+def start_queue_workers(worker_count=QUEUE_WORKER_COUNT, notes_worker_count=NOTES_WORKER_COUNT,
+                        prepare_worker_count=PREPARE_WORKER_COUNT):
+    """Starts the pre-processing threads, the transcription worker processes and the note-generation threads."""
+    global prepare_job_event, new_job_event, notes_job_event, worker_stop_event
+    db = get_db()
+    clear_model_residency(db)
+    db.commit()
+    db.close()
+    prepare_job_event = threading.Event()
+    new_job_event = multiprocessing.Event()
+    notes_job_event = multiprocessing.Event()
+    worker_stop_event = multiprocessing.Event()
+    for index in range(worker_count):
+        # Not daemonic: each worker runs its own pool of chunk transcription processes.
+        ready_event = multiprocessing.Event()
+        transcription_ready_events.append(ready_event)
+        process = multiprocessing.Process(target=queue_worker,
+                                          args=(index, new_job_event, notes_job_event, worker_count, ready_event, WARMUP_ENABLED,
+                                                worker_stop_event))
+        process.start()
+        queue_worker_processes.append(process)
+    for index in range(prepare_worker_count):
+        thread = threading.Thread(target=prepare_worker, args=(index, prepare_job_event, new_job_event), daemon=True)
+        thread.start()
+        prepare_worker_threads.append(thread)
+    for index in range(notes_worker_count):
+        thread = threading.Thread(target=notes_worker, args=(index, notes_job_event), daemon=True)
+        thread.start()
+        notes_worker_threads.append(thread)
+    atexit.register(stop_queue_workers)
+    install_stop_signal_handlers()
+    print(f"Started {prepare_worker_count} pre-processing thread(s), {worker_count} transcription worker process(es) "
+          f"and {notes_worker_count} notes worker thread(s).")
+    prepare_job_event.set()
+    new_job_event.set()
+    notes_job_event.set()
+
+def stop_queue_workers():
+    """
+    Stops the transcription worker processes: they are asked to exit after their current
+    job, and terminated (which also ends their chunk processes) if they have not within
+    WORKER_STOP_SECONDS. Interrupted jobs are reclaimed once their lease expires.
+    """
+    if worker_stop_event is not None:
+        worker_stop_event.set()
+        new_job_event.set()
+    deadline = time.monotonic() + WORKER_STOP_SECONDS
+    for process in queue_worker_processes:
+        process.join(timeout=max(0, deadline - time.monotonic()))
+    for process in queue_worker_processes:
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    queue_worker_processes.clear()
+    transcription_ready_events.clear()
+
+_previous_signal_handlers = {}
+
+def _stop_workers_on_signal(signum, frame):
+    stop_queue_workers()
+    previous = _previous_signal_handlers.get(signum)
+    if callable(previous):
+        previous(signum, frame)     # e.g. KeyboardInterrupt for Ctrl+C
+    else:
+        sys.exit(128 + signum)
+
+def install_stop_signal_handlers():
+    """
+    Stops the worker processes when the server is stopped with SIGTERM (as the tray's
+    Stop Server does) or Ctrl+C; atexit handlers do not run on SIGTERM. Only possible
+    from the main thread, which is where servers call create_app.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        _previous_signal_handlers.setdefault(signum, signal.getsignal(signum))
+        signal.signal(signum, _stop_workers_on_signal)
+
+def notify_queue_workers():
+    """Wakes idle pre-processing workers after a job has been added to the queue."""
+    if prepare_job_event is not None:
+        prepare_job_event.set()
+
+def is_transient_error(error):
+    """True for failures that are worth retrying automatically: Ollama or the network being down, a busy database, a crashed chunk worker."""
+    return isinstance(error, (llm_client.LLMError, ConnectionError, TimeoutError, sqlite3.OperationalError, BrokenProcessPool))
+
+def handle_job_failure(job_row, worker_id, stage, error):
+    """
+    Retries a transient failure after an exponential backoff, up to MAX_JOB_ATTEMPTS per
+    stage; otherwise marks the job failed. Returns the outcome recorded in job_history.
+    """
+    job_id = job_row['id']
+    attempt = job_row['attempts'] + 1
     db = get_db()
-    db.execute("UPDATE transcription_queue SET status = 'failed', error_message = ? WHERE id = ?", (error_message, job_id))
+    if is_transient_error(error) and attempt < MAX_JOB_ATTEMPTS:
+        delay = min(MAX_RETRY_BACKOFF_SECONDS, RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        retried = schedule_retry(db, job_id, worker_id, stage, f"Attempt {attempt} failed, retrying: {error}", delay)
+        outcome = 'retrying'
+        if retried:
+            print(f"[{worker_id}] Job {job_id} will be retried in {delay}s (attempt {attempt + 1} of {MAX_JOB_ATTEMPTS}).")
+    else:
+        fail_job(db, job_id, worker_id, stage, str(error))
+        outcome = 'failed'
     db.commit()
     db.close()
+    return outcome
+
+def discard_job_files(job_row):
+    """Removes a cancelled job's upload, prepared audio and checkpoints."""
+    for path in (job_row['audio_path'], job_row['prepared_path']):
+        if path and os.path.exists(path):
+            os.remove(path)
+    db = get_db()
+    delete_job_checkpoints(db, job_row['id'])
+    db.commit()
+    db.close()
+
+def notify_stage_workers(stage):
+    """Wakes the idle workers of a stage after a job has been put back in its queue."""
+    event = {'prepare': prepare_job_event, 'transcribe': new_job_event, 'notes': notes_job_event}[stage]
+    if event is not None:
+        event.set()
+
+# --- Warm-up and Readiness ---
+def warm_up_ollama():
+    """
+    Loads the Ollama model ahead of the first notes or chat request. An empty prompt
+    makes Ollama load the model without generating; retries until Ollama is up.
+    """
+    for attempt in range(1, OLLAMA_WARMUP_ATTEMPTS + 1):
+        started = time.monotonic()
+        try:
+            # Loaded with the context size notes and chat use, so the first real request does not reload it.
+            llm.load_model(timeout=OLLAMA_WARMUP_TIMEOUT_SECONDS, num_ctx=NOTES_CONTEXT_TOKENS)
+            ollama_ready.set()
+            print(f"Ollama model '{OLLAMA_CONFIG['model']}' loaded in {time.monotonic() - started:.1f}s.")
+            return
+        except llm_client.LLMError as e:
+            print(f"Ollama warm-up attempt {attempt} failed: {e}")
+            time.sleep(OLLAMA_WARMUP_RETRY_SECONDS)
+
+def create_app():
+    """
+    Application factory used by production servers (waitress --call scripts.app:create_app).
+    Prepares the database, starts the queue workers and, unless LECTURESCRIBE_WARMUP=0,
+    loads the models in the background. Safe to call more than once.
+    """
+    global _started
+    with _startup_lock:
+        if not _started:
+            init_db()
+            start_queue_workers()
+            if WARMUP_ENABLED:
+                threading.Thread(target=warm_up_ollama, daemon=True).start()
+            else:
+                ollama_ready.set()
+            _started = True
+    return app
+
+def readiness_checks():
+    checks = {}
+    try:
+        db = get_db()
+        db.execute("SELECT 1").fetchone()
+        db.close()
+        checks['database'] = True
+    except Exception:
+        checks['database'] = False
+    checks['transcription'] = _started and all(event.is_set() for event in transcription_ready_events) \
+        and all(process.is_alive() for process in queue_worker_processes)
+    checks['ollama'] = ollama_ready.is_set()
+    return checks
+
+# --- Push Events ---
+_queue_monitor_lock = threading.Lock()
+_queue_monitor_thread = None
+
+_throughput_cache = {'at': 0.0, 'value': None}
+_throughput_cache_lock = threading.Lock()
+
+def get_stage_throughput(db):
+    """Returns stage_throughput() from job_history, recomputed at most every THROUGHPUT_REFRESH_SECONDS."""
+    with _throughput_cache_lock:
+        if _throughput_cache['value'] is None or time.monotonic() - _throughput_cache['at'] > THROUGHPUT_REFRESH_SECONDS:
+            _throughput_cache.update(at=time.monotonic(), value=stage_throughput(db))
+        return _throughput_cache['value']
+
+def estimate_stage_seconds(throughput, stage, audio_duration):
+    """Estimates how long one stage takes for a job, from recent throughput (or the priors)."""
+    stats = throughput[stage]
+    if audio_duration:
+        return (stats['seconds_per_audio_second'] or DEFAULT_STAGE_SECONDS_PER_AUDIO_SECOND[stage]) * audio_duration
+    return stats['seconds_per_job'] or DEFAULT_STAGE_SECONDS_PER_AUDIO_SECOND[stage] * DEFAULT_AUDIO_SECONDS
+
+STAGE_WORKERS = {'prepare': PREPARE_WORKER_COUNT, 'transcribe': QUEUE_WORKER_COUNT, 'notes': NOTES_WORKER_COUNT}
+
+def _queue_snapshot(db):
+    """
+    Returns the state of every job in the queue and a queue summary. Jobs waiting for
+    transcription get their position in scheduling order, and every job an ETA: the
+    work ahead of it in its stage spread over that stage's workers, plus its own
+    remaining stages, estimated from recent throughput.
+    """
+    rows = db.execute(QUEUE_SNAPSHOT_QUERY).fetchall()
+    jobs = {}
+    for row in rows:
+        job = dict(row)
+        job['job_id'] = job.pop('id')
+        jobs[job['job_id']] = job
+
+    throughput = get_stage_throughput(db)
+    stages = list(QUEUE_STAGES)
+    position_offset = 0
+    for stage in reversed(stages):
+        # Later stages first, so waiting for transcription ranks ahead of waiting for pre-processing.
+        waiting_status, active_status = QUEUE_STAGES[stage]
+        later_stages = stages[stages.index(stage) + 1:]
+        backlog = 0.0
+        for job in jobs.values():
+            if job['status'] == active_status:
+                own = estimate_stage_seconds(throughput, stage, job['audio_duration'])
+                remaining = own * (1 - job['progress'] / 100) if stage == 'transcribe' else own / 2
+                backlog += remaining
+                job['eta_seconds'] = remaining + sum(estimate_stage_seconds(throughput, s, job['audio_duration']) for s in later_stages)
+        ahead = 0.0
+        workers = max(1, STAGE_WORKERS[stage])
+        scheduled = [jobs[job_id] for job_id in scheduled_job_ids(db, stage) if job_id in jobs]
+        for position, job in enumerate(scheduled, start=1):
+            own = estimate_stage_seconds(throughput, stage, job['audio_duration'])
+            job['eta_seconds'] = (backlog + ahead) / workers + own + \
+                sum(estimate_stage_seconds(throughput, s, job['audio_duration']) for s in later_stages)
+            ahead += own
+            if stage != 'notes':
+                job['position'] = position_offset + position
+        if stage != 'notes':
+            position_offset += len(scheduled)
+    for job in jobs.values():
+        if 'eta_seconds' in job:
+            job['eta_seconds'] = int(round(job['eta_seconds'] / ETA_ROUND_SECONDS) * ETA_ROUND_SECONDS)
+
+    summary = {
+        'processing_files': [j['original_filename'] for j in jobs.values() if j['status'] == 'processing'],
+        'notes_files': [j['original_filename'] for j in jobs.values() if j['status'] == 'generating_notes'],
+        'queued_count': position_offset,
+        'drain_eta_seconds': max((j.get('eta_seconds', 0) for j in jobs.values()), default=0),
+    }
+    summary['processing_file'] = summary['processing_files'][0] if summary['processing_files'] else None
+    return jobs, summary
+
+def queue_monitor():
+    """
+    Publishes job, queue and history events by diffing the queue once per interval.
+    Runs only while at least one client is subscribed, and reuses a single connection.
+    An error (e.g. a locked database under heavy write load) skips one interval.
+    """
+    db = get_db()
+    previous_jobs = previous_summary = None
+    while True:
+        try:
+            if previous_jobs is None or not broker.has_subscribers.is_set():
+                broker.has_subscribers.wait()
+                previous_jobs, previous_summary = _queue_snapshot(db)
+            time.sleep(EVENT_POLL_SECONDS)
+
+            jobs, summary = _queue_snapshot(db)
+            history_changed = False
+            for job_id, job in jobs.items():
+                previous = previous_jobs.get(job_id)
+                if previous != job:
+                    broker.publish('job', job)
+                    if job['transcript_id'] and not (previous and previous['transcript_id']):
+                        history_changed = True
+            for job_id in previous_jobs.keys() - jobs.keys():
+                # Finished jobs are removed from the queue; so are cancelled ones, after a while.
+                if previous_jobs[job_id]['status'] != 'cancelled':
+                    broker.publish('job', {**previous_jobs[job_id], 'status': 'completed', 'progress': 100})
+                    history_changed = True
+            if summary != previous_summary:
+                broker.publish('queue', summary)
+            if history_changed:
+                broker.publish('history', {})
+            previous_jobs, previous_summary = jobs, summary
+        except Exception as e:
+            print(f"Queue monitor error: {e}")
+            time.sleep(EVENT_POLL_SECONDS)
+
+def ensure_queue_monitor():
+    """Starts the queue monitor thread on first use, and again if it has died."""
+    global _queue_monitor_thread
+    with _queue_monitor_lock:
+        if _queue_monitor_thread is None or not _queue_monitor_thread.is_alive():
+            _queue_monitor_thread = threading.Thread(target=queue_monitor, daemon=True)
+            _queue_monitor_thread.start()
 
 # --- Flask Routes ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # For streamed responses (events, chat) this is the time until the stream starts.
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def save_and_hash_stream(stream, audio_path):
+    """Writes an upload to disk in fixed-size chunks, hashing it on the way. Returns the SHA-256 hex digest."""
+    hasher = hashlib.sha256()
+    with open(audio_path, 'wb') as f:
+        while True:
+            chunk = stream.read(HASH_CHUNK_BYTES)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            f.write(chunk)
+    return hasher.hexdigest()
+
+def enqueue_audio(audio_path, original_filename, content_hash, model_name=None, priority=0, owner=None, folder_id=None):
+    """
+    Queues an uploaded file for processing unless identical audio was already handled.
+    priority, owner and folder_id feed the scheduler; the session is filed in folder_id.
+    Returns the JSON payload for the client: a finished session's transcript_id,
+    the job_id of an identical job still in the pipeline, or the new job's job_id.
+    """
+    backend = transcription.TRANSCRIBE_BACKEND
+    model_name = model_name or transcription.WHISPER_MODEL_NAME
+    version = pipeline_version(backend, model_name)
+    db = get_db()
+    # Serialize ingestion so two identical uploads arriving together cannot both be queued.
+    db.execute("BEGIN IMMEDIATE")
+    cached_transcript_id = find_cached_transcript(db, content_hash, version)
+    duplicate_job_id = None if cached_transcript_id else find_queued_duplicate(db, content_hash, version)
+    if cached_transcript_id or duplicate_job_id:
+        db.rollback()
+        db.close()
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+        print(f"Duplicate upload of '{original_filename}' resolved without reprocessing.")
+        if cached_transcript_id:
+            return {'transcript_id': cached_transcript_id, 'duplicate': True}
+        return {'job_id': duplicate_job_id, 'duplicate': True}
+
+    cursor = db.cursor()
+    cursor.execute('''
+        INSERT INTO transcription_queue (audio_path, original_filename, content_hash, pipeline_version, transcribe_backend,
+                                         transcribe_model, priority, owner, folder_id, share_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (audio_path, original_filename, content_hash, version, backend, model_name,
+          priority, owner, folder_id, share_key_for(owner, folder_id)))
+    job_id = cursor.lastrowid
+    db.commit()
+    db.close()
+
+    notify_queue_workers()
+    return {'job_id': job_id}
+
 @app.route('/transcribe', methods=['POST'])
 def transcribe_audio():
     if 'audio' not in request.files:
         return jsonify({'error': 'No audio file found'}), 400
 
+    model_name = resolve_transcribe_model(request.form.get('model'))
+    if model_name is None:
+        return jsonify({'error': 'Unsupported transcription model', 'models': TRANSCRIBE_MODEL_CHOICES}), 400
+    priority = resolve_priority(request.form.get('priority'))
+    if priority is None:
+        return jsonify({'error': 'Unsupported priority', 'priorities': list(PRIORITY_LEVELS)}), 400
+
     audio_file = request.files['audio']
     _, file_extension = os.path.splitext(audio_file.filename)
     safe_filename = str(uuid.uuid4()) + (file_extension or '.tmp')
     audio_path = os.path.join(UPLOAD_FOLDER, safe_filename)
-    audio_file.save(audio_path)
+    content_hash = save_and_hash_stream(audio_file.stream, audio_path)
+
+    return jsonify(enqueue_audio(audio_path, audio_file.filename or "recording", content_hash, model_name,
+                                 priority, request_owner(), request.form.get('folder_id', type=int)))
+
+# --- Resumable Chunked Uploads ---
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
+def expire_stale_uploads():
+    """Removes unfinished uploads that have not received data for UPLOAD_EXPIRY_SECONDS."""
     db = get_db()
-    cursor = db.cursor()
-    cursor.execute(
-        "INSERT INTO transcription_queue (audio_path, original_filename) VALUES (?, ?)",
-        (audio_path, audio_file.filename or "recording")
-    )
-    job_id = cursor.lastrowid
+    stale = db.execute(
+        "SELECT id, file_path FROM uploads WHERE status IN ('uploading', 'finalizing') AND updated_at < datetime('now', ?)",
+        (f"-{UPLOAD_EXPIRY_SECONDS} seconds",)
+    ).fetchall()
+    for row in stale:
+        # A finalize that died midway may have left the file renamed without its .part suffix.
+        for path in (row['file_path'], row['file_path'][:-len('.part')]):
+            if os.path.exists(path):
+                os.remove(path)
+        db.execute("DELETE FROM uploads WHERE id = ?", (row['id'],))
     db.commit()
     db.close()
 
-    new_job_event.set()
-    return jsonify({'job_id': job_id})
+def finalize_upload(upload_id):
+    """
+    Hashes a fully received upload and hands it to the queue. Safe to call more than
+    once: only the first caller enqueues, later callers get the stored result.
+    """
+    db = get_db()
+    row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    if row is None:
+        db.close()
+        return None
+    if row['status'] == 'complete':
+        db.close()
+        return json.loads(row['result'])
+    claimed = db.execute(
+        "UPDATE uploads SET status = 'finalizing', updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'uploading' AND received_size = total_size",
+        (upload_id,)
+    ).rowcount
+    db.commit()
+    db.close()
+    if not claimed:
+        return None
+
+    part_path = row['file_path']
+    audio_path = part_path[:-len('.part')]
+    try:
+        os.replace(part_path, audio_path)
+        result = enqueue_audio(audio_path, row['original_filename'], _hash_file(audio_path), row['transcribe_model'],
+                               row['priority'], row['owner'], row['folder_id'])
+    except Exception:
+        # Hand the upload back so the client can retry finalizing it (or let it expire).
+        if os.path.exists(audio_path):
+            os.replace(audio_path, part_path)
+        db = get_db()
+        db.execute("UPDATE uploads SET status = 'uploading', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (upload_id,))
+        db.commit()
+        db.close()
+        raise
+
+    db = get_db()
+    db.execute("UPDATE uploads SET status = 'complete', result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+               (json.dumps(result), upload_id))
+    db.commit()
+    db.close()
+    return result
+
+def _upload_state(row):
+    state = {'upload_id': row['id'], 'offset': row['received_size'], 'size': row['total_size'], 'status': row['status']}
+    if row['result']:
+        state.update(json.loads(row['result']))
+    return state
+
+@app.route('/uploads', methods=['POST'])
+def init_upload():
+    """
+    Starts a resumable upload. Expects JSON {filename, size} and optionally a
+    transcription model, a priority (low/normal/high) and a target folder_id.
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or "recording"
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Upload size is required'}), 400
+    if total_size <= 0 or total_size > MAX_UPLOAD_BYTES:
+        return jsonify({'error': 'Upload size is out of range'}), 413
+    model_name = resolve_transcribe_model(data.get('model'))
+    if model_name is None:
+        return jsonify({'error': 'Unsupported transcription model', 'models': TRANSCRIBE_MODEL_CHOICES}), 400
+    priority = resolve_priority(data.get('priority'))
+    if priority is None:
+        return jsonify({'error': 'Unsupported priority', 'priorities': list(PRIORITY_LEVELS)}), 400
+    folder_id = data.get('folder_id')
+    if folder_id is not None and not isinstance(folder_id, int):
+        return jsonify({'error': 'folder_id must be an integer'}), 400
+
+    expire_stale_uploads()
+    upload_id = str(uuid.uuid4())
+    _, file_extension = os.path.splitext(filename)
+    part_path = os.path.join(UPLOAD_FOLDER, upload_id + (file_extension or '.tmp') + '.part')
+    open(part_path, 'wb').close()
+
+    db = get_db()
+    db.execute('''
+        INSERT INTO uploads (id, original_filename, file_path, total_size, transcribe_model, priority, owner, folder_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (upload_id, filename, part_path, total_size, model_name, priority, request_owner(), folder_id))
+    db.commit()
+    db.close()
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'size': total_size, 'chunk_size': UPLOAD_CHUNK_BYTES}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Reports how many bytes the server holds, so an interrupted client knows where to resume."""
+    db = get_db()
+    row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    db.close()
+    if row is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_upload_state(row))
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def append_upload_chunk(upload_id):
+    """
+    Appends the raw request body at ?offset=N. The offset must match the bytes already
+    received; a mismatch returns 409 with the server's offset. The job is enqueued as
+    soon as the final chunk lands.
+    """
+    offset = request.args.get('offset', type=int)
+    db = get_db()
+    row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    db.close()
+    if row is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    if row['status'] != 'uploading' or offset != row['received_size']:
+        return jsonify(_upload_state(row)), 409
+
+    remaining = row['total_size'] - offset
+    if request.content_length is not None and request.content_length > min(remaining, MAX_UPLOAD_CHUNK_BYTES):
+        return jsonify({'error': 'Chunk is larger than the remaining upload'}), 413
+
+    # Stream the body to disk in small reads so memory stays bounded regardless of chunk size.
+    written = 0
+    with open(row['file_path'], 'r+b') as f:
+        f.seek(offset)
+        while written < remaining:
+            data = request.stream.read(min(HASH_CHUNK_BYTES, remaining - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+        f.truncate(offset + written)
+
+    db = get_db()
+    updated = db.execute(
+        "UPDATE uploads SET received_size = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND received_size = ? AND status = 'uploading'",
+        (offset + written, upload_id, offset)
+    ).rowcount
+    db.commit()
+    row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    db.close()
+    if not updated:
+        return jsonify(_upload_state(row)), 409
+
+    if row['received_size'] == row['total_size']:
+        finalize_upload(upload_id)
+        db = get_db()
+        row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+        db.close()
+    return jsonify(_upload_state(row))
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload_route(upload_id):
+    """Explicitly finalizes an upload, e.g. when the response to the last chunk was lost."""
+    result = finalize_upload(upload_id)
+    if result is not None:
+        return jsonify(result)
+    db = get_db()
+    row = db.execute("SELECT * FROM uploads WHERE id = ?", (upload_id,)).fetchone()
+    db.close()
+    if row is None:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_upload_state(row)), 409
 
 @app.route('/status/<int:job_id>')
 def get_status(job_id):
     db = get_db()
-    job = db.execute("SELECT status, transcript_id, error_message FROM transcription_queue WHERE id = ?", (job_id,)).fetchone()
+    job = db.execute(JOB_STATUS_QUERY, (job_id,)).fetchone()
     db.close()
     if job is None:
         return jsonify({'status': 'completed'})
     return jsonify(dict(job))
 
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_queued_job(job_id):
+    """Cancels an upload that has not been transcribed yet; a running worker stops at its next chunk."""
+    db = get_db()
+    job_row = db.execute("SELECT transcript_id FROM transcription_queue WHERE id = ?", (job_id,)).fetchone()
+    if job_row is not None and job_row['transcript_id']:
+        db.close()
+        return jsonify({'error': 'The transcript is already saved'}), 409
+    job_row = cancel_job(db, job_id)
+    db.commit()
+    db.close()
+    if job_row is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job_row['status'] not in ACTIVE_STATUSES:
+        discard_job_files(job_row)
+    return jsonify({'success': True})
+
+@app.route('/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_failed_job(job_id):
+    """Queues a failed job again from the stage it failed in."""
+    db = get_db()
+    job_row = db.execute("SELECT * FROM transcription_queue WHERE id = ? AND status = 'failed'", (job_id,)).fetchone()
+    if job_row is None:
+        db.close()
+        return jsonify({'error': 'No failed job with this id'}), 404
+    if not job_row['transcript_id'] and not any(path and os.path.exists(path) for path in (job_row['prepared_path'], job_row['audio_path'])):
+        db.close()
+        return jsonify({'error': 'The uploaded file is no longer available'}), 409
+    stage = retry_job(db, job_id)
+    db.commit()
+    db.close()
+    notify_stage_workers(stage)
+    return jsonify({'success': True, 'stage': stage})
+
+_history_cache = {'version': None, 'body': None}
+_history_cache_lock = threading.Lock()
+
+def build_history_tree(folders, transcripts):
+    """Groups transcripts under their folders in a single pass; sessions without a known folder are unfiled."""
+    folder_data = [{**dict(folder), 'transcripts': []} for folder in folders]
+    folders_by_id = {folder['id']: folder for folder in folder_data}
+    unfiled_transcripts = []
+    for transcript in transcripts:
+        folder = folders_by_id.get(transcript['folder_id'])
+        (folder['transcripts'] if folder else unfiled_transcripts).append(dict(transcript))
+    return {'folders': folder_data, 'unfiled': unfiled_transcripts}
+
 @app.route('/history')
 def get_history():
+    """
+    Serves the folder/session tree from a cache keyed on the data version, which
+    every route that changes the tree bumps. The version doubles as the ETag, so
+    an unchanged tree costs the client a 304.
+    """
     db = get_db()
-    folders = db.execute("SELECT id, name FROM folders ORDER BY created_at DESC").fetchall()
-    transcripts = db.execute("SELECT id, filename, created_at, folder_id FROM transcripts ORDER BY created_at DESC").fetchall()
+    version = get_data_version(db)
+    with _history_cache_lock:
+        body = _history_cache['body'] if _history_cache['version'] == version else None
+
+    if body is None:
+        # Read the version and the tree in one snapshot so they always match.
+        db.execute("BEGIN")
+        version = get_data_version(db)
+        folders = db.execute(HISTORY_FOLDERS_QUERY).fetchall()
+        transcripts = db.execute(HISTORY_TRANSCRIPTS_QUERY).fetchall()
+        db.rollback()
+        body = json.dumps(build_history_tree(folders, transcripts))
+        with _history_cache_lock:
+            _history_cache.update(version=version, body=body)
     db.close()
 
-    folder_data = []
-    for folder in folders:
-        folder_dict = dict(folder)
-        folder_dict['transcripts'] = [dict(t) for t in transcripts if t['folder_id'] == folder['id']]
-        folder_data.append(folder_dict)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(f"history-{version}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
-    unfiled_transcripts = [dict(t) for t in transcripts if t['folder_id'] is None]
-    return jsonify({'folders': folder_data, 'unfiled': unfiled_transcripts})
+def _highlight_snippet(snippet):
+    """Escapes a search snippet for HTML and turns its match markers into <mark> tags."""
+    start, end = SEARCH_HIGHLIGHT
+    return html.escape(snippet).replace(start, '<mark>').replace(end, '</mark>')
 
-@app.route('/session/<int:transcript_id>')
-def get_session_data(transcript_id):
+@app.route('/search')
+def search():
+    """
+    Full-text search across every session's notes and transcript (?q=<text>&limit=N).
+    Returns ranked hits with highlighted snippets; transcript hits name the page they are on.
+    """
+    query = request.args.get('q', '').strip()[:SEARCH_MAX_QUERY_CHARS]
+    limit = max(1, min(request.args.get('limit', SEARCH_DEFAULT_RESULTS, type=int), SEARCH_MAX_RESULTS))
+    started = time.perf_counter()
     db = get_db()
-    transcript_row = db.execute("SELECT data_path FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
+    hits = search_sessions(db, query, limit)
     db.close()
+    for hit in hits:
+        hit['snippet'] = _highlight_snippet(hit['snippet'])
+    return jsonify({
+        'query': query,
+        'results': hits,
+        'took_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
 
-    if not transcript_row:
+@app.route('/session/<int:transcript_id>')
+def get_session_data(transcript_id):
+    """
+    Returns what is needed to show a session: its notes, the first page of the
+    transcript and the most recent chat messages. Later transcript pages and
+    earlier messages are fetched on demand.
+    """
+    db = get_db()
+    document = load_session_document(db, transcript_id)
+    notes_job = db.execute("SELECT id, status FROM transcription_queue WHERE transcript_id = ?", (transcript_id,)).fetchone()
+    if document is None:
+        db.close()
         return jsonify({'error': 'Session data not found'}), 404
-
-    data_path = transcript_row['data_path']
-    try:
-        with open(os.path.join(data_path, 'transcript.txt'), 'r', encoding='utf-8') as f:
-            transcript_text = f.read()
-        with open(os.path.join(data_path, 'notes.md'), 'r', encoding='utf-8') as f:
-            notes_markdown = f.read()
-        with open(os.path.join(data_path, 'chat_history.json'), 'r', encoding='utf-8') as f:
-            chat_history = json.load(f)
-    except FileNotFoundError:
-        return jsonify({'error': 'Session files not found'}), 404
+    transcript_text = load_transcript_page(db, transcript_id, 0) or ''
+    chat_history, chat_has_more = load_chat_messages(db, transcript_id, CHAT_PAGE_SIZE)
+    db.close()
 
     session['current_transcript_id'] = transcript_id
-    session['current_data_path'] = data_path
-    
+
     return jsonify({
         'transcript_text': transcript_text,
-        'notes_markdown': notes_markdown,
-        'chat_history': chat_history
+        'transcript_pages': document['transcript_pages'],
+        'notes_markdown': document['notes_markdown'],
+        'notes_status': ('failed' if notes_job['status'] == 'failed' else 'pending') if notes_job else 'ready',
+        'notes_job_id': notes_job['id'] if notes_job else None,
+        'chat_history': chat_history,
+        'chat_has_more': chat_has_more
     })
-    
+
+@app.route('/session/<int:transcript_id>/transcript')
+def get_transcript_page(transcript_id):
+    """Returns one page (?page=N, from 0) of a session's transcript."""
+    page = request.args.get('page', 0, type=int)
+    db = get_db()
+    document = load_session_document(db, transcript_id)
+    text = load_transcript_page(db, transcript_id, page) if document else None
+    db.close()
+    if text is None:
+        return jsonify({'error': 'Transcript page not found'}), 404
+    return jsonify({'page': page, 'pages': document['transcript_pages'], 'text': text})
+
+@app.route('/session/<int:transcript_id>/chat')
+def get_chat_page(transcript_id):
+    """Returns the chat messages before ?before=<message id>, oldest first."""
+    before_id = request.args.get('before', type=int)
+    db = get_db()
+    messages, has_more = load_chat_messages(db, transcript_id, CHAT_PAGE_SIZE, before_id)
+    db.close()
+    return jsonify({'messages': messages, 'has_more': has_more})
+
+@app.route('/session/<int:transcript_id>/segments')
+def get_transcript_segments(transcript_id):
+    """
+    Returns the timestamped transcript segments between ?start= and ?end= (seconds,
+    default: the whole recording), at most ?limit= of them. If the range holds more,
+    next_start is where the next request should continue.
+    """
+    start = max(0.0, request.args.get('start', 0.0, type=float))
+    end = request.args.get('end', float('inf'), type=float)
+    limit = max(1, min(request.args.get('limit', SEGMENT_PAGE_SIZE, type=int), SEGMENT_MAX_PAGE_SIZE))
+    db = get_db()
+    if load_session_document(db, transcript_id) is None:
+        db.close()
+        return jsonify({'error': 'Session data not found'}), 404
+    result = load_segments(db, transcript_id, start, min(end, SEGMENT_MAX_SECONDS), limit)
+    db.close()
+    if result is None:
+        return jsonify({'error': 'This session has no timestamps; it was transcribed before they were stored.'}), 404
+    return jsonify(result)
+
+def _load_chat_context(transcript_id, question):
+    """
+    Returns what the chat prompt needs: the session's notes (whole, when they fit in
+    CHAT_NOTES_PREFIX_TOKENS), the passages relevant to the question, the chat history
+    and the answer cache key. Raises LookupError if the session does not exist.
+    """
+    db = get_db()
+    document = load_session_document(db, transcript_id)
+    if document is None:
+        db.close()
+        raise LookupError(transcript_id)
+    chat_history = load_chat_context_messages(db, transcript_id, CHAT_HISTORY_WINDOW, CHAT_HISTORY_SUMMARY_QUESTIONS)
+    db.close()
+
+    def load_documents():
+        db = get_db()
+        try:
+            segment_index = load_segment_index(db, transcript_id)
+            timestamps = (list(segment_index['offsets']), [ms / 1000 for ms in segment_index['starts_ms']]) if segment_index else None
+            return document['notes_markdown'], load_transcript(db, transcript_id), timestamps
+        finally:
+            db.close()
+
+    index = retrieval.get_session_index(transcript_id, document['revision'], load_documents)
+    notes = document['notes_markdown'] or ''
+    if estimate_tokens(notes) <= CHAT_NOTES_PREFIX_TOKENS:
+        # The notes are already in the prompt; only search the transcript.
+        excerpts = index.search(question, CHAT_TOP_K_PASSAGES, sources=('transcript',))
+    else:
+        notes = "(The notes are too long to include in full; the relevant parts are among the excerpts below.)"
+        excerpts = index.search(question, CHAT_TOP_K_PASSAGES)
+    return {
+        'notes': notes,
+        'excerpts': retrieval.format_passages(excerpts),
+        'history': chat_history,
+        'cache_key': answer_cache.key(transcript_id, document['revision'], question),
+    }
+
+def _append_chat_exchange(transcript_id, user_message, ai_response):
+    """Appends a question and its answer to the session's chat history."""
+    db = get_db()
+    append_chat_message(db, transcript_id, 'user', user_message)
+    append_chat_message(db, transcript_id, 'ai', ai_response)
+    db.commit()
+    db.close()
+
 @app.route('/chat', methods=['POST'])
 def chat():
     user_message = request.json.get('message')
     transcript_id = session.get('current_transcript_id')
-    data_path = session.get('current_data_path')
 
-    if not user_message or not transcript_id or not data_path:
+    if not user_message or not transcript_id:
         return jsonify({'error': 'Missing message or session context'}), 400
 
     try:
-        with open(os.path.join(data_path, 'notes.md'), 'r', encoding='utf-8') as f:
-            notes_context = f.read()
-        with open(os.path.join(data_path, 'chat_history.json'), 'r', encoding='utf-8') as f:
-            chat_history = json.load(f)
-    except FileNotFoundError:
+        context = _load_chat_context(transcript_id, user_message)
+    except LookupError:
         return jsonify({'error': 'Could not retrieve notes or chat history for context'}), 404
 
-    ai_response = get_chat_response(user_message, notes_context, chat_history)
-    
-    chat_history.append({'sender': 'user', 'message': user_message})
-    chat_history.append({'sender': 'ai', 'message': ai_response})
-
-    with open(os.path.join(data_path, 'chat_history.json'), 'w', encoding='utf-8') as f:
-        json.dump(chat_history, f)
+    ai_response = get_chat_response(user_message, context)
+    _append_chat_exchange(transcript_id, user_message, ai_response)
 
     return jsonify({'response': ai_response})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streams the chat answer as Server-Sent Events: a 'token' event per generated
+    piece of text, then 'done' (or 'error'). The exchange is saved once complete.
+    """
+    user_message = request.json.get('message')
+    transcript_id = session.get('current_transcript_id')
+
+    if not user_message or not transcript_id:
+        return jsonify({'error': 'Missing message or session context'}), 400
+
+    try:
+        context = _load_chat_context(transcript_id, user_message)
+    except LookupError:
+        return jsonify({'error': 'Could not retrieve notes or chat history for context'}), 404
+
+    def generate():
+        parts = []
+        try:
+            for text in stream_chat_response(user_message, context):
+                parts.append(text)
+                yield format_sse('token', {'text': text})
+        except Exception as e:
+            error_message = f"Error connecting to Ollama for chat: {e}"
+            parts.append(f"\n\n{error_message}" if parts else error_message)
+            yield format_sse('error', {'message': error_message})
+        finally:
+            # Runs even if the client disconnects mid-answer, so the partial answer is kept.
+            if parts:
+                _append_chat_exchange(transcript_id, user_message, "".join(parts))
+        yield format_sse('done', {'response': "".join(parts)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/edit/<int:transcript_id>', methods=['POST'])
 def edit_session_name(transcript_id):
     new_name = request.json.get('name')
@@ -402,26 +1639,33 @@ def edit_session_name(transcript_id):
         return jsonify({'error': 'New name not provided'}), 400
     db = get_db()
     db.execute("UPDATE transcripts SET filename = ? WHERE id = ?", (new_name, transcript_id))
+    bump_data_version(db)
     db.commit()
     db.close()
+    broker.publish('history', {})
     return jsonify({'success': True})
 
 @app.route('/delete/<int:transcript_id>', methods=['POST'])
 def delete_session(transcript_id):
     db = get_db()
-    transcript_row = db.execute("SELECT data_path FROM transcripts WHERE id = ?", (transcript_id,)).fetchone()
-    
-    if transcript_row:
+    transcript_row = db.execute(SESSION_PATH_QUERY, (transcript_id,)).fetchone()
+
+    # Sessions migrated from the old file layout still have their folder on disk.
+    if transcript_row and transcript_row['data_path']:
         shutil.rmtree(transcript_row['data_path'], ignore_errors=True)
 
+    delete_session_documents(db, transcript_id)
+    answer_cache.invalidate(transcript_id)
+    db.execute("DELETE FROM audio_cache WHERE transcript_id = ?", (transcript_id,))
     db.execute("DELETE FROM transcripts WHERE id = ?", (transcript_id,))
+    bump_data_version(db)
     db.commit()
     db.close()
     
     if session.get('current_transcript_id') == transcript_id:
         session.pop('current_transcript_id', None)
-        session.pop('current_data_path', None)
         
+    broker.publish('history', {})
     return jsonify({'success': True})
 
 @app.route('/folders', methods=['POST'])
@@ -433,8 +1677,10 @@ def create_folder():
     cursor = db.cursor()
     cursor.execute("INSERT INTO folders (name) VALUES (?)", (folder_name,))
     folder_id = cursor.lastrowid
+    bump_data_version(db)
     db.commit()
     db.close()
+    broker.publish('history', {})
     return jsonify({'success': True, 'folder_id': folder_id})
 
 @app.route('/folders/<int:folder_id>', methods=['DELETE'])
@@ -442,6 +1688,7 @@ def delete_folder(folder_id):
     db = get_db()
     folder_to_delete = db.execute("SELECT name FROM folders WHERE id = ?", (folder_id,)).fetchone()
     if folder_to_delete and folder_to_delete['name'] == 'Unorganized':
+        db.close()
         return jsonify({'error': 'Cannot delete the Unorganized folder.'}), 400
 
     unorganized_folder = db.execute("SELECT id FROM folders WHERE name = 'Unorganized'").fetchone()
@@ -449,8 +1696,10 @@ def delete_folder(folder_id):
 
     db.execute("UPDATE transcripts SET folder_id = ? WHERE folder_id = ?", (unorganized_folder_id, folder_id,))
     db.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
+    bump_data_version(db)
     db.commit()
     db.close()
+    broker.publish('history', {})
     return jsonify({'success': True})
 
 @app.route('/transcripts/<int:transcript_id>/move', methods=['POST'])
@@ -459,27 +1708,133 @@ def move_transcript(transcript_id):
     folder_id = folder_id if folder_id else None
     db = get_db()
     db.execute("UPDATE transcripts SET folder_id = ? WHERE id = ?", (folder_id, transcript_id))
+    bump_data_version(db)
     db.commit()
     db.close()
+    broker.publish('history', {})
     return jsonify({'success': True})
 
+@app.route('/health')
+def health():
+    """Readiness probe: 200 once the database answers and the models are warm, 503 until then."""
+    checks = readiness_checks()
+    ready = all(checks.values())
+    response = jsonify({'status': 'ready' if ready else 'starting', 'checks': checks})
+    response.headers['Cache-Control'] = 'no-store'
+    return response, 200 if ready else 503
+
+@app.route('/llm_status')
+def llm_status():
+    """Per traffic class (notes, chat) call counts, errors, retries, tokens and latency percentiles, and the chat answer cache's hit rate."""
+    return jsonify({**llm.metrics.snapshot(), 'chat_cache': answer_cache.stats()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request latency, pipeline span timings, stage runs, queue depth, model memory and Ollama calls in Prometheus text format."""
+    db = get_db()
+    spans = span_histograms(db, metrics.SPAN_BUCKETS)
+    runs = job_run_counts(db)
+    statuses = queue_status_counts(db)
+    resident_models = load_model_residency(db)
+    db.close()
+    llm_stats = llm.metrics.snapshot()
+
+    lines = metrics.render_histogram('http_request_duration_seconds', 'Flask request latency until the response starts.',
+                                     metrics.REQUEST_BUCKETS, metrics.request_latency.collect())
+    lines += metrics.render_histogram('job_span_seconds', 'Time spent in each part of a pipeline stage run.', metrics.SPAN_BUCKETS,
+                                      [((('stage', stage), ('span', name)), counts, count, total)
+                                       for stage, name, counts, count, total in spans])
+    lines += metrics.render_samples('job_runs_total', 'counter', 'Finished pipeline stage runs by outcome.',
+                                    [((('stage', stage), ('outcome', outcome)), count) for stage, outcome, count in runs])
+    lines += metrics.render_samples('queue_jobs', 'gauge', 'Jobs currently in the queue by status.',
+                                    [((('status', status),), count) for status, count in sorted(statuses.items())])
+    lines += metrics.render_samples('model_resident_bytes', 'gauge', 'Memory held by each loaded transcription model, per worker.',
+                                    [((('worker', m['worker_id']), ('backend', m['backend']), ('model', m['model_name'])),
+                                      int(m['resident_mb'] * 2 ** 20)) for m in resident_models])
+    lines += metrics.render_samples('llm_calls_total', 'counter', 'Ollama calls by traffic class.',
+                                    [((('traffic', traffic),), stats['calls']) for traffic, stats in sorted(llm_stats.items())])
+    lines += metrics.render_samples('llm_errors_total', 'counter', 'Failed Ollama calls by traffic class.',
+                                    [((('traffic', traffic),), stats['errors']) for traffic, stats in sorted(llm_stats.items())])
+    lines += metrics.render_samples('llm_output_tokens_total', 'counter', 'Tokens generated by Ollama by traffic class.',
+                                    [((('traffic', traffic),), stats['output_tokens']) for traffic, stats in sorted(llm_stats.items())])
+    cache_stats = answer_cache.stats()
+    lines += metrics.render_samples('chat_cache_lookups_total', 'counter', 'Chat answer cache lookups by result.',
+                                    [((('result', 'hit'),), cache_stats['hits']), ((('result', 'miss'),), cache_stats['misses'])])
+    lines += metrics.render_samples('chat_cache_entries', 'gauge', 'Answers held by the chat answer cache.', [((), cache_stats['entries'])])
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/models')
+def model_status():
+    """The transcription models each worker has loaded, with their resident memory and idle time."""
+    db = get_db()
+    entries = load_model_residency(db)
+    db.close()
+    now = time.time()
+    for entry in entries:
+        entry['idle_seconds'] = round(now - entry.pop('last_used_at'))
+        entry['loaded_seconds'] = round(now - entry.pop('loaded_at'))
+    return jsonify({
+        'models': entries,
+        'resident_mb': round(sum(entry['resident_mb'] for entry in entries), 1),
+        'memory_budget_mb': transcription.MODEL_MEMORY_BUDGET_MB or None,
+        'idle_unload_seconds': transcription.MODEL_IDLE_SECONDS or None,
+    })
+
+@app.route('/jobs/<int:job_id>/timings')
+def job_timings(job_id):
+    """Every stage run of a job with the time spent in each of its spans."""
+    db = get_db()
+    runs = job_spans(db, job_id)
+    db.close()
+    if not runs:
+        return jsonify({'error': 'No recorded runs for this job'}), 404
+    return jsonify({'job_id': job_id, 'runs': runs})
+
 @app.route('/queue_status')
 def queue_status():
+    """Returns the queue summary, every job in scheduling order with its position and ETA, and recent throughput."""
     db = get_db()
-    processing_row = db.execute("SELECT original_filename FROM transcription_queue WHERE status = 'processing' LIMIT 1").fetchone()
-    queued_count_row = db.execute("SELECT COUNT(*) FROM transcription_queue WHERE status = 'queued'").fetchone()
+    jobs, summary = _queue_snapshot(db)
+    throughput = get_stage_throughput(db)
     db.close()
+    ordered = sorted(jobs.values(), key=lambda j: (j.get('position') is None, j.get('position') or 0, j.get('eta_seconds', 0)))
+    return jsonify({**summary, 'worker_count': len(queue_worker_processes), 'jobs': ordered, 'throughput': throughput})
 
-    processing_file = processing_row['original_filename'] if processing_row else None
-    queued_count = queued_count_row[0] if queued_count_row else 0
-    return jsonify({'processing_file': processing_file, 'queued_count': queued_count})
+@app.route('/events')
+def event_stream():
+    """
+    Server-Sent Events stream of 'job', 'queue' and 'history' events.
+    Each connection starts with a snapshot of the whole queue, so a reconnecting
+    client catches up on anything it missed.
+    """
+    ensure_queue_monitor()
+    subscriber = broker.subscribe()
+    db = get_db()
+    jobs, summary = _queue_snapshot(db)
+    db.close()
+
+    def generate():
+        try:
+            yield format_sse_retry()
+            yield format_sse('queue', summary)
+            for job in jobs.values():
+                yield format_sse('job', job)
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event, data = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield format_sse_comment('keepalive')
+                    continue
+                yield format_sse(event, data)
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
-    from database import init_db
-    init_db()
-    queue_processor_thread = threading.Thread(target=queue_processor, daemon=True)
-    queue_processor_thread.start()
-    new_job_event.set()
+    create_app()
     # Corrected line: Use the variables, not strings
     cert_file = "jjawandas-pc.tailb4094d.ts.net.crt"
     key_file = "jjawandas-pc.tailb4094d.ts.net.key"
@@ -0,0 +1,203 @@
+"""
+batch_import.py
+
+Command-line bulk import of recordings into the LectureScribe transcription queue.
+
+Backfilling a semester through the browser means uploading files one at a time. This script instead:
+
+- Scans a directory tree for audio and video files.
+- Maps the directory structure to folders: each sub-directory becomes a folder named after its path ("Fall 2026 / CS101"), files at the top level go to a folder named after the root directory. Existing folders of the same name are reused.
+- Skips files whose content was already processed by the current pipeline, is already waiting in the queue, or appears twice in the tree, using the same content hashes as /transcribe.
+- Enqueues all remaining files in a single transaction, at low priority by default so interactive uploads are not held up.
+- Optionally (--run) starts the pipeline workers headless and waits until the batch has drained, reporting progress and throughput.
+
+Without --run, a LectureScribe server using the same database picks the jobs up within a few seconds.
+
+Usage (from the scripts directory):
+    python batch_import.py /path/to/recordings [--run] [--priority low|normal|high] [--model NAME] [--dry-run]
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import os
+import sys
+import json
+import uuid
+import time
+import shutil
+import argparse
+
+import app
+from database import init_db, find_cached_transcript, find_queued_duplicate, share_key_for, bump_data_version
+
+# --- Configuration ---
+MEDIA_EXTENSIONS = {
+    '.wav', '.mp3', '.m4a', '.aac', '.ogg', '.oga', '.opus', '.flac', '.wma', '.webm',
+    '.mp4', '.m4v', '.mov', '.mkv', '.avi', '.wmv',
+}
+PROGRESS_SECONDS = 10           # How often --run prints the state of the batch
+FOLDER_SEPARATOR = ' / '
+
+# --- Scanning ---
+def find_media_files(root):
+    """Returns (path, folder name) for every audio or video file under root, in a stable order."""
+    root = os.path.abspath(root)
+    root_name = os.path.basename(root) or root
+    found = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories[:] = sorted(d for d in subdirectories if not d.startswith('.'))
+        relative = os.path.relpath(directory, root)
+        folder_name = root_name if relative == '.' else FOLDER_SEPARATOR.join(relative.split(os.sep))
+        for filename in sorted(filenames):
+            if os.path.splitext(filename)[1].lower() in MEDIA_EXTENSIONS and not filename.startswith('.'):
+                found.append((os.path.join(directory, filename), folder_name))
+    return found
+
+def folder_ids_by_name(conn, names):
+    """Returns {name: folder id}, creating missing folders. Does not commit."""
+    ids = {}
+    for name in sorted(names):
+        row = conn.execute("SELECT id FROM folders WHERE name = ? ORDER BY id LIMIT 1", (name,)).fetchone()
+        if row is None:
+            ids[name] = conn.execute("INSERT INTO folders (name) VALUES (?)", (name,)).lastrowid
+        else:
+            ids[name] = row['id']
+    return ids
+
+# --- Import ---
+def import_tree(root, priority, model_name, dry_run=False):
+    """
+    Enqueues every new recording under root. Returns the ids of the queued jobs.
+    Files are hashed in place and only new ones are copied into the upload folder;
+    the queue rows are then written in one transaction, re-checking for duplicates
+    so an upload arriving meanwhile through the web interface is not queued twice.
+    """
+    backend = app.transcription.TRANSCRIBE_BACKEND
+    version = app.pipeline_version(backend, model_name)
+    files = find_media_files(root)
+    print(f"Found {len(files)} audio/video file(s) under {root}.")
+
+    candidates, seen, skipped = [], set(), 0
+    db = app.get_db()
+    for index, (path, folder_name) in enumerate(files, 1):
+        content_hash = app._hash_file(path)
+        if content_hash in seen or find_cached_transcript(db, content_hash, version) \
+                or find_queued_duplicate(db, content_hash, version):
+            skipped += 1
+        else:
+            seen.add(content_hash)
+            candidates.append((path, folder_name, content_hash))
+        if index % 50 == 0:
+            print(f"  Hashed {index}/{len(files)} file(s)...")
+    db.close()
+    print(f"{len(candidates)} new recording(s), {skipped} already processed, queued or duplicated.")
+    if dry_run or not candidates:
+        for path, folder_name, _ in candidates:
+            print(f"  would queue {path} -> '{folder_name}'")
+        return []
+
+    # Copy outside the transaction so the server is not locked out for the duration.
+    os.makedirs(app.UPLOAD_FOLDER, exist_ok=True)
+    staged = []
+    for path, folder_name, content_hash in candidates:
+        audio_path = os.path.join(app.UPLOAD_FOLDER, str(uuid.uuid4()) + (os.path.splitext(path)[1] or '.tmp'))
+        shutil.copyfile(path, audio_path)
+        staged.append((audio_path, os.path.basename(path), folder_name, content_hash))
+
+    job_ids, discarded = [], []
+    db = app.get_db()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        folder_ids = folder_ids_by_name(db, {folder_name for _, _, folder_name, _ in staged})
+        for audio_path, original_filename, folder_name, content_hash in staged:
+            if find_cached_transcript(db, content_hash, version) or find_queued_duplicate(db, content_hash, version):
+                discarded.append(audio_path)
+                continue
+            folder_id = folder_ids[folder_name]
+            job_ids.append(db.execute('''
+                INSERT INTO transcription_queue (audio_path, original_filename, content_hash, pipeline_version, transcribe_backend,
+                                                 transcribe_model, priority, owner, folder_id, share_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (audio_path, original_filename, content_hash, version, backend, model_name,
+                  priority, None, folder_id, share_key_for(None, folder_id))).lastrowid)
+        bump_data_version(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        discarded = [audio_path for audio_path, _, _, _ in staged]
+        raise
+    finally:
+        db.close()
+        for audio_path in discarded:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+
+    print(f"Queued {len(job_ids)} job(s) in {len(folder_ids)} folder(s).")
+    return job_ids
+
+# --- Headless Run ---
+def batch_progress(conn, job_ids):
+    """Returns (jobs still in the pipeline, failed jobs, finished jobs, seconds of audio finished) for the batch."""
+    batch = json.dumps(job_ids)     # One parameter, however large the batch
+    statuses = [row['status'] for row in conn.execute(
+        "SELECT status FROM transcription_queue WHERE id IN (SELECT value FROM json_each(?))", (batch,))]
+    failed = statuses.count('failed')
+    finished = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(audio_duration), 0) FROM job_history
+        WHERE stage = 'notes' AND outcome = 'completed' AND job_id IN (SELECT value FROM json_each(?))
+    ''', (batch,)).fetchone()
+    return len(statuses) - failed, failed, finished[0], finished[1]
+
+def run_until_drained(job_ids):
+    """Runs the pipeline workers in this process until every job of the batch has finished or failed."""
+    app.start_queue_workers()
+    started = time.monotonic()
+    try:
+        while True:
+            time.sleep(PROGRESS_SECONDS)
+            db = app.get_db()
+            pending, failed, finished, audio_seconds = batch_progress(db, job_ids)
+            db.close()
+            elapsed = time.monotonic() - started
+            print(f"[{elapsed / 60:6.1f} min] {finished} finished, {pending} in progress, {failed} failed; "
+                  f"{audio_seconds / 3600:.2f} h of audio at {audio_seconds / elapsed:.1f}x real time")
+            if not pending:
+                break
+    finally:
+        app.stop_queue_workers()
+
+    print(f"\nBatch drained in {elapsed / 60:.1f} minutes: {finished} finished, {failed} failed.")
+    if finished:
+        print(f"Throughput: {finished / (elapsed / 3600):.1f} recordings/hour, "
+              f"{audio_seconds / 3600:.2f} h of audio ({audio_seconds / elapsed:.1f}x real time).")
+    if failed:
+        print("Failed jobs can be retried from the web interface or with POST /jobs/<id>/retry.")
+    return failed == 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help="Directory tree of recordings to import")
+    parser.add_argument('--priority', default='low', choices=list(app.PRIORITY_LEVELS),
+                        help="Queue priority of the imported jobs (default: low)")
+    parser.add_argument('--model', default=None,
+                        help=f"Transcription model (default: {app.transcription.WHISPER_MODEL_NAME})")
+    parser.add_argument('--run', action='store_true', help="Run the workers in this process until the batch drains")
+    parser.add_argument('--dry-run', action='store_true', help="List what would be queued without changing anything")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        sys.exit(f"Not a directory: {args.root}")
+    model_name = app.resolve_transcribe_model(args.model)
+    if model_name is None:
+        sys.exit(f"Unsupported transcription model '{args.model}'; choose from {', '.join(app.TRANSCRIBE_MODEL_CHOICES)}")
+
+    init_db()
+    job_ids = import_tree(args.root, app.PRIORITY_LEVELS[args.priority], model_name, args.dry_run)
+    if args.run and job_ids:
+        sys.exit(0 if run_until_drained(job_ids) else 1)
+
+if __name__ == '__main__':
+    main()
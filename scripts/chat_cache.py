@@ -0,0 +1,89 @@
+"""
+chat_cache.py
+
+Answer cache for the LectureScribe chat assistant.
+
+Students of the same course ask the same questions about the same lecture, and each answer costs a full Ollama generation. This module provides:
+
+- Normalization of questions, so differences in case, punctuation and spacing do not defeat the cache.
+- A thread-safe LRU cache of answers with a time-to-live, keyed by session, session revision and normalized question.
+- Hit, miss and eviction counters with the resulting hit rate, for /llm_status and /metrics.
+
+A session's revision changes whenever its notes or transcript change, so answers based on old notes are never served.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+# --- Configuration ---
+CACHE_SIZE = int(os.environ.get('LECTURESCRIBE_CHAT_CACHE_SIZE', '512'))         # Answers kept; 0 disables the cache
+CACHE_TTL_SECONDS = int(os.environ.get('LECTURESCRIBE_CHAT_CACHE_TTL', '86400'))
+MIN_QUESTION_WORDS = 4          # Shorter questions ("why?", "tell me more") depend on the conversation, so are not cached
+
+def normalize_question(question):
+    """Lower-cases the question and reduces it to its words."""
+    return " ".join(re.findall(r"\w+", question.lower()))
+
+class AnswerCache:
+    """An LRU cache of chat answers whose entries expire after ttl_seconds."""
+
+    def __init__(self, size=CACHE_SIZE, ttl_seconds=CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> (stored_at, answer)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expirations': 0}
+
+    def key(self, session_id, revision, question):
+        """Returns the cache key for a question, or None if the question should not be cached."""
+        normalized = normalize_question(question)
+        if not self.size or len(normalized.split()) < MIN_QUESTION_WORDS:
+            return None
+        return (session_id, revision, normalized)
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, answer):
+        if key is None or not answer:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            self._stats['stores'] += 1
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, session_id):
+        """Drops every answer of a session, e.g. when it is deleted."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == session_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {**self._stats, 'entries': len(self._entries), 'size': self.size,
+                    'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else None}
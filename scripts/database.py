@@ -6,8 +6,21 @@ Database management module for the LectureScribe application.
 This module handles all database operations for LectureScribe, including:
 
 - Initialization and schema creation for folders, transcripts, and the transcription queue.
-- Secure storage and retrieval of transcript data paths.
+- Storage of each session's transcript (in pages, for lazy loading), notes and individually appended chat messages.
+- Compact columnar storage of transcript segment timing, with lookup of the transcript text for any time range.
+- An FTS5 full-text index over notes and transcripts, maintained by triggers, with ranked, snippeted search.
+- A one-shot migration of sessions stored as loose files under data/ into the database.
 - A persistent queue for managing transcription jobs.
+- Atomic, lease-based job claiming so several workers per pipeline stage can share the queue safely.
+- Priority levels, fair sharing between owners and folders, and shortest-job-first ordering within each share.
+- A history of finished stage runs, for throughput and ETA estimates, with the timing spans of each run.
+- Running totals of stage runs and span timings, updated as runs finish, and queue state counts for the /metrics endpoint; old history is pruned after a retention period.
+- A registry of the transcription models each worker process has loaded, with their memory use.
+- Delayed retries, failure and cancellation of jobs, and per-chunk transcription checkpoints.
+- A thread-safe connection pool over a WAL-mode database, with tuned pragmas, reusable hot-path queries and supporting indexes.
+- A data version counter that changes whenever the folder/session tree changes, for cheap cache validation.
+- A cache of finished sessions keyed by audio content hash and pipeline version, so duplicate uploads are never processed twice.
+- Bookkeeping for resumable chunked uploads.
 - Support for session management and data integrity.
 
 The design ensures robust error handling, extensibility, and secure access to user data. It is intended for use in secure, internal deployments.
@@ -20,10 +33,19 @@ Status: Production
 
 import sqlite3
 import os
+import re
+import sys
+import json
+import bisect
+import queue
+import threading
+from array import array
 from pathlib import Path
 
-DATABASE_FILE = '../data/lecturescribe.db'
-DATA_FOLDER = '../data'
+from metrics import SPAN_BUCKETS
+
+DATA_FOLDER = os.environ.get('LECTURESCRIBE_DATA_DIR', '../data')
+DATABASE_FILE = os.path.join(DATA_FOLDER, 'lecturescribe.db')
 
 db_path = Path(DATABASE_FILE)
 data_path = Path(DATA_FOLDER)
@@ -33,13 +55,138 @@ data_path.mkdir(parents=True, exist_ok=True)
 
 print(f"Directory '{db_path.parent}' is ready.")
 
-def init_db():
+# --- Connection Settings ---
+POOL_SIZE = int(os.environ.get('LECTURESCRIBE_DB_POOL_SIZE', '16'))
+BUSY_TIMEOUT_SECONDS = 5
+CACHED_STATEMENTS = 256         # Compiled statements kept per connection, so repeated queries skip the parser
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",      # Safe with WAL; commits no longer wait for a full fsync
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_SECONDS * 1000}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",       # 16 MB page cache per connection
+    "PRAGMA mmap_size = 134217728",     # 128 MB memory-mapped reads
+)
+
+# --- Session Document Settings ---
+TRANSCRIPT_PAGE_CHARS = 20000   # Transcripts are stored and served in pages of about this size
+
+# --- Reusable Queries ---
+# Hot-path statements are defined once so every caller sends identical SQL and
+# hits each pooled connection's compiled-statement cache.
+JOB_STATUS_QUERY = "SELECT status, transcript_id, error_message, progress, attempts FROM transcription_queue WHERE id = ?"
+QUEUE_SNAPSHOT_QUERY = "SELECT id, status, progress, transcript_id, error_message, original_filename, priority, audio_duration, attempts FROM transcription_queue ORDER BY created_at ASC, id ASC"
+HISTORY_FOLDERS_QUERY = "SELECT id, name FROM folders ORDER BY created_at DESC"
+HISTORY_TRANSCRIPTS_QUERY = "SELECT id, filename, created_at, folder_id FROM transcripts ORDER BY created_at DESC"
+SESSION_PATH_QUERY = "SELECT data_path FROM transcripts WHERE id = ?"
+DATA_VERSION_QUERY = "SELECT value FROM app_state WHERE key = 'data_version'"
+
+def connect(database_file=DATABASE_FILE):
+    """Opens a tuned connection that may be shared between threads (one at a time)."""
+    conn = sqlite3.connect(database_file, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# --- Connection Pool ---
+class PooledConnection:
+    """
+    Wraps a pooled connection. close() hands the connection back to the pool
+    instead of closing it, so existing open/close call sites stay unchanged.
+    """
+
+    _conn = None
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # Return the connection even if a caller forgot to close it.
+        self.close()
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of connections to one database file."""
+
+    def __init__(self, database_file=DATABASE_FILE, size=POOL_SIZE):
+        self.database_file = database_file
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()      # Most recently used first, so hot connections stay warm
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=30):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = connect(self.database_file)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get(timeout=timeout)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()     # Never hand out a connection with someone else's uncommitted writes
+        self._idle.put(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_connection():
+    """Returns a connection from this process's pool; call close() to give it back."""
+    global _pool
+    with _pool_lock:
+        # Each worker process gets its own pool; connections must not cross processes.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+    return _pool.acquire()
+
+def _ensure_columns(cursor, table, columns):
+    """
+    Adds any missing columns to an existing table so older databases pick up
+    schema changes without being recreated.
+    """
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def init_db(database_file=DATABASE_FILE):
     """
     Initializes the SQLite database and creates the necessary tables
     if they do not already exist.
     """
+    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_FILE)
+        conn = sqlite3.connect(database_file)
+        # WAL lets readers proceed while a worker writes; the setting is stored in the database file.
+        conn.execute("PRAGMA journal_mode = WAL")
         cursor = conn.cursor()
 
         # Table for folders
@@ -72,15 +219,247 @@ def init_db():
                 status TEXT NOT NULL DEFAULT 'queued',
                 transcript_id INTEGER,
                 error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                worker_id TEXT,
+                claimed_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                progress REAL NOT NULL DEFAULT 0,
+                content_hash TEXT,
+                pipeline_version TEXT,
+                prepared_path TEXT,
+                speech_timeline TEXT,
+                audio_duration REAL,
+                transcribe_backend TEXT,
+                transcribe_model TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                folder_id INTEGER,
+                share_key TEXT NOT NULL DEFAULT '',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP,
+                failed_stage TEXT,
+                ended_at TIMESTAMP
+            )
+        ''')
+        _ensure_columns(cursor, 'transcription_queue', [
+            ('worker_id', 'TEXT'),
+            ('claimed_at', 'TIMESTAMP'),
+            ('heartbeat_at', 'TIMESTAMP'),
+            ('progress', 'REAL NOT NULL DEFAULT 0'),
+            ('content_hash', 'TEXT'),
+            ('pipeline_version', 'TEXT'),
+            ('prepared_path', 'TEXT'),
+            ('speech_timeline', 'TEXT'),
+            ('audio_duration', 'REAL'),
+            ('transcribe_backend', 'TEXT'),
+            ('transcribe_model', 'TEXT'),
+            ('priority', 'INTEGER NOT NULL DEFAULT 0'),
+            ('owner', 'TEXT'),
+            ('folder_id', 'INTEGER'),
+            ('share_key', "TEXT NOT NULL DEFAULT ''"),
+            ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+            ('next_attempt_at', 'TIMESTAMP'),
+            ('failed_stage', 'TEXT'),
+            ('ended_at', 'TIMESTAMP'),
+        ])
+
+        # Transcribed chunks of jobs in progress, so an interrupted job resumes where it stopped
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_checkpoints (
+                job_id INTEGER NOT NULL,
+                core_start INTEGER NOT NULL,
+                core_end INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, core_start, core_end)
+            ) WITHOUT ROWID
+        ''')
+
+        # Scheduler state: when each fair-share group last had a job claimed, per stage
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS queue_shares (
+                stage TEXT NOT NULL,
+                share_key TEXT NOT NULL,
+                last_claim INTEGER NOT NULL,
+                PRIMARY KEY (stage, share_key)
+            ) WITHOUT ROWID
+        ''')
+
+        # One row per finished stage run, for throughput and ETA estimates
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                share_key TEXT NOT NULL DEFAULT '',
+                priority INTEGER NOT NULL DEFAULT 0,
+                audio_duration REAL,
+                transcribe_model TEXT,
+                seconds REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Transcription models currently loaded by each worker process, for reporting
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS model_residency (
+                worker_id TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                processes INTEGER NOT NULL,
+                resident_mb REAL NOT NULL,
+                measured INTEGER NOT NULL DEFAULT 0,
+                loaded_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (worker_id, backend, model_name)
+            ) WITHOUT ROWID
+        ''')
+
+        # Where the time of each stage run went (decode, transcription, database writes, ...)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_spans (
+                history_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                PRIMARY KEY (history_id, name)
+            ) WITHOUT ROWID
+        ''')
+
+        # Running totals of stage runs and span timings, so /metrics does not re-aggregate
+        # the whole history. le is the upper bound of the histogram bucket a timing fell in.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_run_totals (
+                stage TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                runs INTEGER NOT NULL,
+                PRIMARY KEY (stage, outcome)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS job_span_totals (
+                stage TEXT NOT NULL,
+                name TEXT NOT NULL,
+                le REAL NOT NULL,
+                runs INTEGER NOT NULL,
+                seconds REAL NOT NULL,
+                PRIMARY KEY (stage, name, le)
+            ) WITHOUT ROWID
+        ''')
+
+        # Resumable uploads: bytes received so far and, once finalized, the enqueue result
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                id TEXT PRIMARY KEY,
+                original_filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                total_size INTEGER NOT NULL,
+                received_size INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'uploading',
+                result TEXT,
+                transcribe_model TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                folder_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        _ensure_columns(cursor, 'uploads', [
+            ('transcribe_model', 'TEXT'),
+            ('priority', 'INTEGER NOT NULL DEFAULT 0'),
+            ('owner', 'TEXT'),
+            ('folder_id', 'INTEGER'),
+        ])
+
+        # Finished sessions by audio content, for resolving duplicate uploads
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS audio_cache (
+                content_hash TEXT NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                transcript_id INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, pipeline_version),
+                FOREIGN KEY (transcript_id) REFERENCES transcripts (id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Session documents: notes plus transcript metadata; revision changes whenever either does
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS session_documents (
+                transcript_id INTEGER PRIMARY KEY,
+                notes_markdown TEXT NOT NULL DEFAULT '',
+                transcript_pages INTEGER NOT NULL DEFAULT 0,
+                transcript_chars INTEGER NOT NULL DEFAULT 0,
+                revision INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (transcript_id) REFERENCES transcripts (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transcript_pages (
+                transcript_id INTEGER NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (transcript_id, page),
+                FOREIGN KEY (transcript_id) REFERENCES transcripts (id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS transcript_segments (
+                transcript_id INTEGER PRIMARY KEY,
+                segment_count INTEGER NOT NULL,
+                starts_ms BLOB NOT NULL,
+                ends_ms BLOB NOT NULL,
+                text_offsets BLOB NOT NULL,
+                page_offsets BLOB NOT NULL,
+                FOREIGN KEY (transcript_id) REFERENCES transcripts (id) ON DELETE CASCADE
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transcript_id INTEGER NOT NULL,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (transcript_id) REFERENCES transcripts (id) ON DELETE CASCADE
             )
         ''')
 
+        # Full-text search over notes and transcript pages, kept current by triggers
+        create_search_index(cursor)
+
+        # Key/value table for application-wide counters
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS app_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES ('data_version', 0)")
+
+        # Indexes for the queue workers' claims, the history tree and session lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_queue_status_created ON transcription_queue (status, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_queue_worker ON transcription_queue (worker_id, status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_queue_transcript ON transcription_queue (transcript_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_folder_created ON transcripts (folder_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_created ON transcripts (created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_queue_content_hash ON transcription_queue (content_hash, pipeline_version)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_audio_cache_transcript ON audio_cache (transcript_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_uploads_status_updated ON uploads (status, updated_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_transcript ON chat_messages (transcript_id, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_queue_status_share ON transcription_queue (status, share_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_history_stage ON job_history (stage, outcome, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_job_history_finished ON job_history (finished_at)")
+
         # Add a default folder if it doesn't exist
         cursor.execute("SELECT id FROM folders WHERE name = ?", ('Unorganized',))
         if cursor.fetchone() is None:
             cursor.execute("INSERT INTO folders (name) VALUES (?)", ('Unorganized',))
 
+        migrate_session_folders(conn)
+        backfill_run_totals(conn)
         conn.commit()
         print("Database and tables verified successfully.")
 
@@ -90,6 +469,720 @@ def init_db():
         if conn:
             conn.close()
 
+# --- Session Documents ---
+# The helpers below do not commit, so callers can group them with their other writes.
+def _split_pages(text, size=TRANSCRIPT_PAGE_CHARS):
+    """Splits text into pages of at most size characters, preferring to break at whitespace."""
+    pages = []
+    while len(text) > size:
+        cut = text.rfind(' ', size * 9 // 10, size)
+        cut = cut + 1 if cut > 0 else size
+        pages.append(text[:cut])
+        text = text[cut:]
+    if text or not pages:
+        pages.append(text)
+    return pages
+
+def save_transcript(conn, transcript_id, text, segments=None):
+    """
+    Stores a session's transcript as pages, replacing any previous version, along with
+    its segment timing if given (segments with start, end and text 'offset').
+    """
+    pages = _split_pages(text)
+    conn.execute("DELETE FROM transcript_pages WHERE transcript_id = ?", (transcript_id,))
+    conn.execute("DELETE FROM transcript_segments WHERE transcript_id = ?", (transcript_id,))
+    if segments is not None:
+        _save_segments(conn, transcript_id, segments, pages)
+    conn.executemany("INSERT INTO transcript_pages (transcript_id, page, text) VALUES (?, ?, ?)",
+                     [(transcript_id, number, page) for number, page in enumerate(pages)])
+    conn.execute('''
+        INSERT INTO session_documents (transcript_id, transcript_pages, transcript_chars) VALUES (?, ?, ?)
+        ON CONFLICT (transcript_id) DO UPDATE SET
+            transcript_pages = excluded.transcript_pages, transcript_chars = excluded.transcript_chars,
+            revision = revision + 1, updated_at = CURRENT_TIMESTAMP
+    ''', (transcript_id, len(pages), len(text)))
+
+def save_notes(conn, transcript_id, notes_markdown):
+    conn.execute('''
+        INSERT INTO session_documents (transcript_id, notes_markdown) VALUES (?, ?)
+        ON CONFLICT (transcript_id) DO UPDATE SET
+            notes_markdown = excluded.notes_markdown, revision = revision + 1, updated_at = CURRENT_TIMESTAMP
+    ''', (transcript_id, notes_markdown))
+
+def load_session_document(conn, transcript_id):
+    """Returns the session's notes, transcript page count and revision, or None."""
+    return conn.execute(
+        "SELECT notes_markdown, transcript_pages, transcript_chars, revision FROM session_documents WHERE transcript_id = ?",
+        (transcript_id,)
+    ).fetchone()
+
+def load_transcript_page(conn, transcript_id, page):
+    row = conn.execute("SELECT text FROM transcript_pages WHERE transcript_id = ? AND page = ?",
+                       (transcript_id, page)).fetchone()
+    return row[0] if row else None
+
+def load_transcript(conn, transcript_id):
+    """Returns the full transcript text."""
+    rows = conn.execute("SELECT text FROM transcript_pages WHERE transcript_id = ? ORDER BY page",
+                        (transcript_id,)).fetchall()
+    return "".join(row[0] for row in rows)
+
+def append_chat_message(conn, transcript_id, sender, message):
+    conn.execute("INSERT INTO chat_messages (transcript_id, sender, message) VALUES (?, ?, ?)",
+                 (transcript_id, sender, message))
+
+def load_chat_messages(conn, transcript_id, limit, before_id=None):
+    """
+    Returns up to limit messages older than before_id (default: the newest ones),
+    oldest first, and whether even older messages exist.
+    """
+    rows = conn.execute('''
+        SELECT id, sender, message FROM chat_messages
+        WHERE transcript_id = ? AND id < ?
+        ORDER BY id DESC LIMIT ?
+    ''', (transcript_id, before_id if before_id is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    return [{'id': row[0], 'sender': row[1], 'message': row[2]} for row in reversed(rows[:limit])], has_more
+
+def load_chat_context_messages(conn, transcript_id, window, older_questions):
+    """
+    Returns the chat history needed for a prompt, oldest first: the last window
+    messages, preceded by at most older_questions of the user's earlier questions.
+    """
+    recent, _ = load_chat_messages(conn, transcript_id, window)
+    if not recent:
+        return []
+    older = conn.execute('''
+        SELECT sender, message FROM chat_messages
+        WHERE transcript_id = ? AND id < ? AND sender = 'user'
+        ORDER BY id DESC LIMIT ?
+    ''', (transcript_id, recent[0]['id'], older_questions)).fetchall()
+    return [{'sender': row[0], 'message': row[1]} for row in reversed(older)] + \
+        [{'sender': m['sender'], 'message': m['message']} for m in recent]
+
+def delete_session_documents(conn, transcript_id):
+    for table in ('transcript_pages', 'transcript_segments', 'chat_messages', 'session_documents'):
+        conn.execute(f"DELETE FROM {table} WHERE transcript_id = ?", (transcript_id,))
+
+# --- Transcript Segments ---
+# Segment timing is stored per session as parallel int32 columns (start and end in
+# milliseconds, and the character offset where each segment's text begins), plus the
+# offset of each transcript page, so a time range maps to a slice of one or two pages.
+def _pack_ints(values):
+    data = array('i', values)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+def _unpack_ints(blob):
+    data = array('i')
+    data.frombytes(blob)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data
+
+def _save_segments(conn, transcript_id, segments, pages):
+    page_offsets, position = [], 0
+    for page in pages:
+        page_offsets.append(position)
+        position += len(page)
+    conn.execute('''
+        INSERT OR REPLACE INTO transcript_segments (transcript_id, segment_count, starts_ms, ends_ms, text_offsets, page_offsets)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (transcript_id, len(segments),
+          _pack_ints(round(s['start'] * 1000) for s in segments),
+          _pack_ints(round(s['end'] * 1000) for s in segments),
+          _pack_ints(s['offset'] for s in segments),
+          _pack_ints(page_offsets)))
+
+def load_segment_index(conn, transcript_id):
+    """Returns the session's segment columns as arrays, or None if it has no timing."""
+    row = conn.execute('''
+        SELECT segment_count, starts_ms, ends_ms, text_offsets, page_offsets FROM transcript_segments WHERE transcript_id = ?
+    ''', (transcript_id,)).fetchone()
+    if row is None:
+        return None
+    return {'count': row[0], 'starts_ms': _unpack_ints(row[1]), 'ends_ms': _unpack_ints(row[2]),
+            'offsets': _unpack_ints(row[3]), 'page_offsets': _unpack_ints(row[4])}
+
+def _load_transcript_slice(conn, transcript_id, page_offsets, start, end):
+    """Returns transcript characters [start, end), reading only the pages they fall on."""
+    first = max(0, bisect.bisect_right(page_offsets, start) - 1)
+    last = max(first, bisect.bisect_right(page_offsets, max(start, end - 1)) - 1)
+    rows = conn.execute("SELECT text FROM transcript_pages WHERE transcript_id = ? AND page BETWEEN ? AND ? ORDER BY page",
+                        (transcript_id, first, last)).fetchall()
+    base = page_offsets[first]
+    return "".join(row[0] for row in rows)[start - base:end - base]
+
+def load_segments(conn, transcript_id, start_seconds, end_seconds, limit):
+    """
+    Returns the segments overlapping [start_seconds, end_seconds), at most limit of
+    them, each with start, end (seconds) and text; the start time to continue from if
+    the range held more; and the recording's duration. Returns None if the session
+    has no segment timing.
+    """
+    index = load_segment_index(conn, transcript_id)
+    if index is None:
+        return None
+    starts, ends, offsets = index['starts_ms'], index['ends_ms'], index['offsets']
+    if not index['count']:
+        return {'segments': [], 'next_start': None, 'duration': 0.0}
+    start_ms, end_ms = round(start_seconds * 1000), round(end_seconds * 1000)
+
+    low = max(0, bisect.bisect_right(starts, start_ms) - 1)
+    if ends[low] <= start_ms:
+        low += 1
+    range_end = max(low, bisect.bisect_left(starts, end_ms))
+    high = min(range_end, low + limit)
+
+    segments = []
+    if high > low:
+        text_end = offsets[high] if high < len(offsets) else conn.execute(
+            "SELECT transcript_chars FROM session_documents WHERE transcript_id = ?", (transcript_id,)).fetchone()[0]
+        text = _load_transcript_slice(conn, transcript_id, index['page_offsets'], offsets[low], text_end)
+        for i in range(low, high):
+            piece_end = offsets[i + 1] if i + 1 < high else text_end
+            segments.append({'start': starts[i] / 1000, 'end': ends[i] / 1000,
+                             'text': text[offsets[i] - offsets[low]:piece_end - offsets[low]].strip()})
+    return {
+        'segments': segments,
+        'next_start': starts[high] / 1000 if high < range_end else None,
+        'duration': max(ends) / 1000,
+    }
+
+# --- Full-Text Search ---
+# Notes are indexed straight from session_documents (an external-content table keyed
+# by transcript id). transcript_pages has no rowid, so its index keeps its own copy of
+# the text under a rowid that packs the transcript id and page number.
+SEARCH_TOKENIZER = "porter unicode61 remove_diacritics 2"
+SEARCH_PAGE_BITS = 16           # Up to 65536 pages per transcript
+SEARCH_SNIPPET_TOKENS = 16
+SEARCH_CANDIDATES_PER_HIT = 4    # Matches ranked per requested hit, before collapsing pages of the same session
+SEARCH_HIGHLIGHT = ('\x02', '\x03')    # Marks matched terms in snippets; callers escape, then replace
+
+def create_search_index(cursor):
+    """Creates the FTS5 tables and their triggers, and indexes existing rows the first time."""
+    existed = cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('notes_search', 'transcript_search')"
+    ).fetchone()[0] == 2
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_search USING fts5(
+            notes_markdown, content='session_documents', content_rowid='transcript_id', tokenize='{SEARCH_TOKENIZER}'
+        )
+    ''')
+    cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS transcript_search USING fts5(text, tokenize='{SEARCH_TOKENIZER}')")
+
+    triggers = (
+        '''
+            CREATE TRIGGER IF NOT EXISTS session_documents_search_insert AFTER INSERT ON session_documents BEGIN
+                INSERT INTO notes_search (rowid, notes_markdown) VALUES (new.transcript_id, new.notes_markdown);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS session_documents_search_delete AFTER DELETE ON session_documents BEGIN
+                INSERT INTO notes_search (notes_search, rowid, notes_markdown) VALUES ('delete', old.transcript_id, old.notes_markdown);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS session_documents_search_update AFTER UPDATE OF notes_markdown ON session_documents BEGIN
+                INSERT INTO notes_search (notes_search, rowid, notes_markdown) VALUES ('delete', old.transcript_id, old.notes_markdown);
+                INSERT INTO notes_search (rowid, notes_markdown) VALUES (new.transcript_id, new.notes_markdown);
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS transcript_pages_search_insert AFTER INSERT ON transcript_pages BEGIN
+                INSERT INTO transcript_search (rowid, text) VALUES ((new.transcript_id << {SEARCH_PAGE_BITS}) + new.page, new.text);
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS transcript_pages_search_delete AFTER DELETE ON transcript_pages BEGIN
+                DELETE FROM transcript_search WHERE rowid = (old.transcript_id << {SEARCH_PAGE_BITS}) + old.page;
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS transcript_pages_search_update AFTER UPDATE ON transcript_pages BEGIN
+                UPDATE transcript_search SET rowid = (new.transcript_id << {SEARCH_PAGE_BITS}) + new.page, text = new.text
+                WHERE rowid = (old.transcript_id << {SEARCH_PAGE_BITS}) + old.page;
+            END
+        ''',
+    )
+    for trigger in triggers:
+        cursor.execute(trigger)
+
+    if not existed:
+        cursor.execute("INSERT INTO notes_search (notes_search) VALUES ('rebuild')")
+        cursor.execute(f'''
+            INSERT INTO transcript_search (rowid, text)
+            SELECT (transcript_id << {SEARCH_PAGE_BITS}) + page, text FROM transcript_pages
+        ''')
+
+def build_search_query(text):
+    """
+    Turns free text into an FTS5 query that matches every word, the last one as a
+    prefix (so results appear while typing). Returns None if there is nothing to search.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+def search_sessions(conn, text, limit):
+    """
+    Returns up to limit hits for the text, best first: at most one for each session's
+    notes and one for its transcript (its best-matching page). Each hit has the
+    session's id, filename and folder, the hit's kind and page, and a snippet whose
+    matches are wrapped in SEARCH_HIGHLIGHT.
+    """
+    query = build_search_query(text)
+    if query is None:
+        return []
+    start, end = SEARCH_HIGHLIGHT
+    mask = (1 << SEARCH_PAGE_BITS) - 1
+    rows = conn.execute(f'''
+        SELECT hit.transcript_id, t.filename, t.folder_id, hit.kind, hit.page, hit.snippet, hit.score
+        FROM (
+            SELECT * FROM (
+                SELECT rowid AS transcript_id, 'notes' AS kind, 0 AS page,
+                       snippet(notes_search, 0, :start, :end, '…', {SEARCH_SNIPPET_TOKENS}) AS snippet,
+                       rank AS score
+                FROM notes_search WHERE notes_search MATCH :query ORDER BY rank LIMIT :limit
+            )
+            UNION ALL
+            SELECT * FROM (
+                SELECT rowid >> {SEARCH_PAGE_BITS}, 'transcript', rowid & {mask},
+                       snippet(transcript_search, 0, :start, :end, '…', {SEARCH_SNIPPET_TOKENS}),
+                       rank
+                FROM transcript_search WHERE transcript_search MATCH :query ORDER BY rank LIMIT :limit
+            )
+        ) AS hit
+        JOIN transcripts t ON t.id = hit.transcript_id
+        ORDER BY hit.score
+    ''', {'query': query, 'limit': limit * SEARCH_CANDIDATES_PER_HIT, 'start': start, 'end': end}).fetchall()
+    hits, seen = [], set()
+    for row in rows:
+        if (row[0], row[3]) in seen:
+            continue
+        seen.add((row[0], row[3]))
+        hits.append({'transcript_id': row[0], 'filename': row[1], 'folder_id': row[2], 'kind': row[3],
+                     'page': row[4], 'snippet': row[5]})
+        if len(hits) == limit:
+            break
+    return hits
+
+# --- Migration of Session Folders ---
+def _read_session_file(folder, name):
+    try:
+        with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def migrate_session_folders(conn):
+    """
+    Imports sessions stored as transcript.txt / notes.md / chat_history.json folders
+    into the database. Runs on every start until all of them have been imported, so
+    a folder that is unreadable now (e.g. on an unmounted drive) is picked up later;
+    the folders are left in place and removed when their session is deleted. Does not commit.
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO app_state (key, value) VALUES ('session_files_migrated', 0)")
+    if cursor.execute("SELECT value FROM app_state WHERE key = 'session_files_migrated'").fetchone()[0]:
+        return
+
+    migrated = skipped = 0
+    rows = cursor.execute('''
+        SELECT t.id, t.data_path FROM transcripts t
+        LEFT JOIN session_documents d ON d.transcript_id = t.id
+        WHERE d.transcript_id IS NULL
+    ''').fetchall()
+    for transcript_id, folder in rows:
+        if not folder:
+            continue
+        transcript_text = _read_session_file(folder, 'transcript.txt')
+        if transcript_text is None:
+            skipped += 1
+            continue
+        save_transcript(conn, transcript_id, transcript_text)
+        save_notes(conn, transcript_id, _read_session_file(folder, 'notes.md') or '')
+        try:
+            history = json.loads(_read_session_file(folder, 'chat_history.json') or '[]')
+        except json.JSONDecodeError:
+            history = []
+        conn.executemany("INSERT INTO chat_messages (transcript_id, sender, message) VALUES (?, ?, ?)",
+                         [(transcript_id, msg['sender'], msg['message']) for msg in history])
+        migrated += 1
+    if not skipped:
+        cursor.execute("UPDATE app_state SET value = 1 WHERE key = 'session_files_migrated'")
+    if migrated:
+        print(f"Migrated {migrated} session folder(s) into the database.")
+    if skipped:
+        print(f"Could not read {skipped} session folder(s); they will be migrated on a later start.")
+
+# --- Data Version ---
+def bump_data_version(conn):
+    """
+    Marks the folder/session tree as changed. Does not commit, so the bump lands
+    in the same transaction as the change it describes.
+    """
+    conn.execute("UPDATE app_state SET value = value + 1 WHERE key = 'data_version'")
+
+def get_data_version(conn):
+    row = conn.execute(DATA_VERSION_QUERY).fetchone()
+    return row[0] if row else 0
+
+# --- Audio Content Cache ---
+def find_cached_transcript(conn, content_hash, pipeline_version):
+    """Returns the id of an existing session produced from identical audio by the same pipeline, or None."""
+    row = conn.execute('''
+        SELECT c.transcript_id FROM audio_cache c
+        JOIN transcripts t ON t.id = c.transcript_id
+        WHERE c.content_hash = ? AND c.pipeline_version = ?
+    ''', (content_hash, pipeline_version)).fetchone()
+    return row['transcript_id'] if row else None
+
+def find_queued_duplicate(conn, content_hash, pipeline_version):
+    """Returns the id of a job for identical audio that is still in the pipeline, or None."""
+    row = conn.execute(
+        "SELECT id FROM transcription_queue WHERE content_hash = ? AND pipeline_version = ? AND status NOT IN ('failed', 'cancelled') ORDER BY id LIMIT 1",
+        (content_hash, pipeline_version)
+    ).fetchone()
+    return row['id'] if row else None
+
+def record_cached_transcript(conn, content_hash, pipeline_version, transcript_id):
+    """Remembers the session produced from this audio. Does not commit."""
+    conn.execute(
+        "INSERT OR REPLACE INTO audio_cache (content_hash, pipeline_version, transcript_id) VALUES (?, ?, ?)",
+        (content_hash, pipeline_version, transcript_id)
+    )
+
+# --- Queue Job Claiming ---
+# Each pipeline stage moves a job from a waiting status to an active status.
+# Pre-processing:   queued      -> preparing         -> prepared
+# Transcription:    prepared    -> processing        -> transcribed
+# Note generation:  transcribed -> generating_notes  -> (removed from the queue)
+QUEUE_STAGES = {
+    'prepare': ('queued', 'preparing'),
+    'transcribe': ('prepared', 'processing'),
+    'notes': ('transcribed', 'generating_notes'),
+}
+ACTIVE_STATUSES = tuple(active for _, active in QUEUE_STAGES.values())
+
+# --- Scheduling ---
+# Waiting jobs are ordered by priority first. Within a priority level, the queue is
+# shared fairly between owners (or, for jobs without one, target folders): the group
+# with the fewest jobs running in the stage goes first, then the group served least
+# recently. Inside a group the shortest recording goes first, aged by waiting time so
+# long recordings are not starved.
+PRIORITY_LEVELS = {'low': -10, 'normal': 0, 'high': 10}
+SJF_AGING_RATE = 0.5            # Each second spent waiting counts as this many seconds less audio
+THROUGHPUT_HISTORY = 50         # Recent completed runs per stage used for throughput estimates
+
+SCHEDULE_QUERY = '''
+    SELECT q.id FROM transcription_queue q
+    LEFT JOIN (
+        SELECT share_key, COUNT(*) AS running FROM transcription_queue WHERE status = :active GROUP BY share_key
+    ) r ON r.share_key = q.share_key
+    LEFT JOIN queue_shares s ON s.stage = :stage AND s.share_key = q.share_key
+    WHERE q.status = :waiting AND (q.next_attempt_at IS NULL OR q.next_attempt_at <= CURRENT_TIMESTAMP)
+    ORDER BY q.priority DESC, COALESCE(r.running, 0), COALESCE(s.last_claim, 0),
+             COALESCE(q.audio_duration, 0) - (julianday('now') - julianday(q.created_at)) * 86400 * :aging,
+             q.created_at, q.id
+'''
+
+def share_key_for(owner, folder_id):
+    """Returns the fair-share group of a job: its owner, or its target folder if it has none."""
+    if owner:
+        return f"owner:{owner}"
+    return f"folder:{folder_id}" if folder_id else ''
+
+def _schedule_params(stage):
+    waiting_status, active_status = QUEUE_STAGES[stage]
+    return {'stage': stage, 'waiting': waiting_status, 'active': active_status, 'aging': SJF_AGING_RATE}
+
+def scheduled_job_ids(conn, stage):
+    """Returns the ids of the jobs waiting for a stage, in the order they will be claimed."""
+    return [row[0] for row in conn.execute(SCHEDULE_QUERY, _schedule_params(stage)).fetchall()]
+
+def record_job_run(conn, job_row, stage, seconds, outcome, spans=None):
+    """
+    Appends a finished stage run to job_history, the source of throughput estimates,
+    and its timing spans ({name: seconds}) to job_spans. Does not commit.
+    """
+    duration = conn.execute("SELECT audio_duration FROM transcription_queue WHERE id = ?", (job_row['id'],)).fetchone()
+    history_id = conn.execute('''
+        INSERT INTO job_history (job_id, stage, share_key, priority, audio_duration, transcribe_model, seconds, outcome)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (job_row['id'], stage, job_row['share_key'], job_row['priority'],
+          duration[0] if duration and duration[0] is not None else job_row['audio_duration'],
+          job_row['transcribe_model'], seconds, outcome)).lastrowid
+    if spans:
+        conn.executemany("INSERT INTO job_spans (history_id, name, seconds) VALUES (?, ?, ?)",
+                         [(history_id, name, span_seconds) for name, span_seconds in spans.items()])
+    _add_run_totals(conn, stage, outcome, seconds, spans)
+
+def _add_run_totals(conn, stage, outcome, seconds, spans):
+    """Adds a stage run and its spans (plus the run's total as the 'total' span) to the running totals."""
+    conn.execute('''
+        INSERT INTO job_run_totals (stage, outcome, runs) VALUES (?, ?, 1)
+        ON CONFLICT (stage, outcome) DO UPDATE SET runs = runs + 1
+    ''', (stage, outcome))
+    timings = {**(spans or {}), 'total': seconds}
+    conn.executemany('''
+        INSERT INTO job_span_totals (stage, name, le, runs, seconds) VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT (stage, name, le) DO UPDATE SET runs = runs + 1, seconds = seconds + excluded.seconds
+    ''', [(stage, name, _bucket_bound(span_seconds), span_seconds) for name, span_seconds in timings.items()])
+
+def _bucket_bound(seconds, buckets=SPAN_BUCKETS):
+    index = bisect.bisect_left(buckets, seconds)
+    return buckets[index] if index < len(buckets) else float('inf')
+
+def backfill_run_totals(conn):
+    """Builds the running totals from job_history when they are empty, e.g. after an upgrade. Does not commit."""
+    if conn.execute("SELECT 1 FROM job_run_totals LIMIT 1").fetchone() or \
+            not conn.execute("SELECT 1 FROM job_history LIMIT 1").fetchone():
+        return
+    for row in conn.execute("SELECT id, stage, outcome, seconds FROM job_history ORDER BY id").fetchall():
+        spans = dict(conn.execute("SELECT name, seconds FROM job_spans WHERE history_id = ?", (row['id'],)).fetchall())
+        _add_run_totals(conn, row['stage'], row['outcome'], row['seconds'], spans)
+    print("Rebuilt job run totals from the job history.")
+
+def purge_job_history(conn, retention_seconds):
+    """Removes stage runs (and their spans) older than retention_seconds; the running totals keep counting them. Does not commit."""
+    cutoff = (f'-{int(retention_seconds)} seconds',)
+    conn.execute("DELETE FROM job_spans WHERE history_id IN (SELECT id FROM job_history WHERE finished_at < datetime('now', ?))", cutoff)
+    return conn.execute("DELETE FROM job_history WHERE finished_at < datetime('now', ?)", cutoff).rowcount
+
+def job_spans(conn, job_id):
+    """Returns a job's stage runs in order, each with its spans, for inspecting one slow job."""
+    runs = []
+    for row in conn.execute("SELECT id, stage, seconds, outcome, finished_at FROM job_history WHERE job_id = ? ORDER BY id", (job_id,)):
+        spans = conn.execute("SELECT name, seconds FROM job_spans WHERE history_id = ? ORDER BY seconds DESC", (row['id'],))
+        runs.append({'stage': row['stage'], 'seconds': row['seconds'], 'outcome': row['outcome'],
+                     'finished_at': row['finished_at'], 'spans': {name: seconds for name, seconds in spans}})
+    return runs
+
+def span_histograms(conn, buckets=SPAN_BUCKETS):
+    """
+    Returns cumulative histograms of span durations per (stage, span), including each
+    run's total as the 'total' span: [(stage, name, bucket counts, count, sum)].
+    """
+    histograms = {}
+    for stage, name, le, runs, seconds in conn.execute("SELECT stage, name, le, runs, seconds FROM job_span_totals"):
+        counts, totals = histograms.setdefault((stage, name), ([0] * len(buckets), [0, 0.0]))
+        for index, bound in enumerate(buckets):
+            if le <= bound:
+                counts[index] += runs
+        totals[0] += runs
+        totals[1] += seconds
+    return [(stage, name, counts, count, total) for (stage, name), (counts, (count, total)) in sorted(histograms.items())]
+
+def job_run_counts(conn):
+    """Returns [(stage, outcome, runs)] over all stage runs ever recorded."""
+    return [tuple(row) for row in conn.execute("SELECT stage, outcome, runs FROM job_run_totals ORDER BY stage, outcome")]
+
+def save_model_residency(conn, worker_id, entries):
+    """Replaces a worker's entries in the model registry with its currently loaded models. Does not commit."""
+    conn.execute("DELETE FROM model_residency WHERE worker_id = ?", (worker_id,))
+    conn.executemany('''
+        INSERT INTO model_residency (worker_id, backend, model_name, processes, resident_mb, measured, loaded_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(worker_id, e['backend'], e['model_name'], e['processes'], e['resident_mb'], int(e['measured']),
+           e['loaded_at'], e['last_used_at']) for e in entries])
+
+def load_model_residency(conn):
+    return [dict(row) for row in conn.execute("SELECT * FROM model_residency ORDER BY worker_id, backend, model_name")]
+
+def clear_model_residency(conn):
+    """Forgets every worker's models, e.g. when the workers are (re)started. Does not commit."""
+    conn.execute("DELETE FROM model_residency")
+
+def queue_status_counts(conn):
+    """Returns {status: jobs} for the jobs currently in the queue."""
+    return {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM transcription_queue GROUP BY status")}
+
+def stage_throughput(conn, limit=THROUGHPUT_HISTORY):
+    """
+    Returns, per stage, the median processing seconds per second of audio and the
+    median seconds per job over the most recent completed runs (None without history).
+    """
+    throughput = {}
+    for stage in QUEUE_STAGES:
+        rows = conn.execute('''
+            SELECT seconds, audio_duration FROM job_history
+            WHERE stage = ? AND outcome = 'completed' ORDER BY id DESC LIMIT ?
+        ''', (stage, limit)).fetchall()
+        rates = sorted(seconds / duration for seconds, duration in rows if duration)
+        per_job = sorted(seconds for seconds, _ in rows)
+        throughput[stage] = {
+            'seconds_per_audio_second': rates[len(rates) // 2] if rates else None,
+            'seconds_per_job': per_job[len(per_job) // 2] if per_job else None,
+            'samples': len(rows),
+        }
+    return throughput
+
+
+def claim_next_job(conn, worker_id, stage='transcribe'):
+    """
+    Atomically claims the next job waiting for the given stage, in scheduling order.
+
+    The claim is a single UPDATE, so two workers racing for the same row can
+    never both win it. Returns the claimed row, or None if nothing is waiting.
+    """
+    params = _schedule_params(stage)
+    cursor = conn.execute(f'''
+        UPDATE transcription_queue
+        SET status = :active, worker_id = :worker_id,
+            claimed_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = ({SCHEDULE_QUERY} LIMIT 1) AND status = :waiting
+    ''', {**params, 'worker_id': worker_id})
+    if cursor.rowcount == 0:
+        conn.commit()
+        return None
+    job_row = conn.execute(
+        "SELECT * FROM transcription_queue WHERE worker_id = ? AND status = ?",
+        (worker_id, params['active'])
+    ).fetchone()
+    conn.execute('''
+        INSERT INTO queue_shares (stage, share_key, last_claim)
+        VALUES (?, ?, (SELECT COALESCE(MAX(last_claim), 0) + 1 FROM queue_shares))
+        ON CONFLICT (stage, share_key) DO UPDATE SET last_claim = excluded.last_claim
+    ''', (stage, job_row['share_key']))
+    conn.commit()
+    return job_row
+
+def owns_job(conn, job_id, worker_id):
+    """Returns True if the job is still claimed by this worker."""
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    row = conn.execute(
+        f"SELECT id FROM transcription_queue WHERE id = ? AND worker_id = ? AND status IN ({placeholders})",
+        (job_id, worker_id, *ACTIVE_STATUSES)
+    ).fetchone()
+    return row is not None
+
+def heartbeat_job(conn, job_id, worker_id):
+    """
+    Renews the lease on a job. Returns False if the job is no longer owned by
+    this worker (e.g. it was reclaimed after the lease expired).
+    """
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    cursor = conn.execute(
+        f"UPDATE transcription_queue SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ? AND worker_id = ? AND status IN ({placeholders})",
+        (job_id, worker_id, *ACTIVE_STATUSES)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+def release_job(conn, job_id, next_status, **fields):
+    """
+    Hands a job on to the next stage by setting its status and clearing the
+    claim. Extra keyword arguments are written to the matching columns.
+    Does not commit, so it can be combined with the caller's other writes.
+    """
+    assignments = "".join(f", {column} = ?" for column in fields)
+    conn.execute(
+        f"UPDATE transcription_queue SET status = ?, worker_id = NULL, claimed_at = NULL, heartbeat_at = NULL{assignments} WHERE id = ?",
+        (next_status, *fields.values(), job_id)
+    )
+
+# --- Failure, Retry and Cancellation ---
+def _owned_job_update(conn, job_id, worker_id, assignments, params):
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    return conn.execute(
+        f"UPDATE transcription_queue SET {assignments}, worker_id = NULL, claimed_at = NULL, heartbeat_at = NULL "
+        f"WHERE id = ? AND worker_id = ? AND status IN ({placeholders})",
+        (*params, job_id, worker_id, *ACTIVE_STATUSES)
+    ).rowcount == 1
+
+def schedule_retry(conn, job_id, worker_id, stage, error_message, delay_seconds):
+    """
+    Puts a job that failed in a stage back in that stage's queue, to be picked up
+    again after delay_seconds. Returns False if the worker no longer owns the job.
+    Does not commit.
+    """
+    return _owned_job_update(conn, job_id, worker_id,
+                             "status = ?, attempts = attempts + 1, next_attempt_at = datetime('now', ?), error_message = ?",
+                             (QUEUE_STAGES[stage][0], f'+{int(delay_seconds)} seconds', error_message))
+
+def fail_job(conn, job_id, worker_id, stage, error_message):
+    """Marks a job failed in a stage. Returns False if the worker no longer owns it. Does not commit."""
+    return _owned_job_update(conn, job_id, worker_id,
+                             "status = 'failed', attempts = attempts + 1, failed_stage = ?, error_message = ?, ended_at = CURRENT_TIMESTAMP",
+                             (stage, error_message))
+
+def cancel_job(conn, job_id):
+    """
+    Cancels a waiting, running or failed job and returns its row as it was before, or
+    None if there is no such job (or it was already cancelled). A running job's
+    worker notices on its next lease check and discards its work. Does not commit.
+    """
+    job_row = conn.execute("SELECT * FROM transcription_queue WHERE id = ?", (job_id,)).fetchone()
+    if job_row is None or job_row['status'] == 'cancelled':
+        return None
+    conn.execute('''
+        UPDATE transcription_queue
+        SET status = 'cancelled', worker_id = NULL, claimed_at = NULL, heartbeat_at = NULL,
+            next_attempt_at = NULL, error_message = 'Cancelled', ended_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (job_id,))
+    delete_job_checkpoints(conn, job_id)
+    return job_row
+
+def retry_job(conn, job_id):
+    """
+    Queues a failed job again from the stage it failed in, with a fresh attempt count.
+    Returns that stage, or None if the job is not failed. Does not commit.
+    """
+    job_row = conn.execute("SELECT * FROM transcription_queue WHERE id = ? AND status = 'failed'", (job_id,)).fetchone()
+    if job_row is None:
+        return None
+    stage = job_row['failed_stage'] or (
+        'notes' if job_row['transcript_id'] else 'transcribe' if job_row['prepared_path'] else 'prepare')
+    conn.execute('''
+        UPDATE transcription_queue
+        SET status = ?, attempts = 0, next_attempt_at = NULL, failed_stage = NULL, error_message = NULL,
+            ended_at = NULL, progress = CASE WHEN ? = 'notes' THEN progress ELSE 0 END
+        WHERE id = ?
+    ''', (QUEUE_STAGES[stage][0], stage, job_id))
+    return stage
+
+def purge_cancelled_jobs(conn, retention_seconds):
+    """Removes cancelled jobs once clients have had retention_seconds to see it. Does not commit."""
+    return conn.execute("DELETE FROM transcription_queue WHERE status = 'cancelled' AND ended_at < datetime('now', ?)",
+                        (f'-{int(retention_seconds)} seconds',)).rowcount
+
+# --- Chunk Checkpoints ---
+def save_job_checkpoint(conn, job_id, chunk_result):
+    """Stores one transcribed chunk of a job. Does not commit."""
+    conn.execute("INSERT OR REPLACE INTO job_checkpoints (job_id, core_start, core_end, result) VALUES (?, ?, ?, ?)",
+                 (job_id, chunk_result['core_start'], chunk_result['core_end'],
+                  json.dumps(chunk_result['segments'], separators=(',', ':'))))
+
+def load_job_checkpoints(conn, job_id):
+    """Returns a job's stored chunks as {(core_start, core_end): chunk result}."""
+    rows = conn.execute("SELECT core_start, core_end, result FROM job_checkpoints WHERE job_id = ?", (job_id,)).fetchall()
+    return {(row[0], row[1]): {'core_start': row[0], 'core_end': row[1], 'segments': json.loads(row[2])} for row in rows}
+
+def delete_job_checkpoints(conn, job_id):
+    conn.execute("DELETE FROM job_checkpoints WHERE job_id = ?", (job_id,))
+
+def reclaim_stale_jobs(conn, lease_seconds):
+    """
+    Returns active jobs whose lease has expired to their stage's waiting status
+    so a crashed worker can no longer block them. Returns the number reclaimed.
+    """
+    reclaimed = 0
+    for waiting_status, active_status in QUEUE_STAGES.values():
+        cursor = conn.execute('''
+            UPDATE transcription_queue
+            SET status = ?, worker_id = NULL, claimed_at = NULL, heartbeat_at = NULL,
+                progress = CASE WHEN ? = 'transcribed' THEN progress ELSE 0 END
+            WHERE status = ?
+              AND (heartbeat_at IS NULL OR heartbeat_at < datetime('now', ?))
+        ''', (waiting_status, waiting_status, active_status, f'-{int(lease_seconds)} seconds'))
+        reclaimed += cursor.rowcount
+    conn.commit()
+    return reclaimed
+
 if __name__ == '__main__':
     # Allows running this script directly to create/update the database
     init_db()
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+events.py
+
+In-process event broker for the LectureScribe application.
+
+This module pushes server-side changes to connected browsers instead of having them poll. It provides:
+
+- A thread-safe publish/subscribe broker with one bounded queue per connected client.
+- A flag that tells background producers whether anyone is listening, so an idle server does no work.
+- Formatting helpers for Server-Sent Events.
+
+Slow clients never block publishers: when a client's queue is full, further events for it are dropped and the browser catches up from the snapshot it receives on reconnect.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import json
+import queue
+import threading
+
+# --- Configuration ---
+SUBSCRIBER_QUEUE_SIZE = 256
+KEEPALIVE_SECONDS = 15          # Comment lines sent on idle streams so proxies keep them open
+STREAM_MAX_SECONDS = 600        # Streams are closed periodically; EventSource reconnects on its own
+RECONNECT_MILLISECONDS = 3000
+
+# --- Broker ---
+class EventBroker:
+    """Fans published events out to every subscribed client queue."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.has_subscribers = threading.Event()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            self.has_subscribers.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self.has_subscribers.clear()
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+broker = EventBroker()
+
+# --- Server-Sent Events Formatting ---
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def format_sse_comment(text):
+    return f": {text}\n\n"
+
+def format_sse_retry(milliseconds=RECONNECT_MILLISECONDS):
+    return f"retry: {milliseconds}\n\n"
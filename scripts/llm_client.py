@@ -0,0 +1,216 @@
+"""
+llm_client.py
+
+Shared Ollama client for the LectureScribe application.
+
+Every call to the local Ollama server (note generation, chat and warm-up) goes through this module. It provides:
+
+- One pooled HTTP session, so calls reuse keep-alive connections instead of opening a new one each time.
+- Connect and read timeouts, so a stalled Ollama fails the call instead of hanging a worker forever.
+- Bounded retries with exponential backoff and jitter for connection errors, timeouts and overload responses.
+- A concurrency limiter per traffic class (notes, chat), so one kind of traffic cannot starve the other or overwhelm Ollama.
+- Per-call latency and token metrics, with rolling percentiles per traffic class.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import os
+import json
+import time
+import random
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Configuration ---
+OLLAMA_URL = os.environ.get('LECTURESCRIBE_OLLAMA_URL', 'http://localhost:11434')
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS = int(os.environ.get('LECTURESCRIBE_LLM_READ_TIMEOUT', '600'))   # Longest wait for the next byte
+MAX_RETRIES = int(os.environ.get('LECTURESCRIBE_LLM_RETRIES', '2'))
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+CONCURRENCY_LIMITS = {
+    'notes': int(os.environ.get('LECTURESCRIBE_LLM_NOTES_CONCURRENCY', '2')),
+    'chat': int(os.environ.get('LECTURESCRIBE_LLM_CHAT_CONCURRENCY', '2')),
+    'warmup': 1,
+}
+METRICS_WINDOW = 500            # Recent calls kept per traffic class for percentiles
+
+class LLMError(Exception):
+    """Raised when Ollama cannot produce a response after all retries."""
+
+# --- Metrics ---
+class LLMMetrics:
+    """Thread-safe per-traffic-class call statistics."""
+
+    def __init__(self, window=METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._window = window
+        self._classes = {}
+
+    def record(self, traffic, seconds, ok, retries=0, prompt_tokens=0, output_tokens=0, first_token_seconds=None):
+        with self._lock:
+            stats = self._classes.setdefault(traffic, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'prompt_tokens': 0, 'output_tokens': 0,
+                'recent': deque(maxlen=self._window), 'recent_first_token': deque(maxlen=self._window),
+            })
+            stats['calls'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['retries'] += retries
+            stats['prompt_tokens'] += prompt_tokens
+            stats['output_tokens'] += output_tokens
+            if ok:
+                stats['recent'].append((seconds, output_tokens))
+                if first_token_seconds is not None:
+                    stats['recent_first_token'].append(first_token_seconds)
+
+    def snapshot(self):
+        """Returns totals and recent latency percentiles (seconds) per traffic class."""
+        def percentile(values, fraction):
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 3) if ordered else None
+
+        with self._lock:
+            result = {}
+            for traffic, stats in self._classes.items():
+                latencies = [seconds for seconds, _ in stats['recent']]
+                busy = sum(latencies)
+                result[traffic] = {
+                    'calls': stats['calls'], 'errors': stats['errors'], 'retries': stats['retries'],
+                    'prompt_tokens': stats['prompt_tokens'], 'output_tokens': stats['output_tokens'],
+                    'latency_p50': percentile(latencies, 0.5), 'latency_p95': percentile(latencies, 0.95),
+                    'latency_p99': percentile(latencies, 0.99),
+                    'first_token_p50': percentile(stats['recent_first_token'], 0.5),
+                    'first_token_p95': percentile(stats['recent_first_token'], 0.95),
+                    'tokens_per_second': round(sum(tokens for _, tokens in stats['recent']) / busy, 1) if busy else None,
+                }
+            return result
+
+# --- Client ---
+class OllamaClient:
+    """A pooled, rate-limited client for Ollama's /api/generate endpoint."""
+
+    def __init__(self, model, options=None, keep_alive=None, base_url=OLLAMA_URL,
+                 concurrency_limits=None, max_retries=MAX_RETRIES):
+        self.model = model
+        self.options = options or {}
+        self.keep_alive = keep_alive
+        self.endpoint = base_url.rstrip('/') + '/api/generate'
+        self.max_retries = max_retries
+        self.metrics = LLMMetrics()
+        limits = concurrency_limits or CONCURRENCY_LIMITS
+        self._limiters = {traffic: threading.BoundedSemaphore(max(1, limit)) for traffic, limit in limits.items()}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, sum(limits.values())), max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _payload(self, prompt, stream, options):
+        payload = {"model": self.model, "prompt": prompt, "stream": stream, "options": {**self.options, **options}}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _post(self, payload, stream, read_timeout):
+        """Posts with retries; returns the open response and the number of retries used."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.endpoint, data=json.dumps(payload),
+                                             headers={'Content-Type': 'application/json'},
+                                             timeout=(CONNECT_TIMEOUT_SECONDS, read_timeout), stream=stream)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response, attempt
+                error = LLMError(f"Ollama returned HTTP {response.status_code}")
+                response.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.HTTPError as e:
+                raise LLMError(str(e)) from e
+            if attempt < self.max_retries:
+                delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        raise LLMError(f"Ollama request failed after {self.max_retries + 1} attempt(s): {error}") from error
+
+    def generate(self, prompt, traffic='notes', read_timeout=READ_TIMEOUT_SECONDS, **options):
+        """Sends a non-streaming prompt and returns the response text."""
+        started = time.monotonic()
+        retries = 0
+        with self._limiters[traffic]:
+            try:
+                response, retries = self._post(self._payload(prompt, False, options), False, read_timeout)
+                with response:
+                    data = response.json()
+                if data.get('error'):
+                    raise LLMError(f"Ollama error: {data['error']}")
+            except Exception as e:
+                self.metrics.record(traffic, time.monotonic() - started, ok=False, retries=retries)
+                if isinstance(e, (ValueError, requests.RequestException)):
+                    # A truncated or non-JSON body counts as a failed call, not a programming error.
+                    raise LLMError(f"Invalid response from Ollama: {e}") from e
+                raise
+        self.metrics.record(traffic, time.monotonic() - started, ok=True, retries=retries,
+                            prompt_tokens=data.get('prompt_eval_count', 0), output_tokens=data.get('eval_count', 0))
+        return data.get('response', "")
+
+    def stream(self, prompt, traffic='chat', read_timeout=READ_TIMEOUT_SECONDS, **options):
+        """
+        Yields the response text piece by piece. Retries only cover establishing the
+        request; once text has been yielded, a failure is raised to the caller, including
+        a stream that ends without Ollama's final "done" message.
+        """
+        started = time.monotonic()
+        first_token_seconds = None
+        retries = 0
+        final = {}
+        ok = False
+        with self._limiters[traffic]:
+            try:
+                response, retries = self._post(self._payload(prompt, True, options), True, read_timeout)
+                with response:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get('error'):
+                            raise LLMError(f"Ollama error: {chunk['error']}")
+                        if chunk.get('response'):
+                            if first_token_seconds is None:
+                                first_token_seconds = time.monotonic() - started
+                            yield chunk['response']
+                        if chunk.get('done'):
+                            final = chunk
+                            break
+                if not final:
+                    raise LLMError("Ollama closed the stream before the response was complete")
+                ok = True
+            except GeneratorExit:
+                ok = True
+                raise
+            except (ValueError, requests.RequestException) as e:
+                raise LLMError(f"Invalid response from Ollama: {e}") from e
+            finally:
+                # Also runs when the consumer stops early (e.g. the browser disconnected).
+                self.metrics.record(traffic, time.monotonic() - started, ok=ok, retries=retries,
+                                    prompt_tokens=final.get('prompt_eval_count', 0),
+                                    output_tokens=final.get('eval_count', 0), first_token_seconds=first_token_seconds)
+
+    def load_model(self, timeout=READ_TIMEOUT_SECONDS, **options):
+        """Asks Ollama to load the model without generating (an empty prompt), with the given options (e.g. num_ctx)."""
+        payload = {"model": self.model}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        started = time.monotonic()
+        with self._limiters['warmup']:
+            response, retries = self._post(payload, False, timeout)
+            response.close()
+        self.metrics.record('warmup', time.monotonic() - started, ok=True, retries=retries)
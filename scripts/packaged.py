@@ -123,7 +123,10 @@ def start_waitress_server_thread(icon):
                 proc = subprocess.Popen([
                     sys.executable, '-m', 'waitress',
                     '--listen=0.0.0.0:8017',
-                    'scripts.app:app'
+                    # Event streams and streamed chat answers each hold a thread while open.
+                    '--threads=32',
+                    # The factory sets up the database, starts the queue workers and warms up the models.
+                    '--call', 'scripts.app:create_app'
                 ], cwd=project_root)
 
                 server_running = True
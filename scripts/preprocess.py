@@ -0,0 +1,164 @@
+"""
+preprocess.py
+
+Audio pre-processing stage for the LectureScribe application.
+
+This module turns an uploaded recording into the compact input the transcriber needs, once, before transcription starts. It provides:
+
+- A single ffmpeg decode of any audio or video upload to 16 kHz mono PCM, the format Whisper works in.
+- Trimming of leading and trailing silence and shortening of long stretches of dead air.
+- A timeline that maps positions in the trimmed audio back to the original recording, so timestamps stay correct.
+- Storage of the result as a 16-bit PCM WAV artifact that loads without another decode.
+
+Transcription workers read the prepared artifact instead of running ffmpeg on the original file, and Whisper only sees the parts of the lecture that contain sound.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import os
+import json
+import wave
+import bisect
+import subprocess
+
+import numpy as np
+
+from metrics import span
+
+# --- Configuration ---
+SAMPLE_RATE = 16000             # Whisper's input rate
+FRAME_SECONDS = 0.02
+SILENCE_RELATIVE_DB = -40       # Frames this far below loud speech count as silence
+SILENCE_FLOOR_DB = -60          # ...and anything below this absolute level always does
+MAX_SILENCE_SECONDS = 1.5       # Pauses longer than this are shortened
+KEEP_SILENCE_SECONDS = 0.3      # Silence kept next to speech on each side of a shortened pause
+PREPARED_SUFFIX = '.prepared.wav'
+
+# --- Decoding ---
+def decode_audio(path, sample_rate=SAMPLE_RATE):
+    """Decodes any audio or video file to mono float32 samples in [-1, 1] with ffmpeg."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+        "-vn", "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio: {e.stderr.decode(errors='replace')[-500:]}") from e
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+# --- Silence Trimming ---
+def _frame_energy(audio, frame):
+    usable = len(audio) - len(audio) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.sqrt(np.mean(audio[:usable].reshape(-1, frame) ** 2, axis=1))
+
+def find_speech_intervals(audio, sample_rate=SAMPLE_RATE):
+    """
+    Returns the (start, end) sample ranges to keep: everything except leading and
+    trailing silence and the middle of pauses longer than MAX_SILENCE_SECONDS.
+    """
+    frame = int(sample_rate * FRAME_SECONDS)
+    energy = _frame_energy(audio, frame)
+    if len(energy) == 0:
+        return [(0, len(audio))]
+
+    loud = np.percentile(energy, 95)
+    threshold = max(10 ** (SILENCE_FLOOR_DB / 20), loud * 10 ** (SILENCE_RELATIVE_DB / 20))
+    silent = energy < threshold
+    if silent.all():
+        return [(0, len(audio))]
+
+    # Runs of silent frames, as [start, end) frame indices.
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    max_silence = int(MAX_SILENCE_SECONDS / FRAME_SECONDS)
+    pad = int(KEEP_SILENCE_SECONDS / FRAME_SECONDS)
+    cuts = []
+    for start, end in zip(run_starts, run_ends):
+        leading, trailing = start == 0, end == len(silent)
+        if not (leading or trailing) and end - start <= max_silence:
+            continue
+        cut_start = start if leading else start + pad
+        cut_end = end if trailing else end - pad
+        if cut_end > cut_start:
+            cuts.append((cut_start * frame, len(audio) if trailing else cut_end * frame))
+
+    intervals, position = [], 0
+    for cut_start, cut_end in cuts:
+        if cut_start > position:
+            intervals.append((position, cut_start))
+        position = cut_end
+    if position < len(audio):
+        intervals.append((position, len(audio)))
+    return intervals or [(0, len(audio))]
+
+def trim_silence(audio, sample_rate=SAMPLE_RATE):
+    """
+    Removes dead air from the audio. Returns the trimmed samples and a timeline of
+    [trimmed_start, original_start, duration] entries in seconds, one per kept interval.
+    """
+    intervals = [(int(start), int(end)) for start, end in find_speech_intervals(audio, sample_rate)]
+    timeline, trimmed_position = [], 0
+    for start, end in intervals:
+        timeline.append([trimmed_position / sample_rate, start / sample_rate, (end - start) / sample_rate])
+        trimmed_position += end - start
+    trimmed = np.concatenate([audio[start:end] for start, end in intervals])
+    return trimmed, timeline
+
+def to_original_time(seconds, timeline):
+    """Maps a position in the trimmed audio back to the original recording."""
+    if not timeline:
+        return seconds
+    index = max(0, bisect.bisect_right([entry[0] for entry in timeline], seconds) - 1)
+    trimmed_start, original_start, duration = timeline[index]
+    return original_start + min(max(0.0, seconds - trimmed_start), duration)
+
+def restore_timestamps(segments, timeline):
+    """Returns transcript segments with start/end shifted back to original-recording time."""
+    return [{**s, 'start': to_original_time(s['start'], timeline), 'end': to_original_time(s['end'], timeline)}
+            for s in segments]
+
+# --- Artifact Storage ---
+def write_prepared(path, audio, sample_rate=SAMPLE_RATE):
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+def load_prepared(path):
+    """Loads a prepared artifact as float32 samples; no ffmpeg or resampling involved."""
+    with wave.open(path, 'rb') as f:
+        frames = f.readframes(f.getnframes())
+    return np.frombuffer(frames, '<i2').astype(np.float32) / 32768.0
+
+# --- Public API ---
+def prepare_audio(audio_path, sample_rate=SAMPLE_RATE):
+    """
+    Decodes and trims an uploaded recording and stores the artifact next to it.
+    Returns {'prepared_path', 'timeline', 'original_seconds', 'prepared_seconds'}.
+    """
+    with span('decode'):
+        audio = decode_audio(audio_path, sample_rate)
+    with span('trim_silence'):
+        trimmed, timeline = trim_silence(audio, sample_rate)
+    prepared_path = os.path.splitext(audio_path)[0] + PREPARED_SUFFIX
+    with span('write_artifact'):
+        write_prepared(prepared_path, trimmed, sample_rate)
+    return {
+        'prepared_path': prepared_path,
+        'timeline': timeline,
+        'original_seconds': len(audio) / sample_rate,
+        'prepared_seconds': len(trimmed) / sample_rate,
+    }
+
+def dump_timeline(timeline):
+    """Serializes a timeline compactly for storage in the queue table."""
+    return json.dumps([[round(value, 3) for value in entry] for entry in timeline], separators=(',', ':'))
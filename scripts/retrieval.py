@@ -0,0 +1,162 @@
+"""
+retrieval.py
+
+Per-session passage retrieval for the LectureScribe chat assistant.
+
+This module keeps chat prompts small by sending only the parts of a lecture that are relevant to the question. It provides:
+
+- Splitting of notes and transcripts into short, overlapping passages, with transcript passages labelled by the time they start in the recording.
+- A BM25 index over those passages, built once per session revision.
+- Ranked top-k passage search for a chat question, with a sensible fallback for questions that match nothing.
+- An in-memory cache of built indexes so a chat turn does not reload the session's documents.
+
+Only the standard library is used, so the index works on the same machines as the rest of the application.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import re
+import math
+import bisect
+import threading
+from collections import Counter, OrderedDict
+
+# --- Configuration ---
+PASSAGE_WORDS = 120             # Target passage length
+PASSAGE_OVERLAP_WORDS = 20      # Words shared by neighbouring transcript passages
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_CACHE_SIZE = 32           # Loaded indexes kept in memory
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have he her his how i if in into is it its
+me my no not of on or our she so than that the their them then there these they this to too up us
+was we were what when where which who why will with would you your
+""".split())
+
+# --- Text Processing ---
+def tokenize(text):
+    return [term for term in re.findall(r"[a-z0-9]+", text.lower()) if term not in STOPWORDS]
+
+def format_timestamp(seconds):
+    """Formats a position in the recording as M:SS, or H:MM:SS from an hour on."""
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+def _split_words(text, source, words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP_WORDS, timestamps=None):
+    """
+    Splits text into passages of about words words. timestamps, if given, is a pair of
+    sorted lists (text offsets, start seconds) of the transcript's segments; each
+    passage then records the time its first word was spoken.
+    """
+    matches = list(re.finditer(r"\S+", text))
+    step = max(1, words - overlap)
+    passages = []
+    for i in range(0, max(1, len(matches) - overlap), step):
+        window = matches[i:i + words]
+        if not window:
+            continue
+        passage = {'source': source, 'text': " ".join(m.group() for m in window)}
+        if timestamps and timestamps[0]:
+            offsets, starts = timestamps
+            passage['start'] = starts[max(0, bisect.bisect_right(offsets, window[0].start()) - 1)]
+        passages.append(passage)
+    return passages
+
+def _split_markdown(text, source, words=PASSAGE_WORDS):
+    """Splits notes on headings and blank lines, packing small blocks together up to the passage size."""
+    passages, current = [], []
+    for block in re.split(r'\n\s*\n|\n(?=#)', text):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block.split()) > words:
+            if current:
+                passages.append({'source': source, 'text': "\n".join(current)})
+                current = []
+            passages.extend(_split_words(block, source, words, overlap=0))
+            continue
+        if current and len("\n".join(current + [block]).split()) > words:
+            passages.append({'source': source, 'text': "\n".join(current)})
+            current = []
+        current.append(block)
+    if current:
+        passages.append({'source': source, 'text': "\n".join(current)})
+    return passages
+
+# --- Index ---
+class RetrievalIndex:
+    """A BM25 index over the passages of one session."""
+
+    def __init__(self, passages):
+        self.passages = passages
+        self.term_freqs = [Counter(tokenize(p['text'])) for p in passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        doc_freqs = Counter(term for tf in self.term_freqs for term in tf)
+        total = len(passages)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    @classmethod
+    def build(cls, notes, transcript, timestamps=None):
+        return cls(_split_markdown(notes, 'notes') + _split_words(transcript, 'transcript', timestamps=timestamps))
+
+    def search(self, query, top_k=6, sources=None):
+        """
+        Returns the top_k passages for the query, in their original order, optionally
+        only from the given sources ('notes', 'transcript'). If nothing matches, the
+        opening passages of the notes (title and TL;DR) are returned.
+        """
+        scores = []
+        query_terms = set(tokenize(query))
+        for position, (tf, length) in enumerate(zip(self.term_freqs, self.lengths)):
+            if sources and self.passages[position]['source'] not in sources:
+                continue
+            score = 0.0
+            for term in query_terms:
+                freq = tf.get(term)
+                if freq:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_length or 1))
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, position))
+
+        if scores:
+            positions = [position for _, position in sorted(scores, reverse=True)[:top_k]]
+        else:
+            allowed = [i for i, p in enumerate(self.passages) if not sources or p['source'] in sources]
+            positions = [i for i in allowed if self.passages[i]['source'] == 'notes'][:top_k] or allowed[:top_k]
+        return [self.passages[i] for i in sorted(positions)]
+
+# --- Session Index Cache ---
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def get_session_index(key, revision, load_documents):
+    """
+    Returns the index for a session. It is rebuilt from load_documents(), which
+    returns (notes, transcript) or (notes, transcript, timestamps), only when the
+    session's revision has changed.
+    """
+    with _index_cache_lock:
+        cached = _index_cache.get(key)
+        if cached and cached[0] == revision:
+            _index_cache.move_to_end(key)
+            return cached[1]
+    index = RetrievalIndex.build(*load_documents())
+    with _index_cache_lock:
+        _index_cache[key] = (revision, index)
+        _index_cache.move_to_end(key)
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
+
+def format_passages(passages):
+    return "\n\n".join(
+        f"[{p['source'].title()}{' at ' + format_timestamp(p['start']) if 'start' in p else ''}] {p['text']}"
+        for p in passages
+    )
@@ -6,9 +6,12 @@ document.addEventListener('DOMContentLoaded', () => {
     const loader = document.getElementById('loader');
     const loaderText = document.getElementById('loader-text');
     const loaderStatus = document.getElementById('loader-status');
+    const cancelJobBtn = document.getElementById('cancel-job-btn');
     const progressContainer = document.getElementById('progress-container');
     const progressBar = document.getElementById('progress-bar');
     const historyList = document.getElementById('history-list');
+    const searchInput = document.getElementById('search-input');
+    const searchResults = document.getElementById('search-results');
     const notesOutput = document.getElementById('notes-output');
     const transcriptionOutput = document.getElementById('transcription-output');
     const chatMessages = document.getElementById('chat-messages');
@@ -39,7 +42,11 @@ document.addEventListener('DOMContentLoaded', () => {
     let audioChunks = [];
     let currentTranscriptId = null;
     let transcriptToMove = null;
-    let pollingInterval = null;
+    let trackedJob = null;
+    let latestQueueStatus = null;
+    let historyReloadTimer = null;
+    let searchTimer = null;
+    let searchRequest = 0;
     let audioContext, analyser, dataArray, source, animationFrameId;
 
     // --- Core Functions ---
@@ -155,6 +162,68 @@ document.addEventListener('DOMContentLoaded', () => {
         return div;
     };
 
+    // --- Search ---
+    const SEARCH_DEBOUNCE_MS = 250;
+
+    const showTab = (tabName) => {
+        tabBtns.forEach(b => b.classList.toggle('active', b.dataset.tab === tabName));
+        tabPanes.forEach(p => p.classList.toggle('active', p.id === tabName));
+    };
+
+    const runSearch = async (query) => {
+        const requestNumber = ++searchRequest;
+        try {
+            const response = await fetch(`/search?q=${encodeURIComponent(query)}`);
+            if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
+            const data = await response.json();
+            if (requestNumber !== searchRequest) return;  // A newer search has started
+            renderSearchResults(data.results);
+        } catch (error) {
+            console.error('Search failed:', error);
+            if (requestNumber === searchRequest) searchResults.innerHTML = '<p class="placeholder">Search failed.</p>';
+        }
+    };
+
+    const renderSearchResults = (results) => {
+        searchResults.innerHTML = '';
+        if (results.length === 0) {
+            searchResults.innerHTML = '<p class="placeholder">No matches.</p>';
+            return;
+        }
+        results.forEach(hit => {
+            const div = document.createElement('div');
+            div.className = 'search-result';
+            const name = document.createElement('p');
+            name.className = 'filename';
+            name.textContent = hit.filename || 'Recording';
+            const source = document.createElement('p');
+            source.className = 'search-source';
+            source.textContent = hit.kind === 'notes' ? 'Notes' : `Transcript, page ${hit.page + 1}`;
+            const snippet = document.createElement('p');
+            snippet.className = 'search-snippet';
+            snippet.innerHTML = hit.snippet;  // Escaped by the server; only <mark> tags are added
+            div.append(name, source, snippet);
+            div.addEventListener('click', async () => {
+                await loadSession(hit.transcript_id);
+                showTab(hit.kind === 'notes' ? 'notes' : 'transcription');
+            });
+            searchResults.appendChild(div);
+        });
+    };
+
+    const onSearchInput = () => {
+        clearTimeout(searchTimer);
+        const query = searchInput.value.trim();
+        searchResults.classList.toggle('hidden', query === '');
+        historyList.classList.toggle('hidden', query !== '');
+        if (query === '') {
+            searchRequest++;
+            searchResults.innerHTML = '';
+            return;
+        }
+        searchTimer = setTimeout(() => runSearch(query), SEARCH_DEBOUNCE_MS);
+    };
+
     const loadSession = async (transcriptId) => {
         showLoader(true, 'Loading session...');
         try {
@@ -163,9 +232,15 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await response.json();
             
             currentTranscriptId = transcriptId;
-            renderNotes(data.notes_markdown);
-            renderTranscription(data.transcript_text);
-            renderChatHistory(data.chat_history);
+            if (data.notes_status === 'pending') {
+                notesOutput.innerHTML = '<div class="placeholder-content"><h3>Generating notes...</h3><p>The transcript is ready. Your notes will appear here as soon as they are generated.</p></div>';
+            } else if (data.notes_status === 'failed') {
+                renderJobFailure('Notes Failed', 'The transcript is ready, but the notes could not be generated.', data.notes_job_id);
+            } else {
+                renderNotes(data.notes_markdown);
+            }
+            renderTranscription(data.transcript_text, data.transcript_pages);
+            renderChatHistory(data.chat_history, data.chat_has_more);
             enableChat(true);
             
             document.querySelectorAll('.history-item').forEach(item => {
@@ -178,92 +253,242 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
     
-    const sendAudioForTranscription = (audioData, fileName) => {
-        const formData = new FormData();
-        formData.append('audio', audioData, fileName);
+    // --- Resumable Chunked Upload ---
+    const UPLOAD_RETRY_LIMIT = 8;
+    const uploadKey = (audioData, fileName) => `upload:${fileName}:${audioData.size}:${audioData.lastModified || ''}`;
+    const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+    const uploadErrorMessage = async (response) => {
+        try {
+            const errData = await response.json();
+            return errData.error || `HTTP error! Status: ${response.status}`;
+        } catch (e) {
+            return `HTTP error! Status: ${response.status}`;
+        }
+    };
+
+    // Resumes a previous upload of the same file if the server still has it, otherwise starts a new one.
+    const openUpload = async (audioData, fileName) => {
+        const savedId = localStorage.getItem(uploadKey(audioData, fileName));
+        if (savedId) {
+            const response = await fetch(`/uploads/${savedId}`);
+            if (response.ok) {
+                const state = await response.json();
+                if (state.status === 'uploading' || state.status === 'complete') return state;
+            }
+            localStorage.removeItem(uploadKey(audioData, fileName));
+        }
+        const response = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: fileName, size: audioData.size })
+        });
+        if (!response.ok) throw new Error(await uploadErrorMessage(response));
+        const state = await response.json();
+        localStorage.setItem(uploadKey(audioData, fileName), state.upload_id);
+        return state;
+    };
+
+    const sendChunk = (uploadId, chunk, offset, onProgress) => new Promise((resolve) => {
+        const xhr = new XMLHttpRequest();
+        xhr.open('PUT', `/uploads/${uploadId}?offset=${offset}`, true);
+        xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+        xhr.upload.onprogress = (event) => onProgress(event.loaded);
+        xhr.onload = () => {
+            let body = {};
+            try { body = JSON.parse(xhr.responseText); } catch (e) {}
+            resolve({ status: xhr.status, body });
+        };
+        xhr.onerror = () => resolve({ status: 0, body: {} });
+        xhr.send(chunk);
+    });
 
+    const sendAudioForTranscription = async (audioData, fileName) => {
         showLoader(true, 'Uploading...');
         loaderStatus.textContent = '';
         progressContainer.classList.remove('hidden');
+        const showProgress = (bytes) => {
+            progressBar.style.width = Math.round((bytes / audioData.size) * 100) + '%';
+        };
 
-        const xhr = new XMLHttpRequest();
-        xhr.open('POST', '/transcribe', true);
-
-        xhr.upload.onprogress = (event) => {
-            if (event.lengthComputable) {
-                const percentComplete = Math.round((event.loaded / event.total) * 100);
-                progressBar.style.width = percentComplete + '%';
-                if (percentComplete === 100) {
-                    loaderText.textContent = 'Queued...';
-                    loaderStatus.textContent = 'Your file is in line for transcription.';
+        try {
+            let state = await openUpload(audioData, fileName);
+            const chunkSize = state.chunk_size || 8 * 1024 * 1024;
+            let failures = 0;
+
+            while (state.status === 'uploading' && state.offset < state.size) {
+                const offset = state.offset;
+                showProgress(offset);
+                const chunk = audioData.slice(offset, Math.min(offset + chunkSize, audioData.size));
+                const { status, body } = await sendChunk(state.upload_id, chunk, offset, (loaded) => showProgress(offset + loaded));
+                if ((status >= 200 && status < 300) || status === 409) {
+                    // 409 means the server holds a different offset; continue from there.
+                    state = { ...state, ...body };
+                    failures = 0;
+                    continue;
                 }
+                if (status >= 400 && status < 500) throw new Error(body.error || `HTTP error! Status: ${status}`);
+
+                // Network drop or server error: wait, then resume from what the server actually has.
+                failures += 1;
+                if (failures > UPLOAD_RETRY_LIMIT) throw new Error('Could not connect to the server.');
+                loaderStatus.textContent = 'Connection lost, resuming upload...';
+                await sleep(Math.min(30000, 1000 * 2 ** failures));
+                const response = await fetch(`/uploads/${state.upload_id}`).catch(() => null);
+                if (response && response.ok) state = { ...state, ...(await response.json()) };
             }
-        };
 
-        xhr.onload = async () => {
-            if (xhr.status >= 200 && xhr.status < 300) {
-                const data = JSON.parse(xhr.responseText);
-                startPolling(data.job_id);
-            } else {
-                let errorMessage = `HTTP error! Status: ${xhr.status}`;
-                try {
-                    const errData = JSON.parse(xhr.responseText);
-                    errorMessage = errData.error || errorMessage;
-                } catch (e) {}
-                renderNotes(`<h2>Upload Failed</h2><p>${errorMessage}</p>`);
-                showLoader(false);
+            if (!state.job_id && !state.transcript_id) {
+                // The reply to the last chunk was lost; ask the server to finish the upload.
+                const response = await fetch(`/uploads/${state.upload_id}/finalize`, { method: 'POST' });
+                if (!response.ok) throw new Error(await uploadErrorMessage(response));
+                state = { ...state, ...(await response.json()) };
             }
-        };
-        
-        xhr.onerror = () => {
-            renderNotes(`<h2>Upload Failed</h2><p>Could not connect to the server.</p>`);
+            localStorage.removeItem(uploadKey(audioData, fileName));
+            progressBar.style.width = '100%';
+
+            if (state.job_id) {
+                loaderText.textContent = 'Queued...';
+                loaderStatus.textContent = 'Your file is in line for transcription.';
+                trackJob(state.job_id);
+            } else if (state.transcript_id) {
+                // Identical audio was processed before; open the existing session.
+                await loadHistory();
+                await loadSession(state.transcript_id);
+            }
+        } catch (error) {
+            renderNotes(`<h2>Upload Failed</h2><p>${error.message}</p>`);
             showLoader(false);
-        };
+        }
+    };
 
-        xhr.send(formData);
+    // --- Job Tracking (pushed over /events) ---
+    const trackJob = async (jobId) => {
+        trackedJob = { id: jobId, transcriptId: null };
+        await refreshTrackedJob();
     };
 
-    const startPolling = (jobId) => {
-        stopPolling(); 
+    // Fetches the tracked job's state once, e.g. after (re)connecting to the event stream.
+    const refreshTrackedJob = async () => {
+        if (!trackedJob) return;
+        const jobId = trackedJob.id;
+        try {
+            const response = await fetch(`/status/${jobId}`);
+            if (!response.ok) return;
+            const data = await response.json();
+            await handleJobUpdate({ ...data, job_id: jobId });
+        } catch (error) {
+            console.error('Status error:', error);
+        }
+    };
 
-        pollingInterval = setInterval(async () => {
-            try {
-                const response = await fetch(`/status/${jobId}`);
-                if (!response.ok) return;
+    const handleJobUpdate = async (data) => {
+        if (!trackedJob || data.job_id !== trackedJob.id) return;
+        // Jobs can be cancelled until their transcript has been saved.
+        cancelJobBtn.classList.toggle('hidden', !['queued', 'preparing', 'prepared', 'processing'].includes(data.status));
+
+        if (data.status === 'processing') {
+            const progress = Math.round(data.progress || 0);
+            showLoader(true, 'Transcribing...', progress > 0 ? `${progress}% of the audio transcribed.` : 'This may take a few moments.');
+            progressContainer.classList.remove('hidden');
+            progressBar.style.width = `${progress}%`;
+        } else if (data.status === 'transcribed' || data.status === 'generating_notes') {
+            // The transcript is viewable while the notes are still being generated.
+            if (data.transcript_id && trackedJob.transcriptId !== data.transcript_id) {
+                trackedJob.transcriptId = data.transcript_id;
+                await loadSession(data.transcript_id);
+            }
+        } else if (data.status === 'completed') {
+            const transcriptId = data.transcript_id || trackedJob.transcriptId;
+            trackedJob = null;
+            await loadHistory();
+            if (transcriptId) {
+                await loadSession(transcriptId);
+            } else {
+                showLoader(false);
+            }
+        } else if (data.status === 'failed') {
+            const jobId = trackedJob.id;
+            trackedJob = null;
+            renderJobFailure('Transcription Failed', data.error_message || 'An unknown error occurred.', jobId);
+            showLoader(false);
+        } else if (data.status === 'cancelled') {
+            trackedJob = null;
+            renderNotes('<h2>Transcription Cancelled</h2><p>The upload was removed from the queue.</p>');
+            showLoader(false);
+        } else if (data.status === 'preparing') {
+            showLoader(true, 'Preparing audio...', 'Decoding the recording and skipping silence.');
+        } else if (data.status === 'queued' || data.status === 'prepared') {
+            const position = data.position ? `Position ${data.position} in the queue.` : 'Waiting for another job to finish.';
+            const eta = data.eta_seconds ? ` Ready in about ${formatDuration(data.eta_seconds)}.` : '';
+            const retry = data.attempts ? ` Retrying after an error (attempt ${data.attempts + 1}).` : '';
+            showLoader(true, 'In Queue...', position + eta + retry);
+        }
+    };
 
-                const data = await response.json();
-                
-                if (data.status === 'processing') {
-                    showLoader(true, 'Transcribing...', 'This may take a few moments.');
-                } else if (data.status === 'completed') {
-                    stopPolling();
-                    await loadHistory();
-                    if(data.transcript_id) {
-                        await loadSession(data.transcript_id);
-                    } else {
-                        showLoader(false);
-                    }
-                } else if (data.status === 'failed') {
-                    stopPolling();
-                    renderNotes(`<h2>Transcription Failed</h2><p>${data.error_message || 'An unknown error occurred.'}</p>`);
-                    showLoader(false);
-                } else if (data.status === 'queued') {
-                    showLoader(true, 'In Queue...', 'Waiting for another job to finish.');
-                }
+    const cancelTrackedJob = async () => {
+        if (!trackedJob || !confirm('Cancel this transcription?')) return;
+        const jobId = trackedJob.id;
+        cancelJobBtn.disabled = true;
+        try {
+            const response = await fetch(`/jobs/${jobId}/cancel`, { method: 'POST' });
+            if (!response.ok) throw new Error((await response.json()).error);
+            await handleJobUpdate({ job_id: jobId, status: 'cancelled' });
+        } catch (error) {
+            alert(`Could not cancel: ${error.message}`);
+        } finally {
+            cancelJobBtn.disabled = false;
+        }
+    };
 
+    // Shows a failed job with a button that queues it again from the stage it failed in.
+    const renderJobFailure = (title, message, jobId) => {
+        notesOutput.innerHTML = `<div class="placeholder-content"><h3></h3><p></p></div>`;
+        notesOutput.querySelector('h3').textContent = title;
+        notesOutput.querySelector('p').textContent = message;
+        if (!jobId) return;
+        const button = document.createElement('button');
+        button.className = 'load-more-btn';
+        button.textContent = 'Retry';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                const response = await fetch(`/jobs/${jobId}/retry`, { method: 'POST' });
+                if (!response.ok) throw new Error((await response.json()).error);
+                showLoader(true, 'In Queue...', 'Retrying...');
+                await trackJob(jobId);
             } catch (error) {
-                console.error('Polling error:', error);
+                alert(`Could not retry: ${error.message}`);
+                button.disabled = false;
             }
-        }, 3000);
+        });
+        notesOutput.querySelector('.placeholder-content').appendChild(button);
     };
 
-    const stopPolling = () => {
-        if (pollingInterval) {
-            clearInterval(pollingInterval);
-            pollingInterval = null;
-        }
+    // Formats an estimate in seconds as a short, human-readable duration.
+    const formatDuration = (seconds) => {
+        if (seconds < 60) return 'a minute';
+        const minutes = Math.round(seconds / 60);
+        if (minutes < 60) return `${minutes} min`;
+        const hours = Math.floor(minutes / 60);
+        return minutes % 60 ? `${hours} h ${minutes % 60} min` : `${hours} h`;
+    };
+
+    const scheduleHistoryReload = () => {
+        clearTimeout(historyReloadTimer);
+        historyReloadTimer = setTimeout(loadHistory, 250);
     };
 
+    const connectEvents = () => {
+        const source = new EventSource('/events');
+        source.addEventListener('open', refreshTrackedJob);
+        source.addEventListener('job', (e) => handleJobUpdate(JSON.parse(e.data)));
+        source.addEventListener('queue', (e) => {
+            latestQueueStatus = JSON.parse(e.data);
+            if (!statusModal.classList.contains('hidden')) renderQueueStatus(latestQueueStatus);
+        });
+        source.addEventListener('history', scheduleHistoryReload);
+    };
 
     const openMoveModal = (transcriptId, folders) => {
         transcriptToMove = transcriptId;
@@ -373,6 +598,7 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!isLoading) {
             progressContainer.classList.add('hidden');
             progressBar.style.width = '0%';
+            cancelJobBtn.classList.add('hidden');
         }
     };
     
@@ -380,29 +606,150 @@ document.addEventListener('DOMContentLoaded', () => {
         notesOutput.innerHTML = markdown ? marked.parse(markdown) : '<div class="placeholder-content"><h3>Error</h3><p>Received empty notes from the server.</p></div>';
     };
 
-    const renderTranscription = (text) => {
+    // Renders the first transcript page; later pages are fetched only when asked for.
+    const renderTranscription = (text, pages = 1) => {
         if (!text || text.trim() === '') {
             transcriptionOutput.innerHTML = '<div class="placeholder-content"><h3>Transcription is empty.</h3></div>';
             return;
         }
         transcriptionOutput.innerHTML = marked.parse(text);
+        if (pages > 1) addTranscriptLoader(currentTranscriptId, 1, pages);
     };
 
-    const renderChatHistory = (history) => {
+    const addTranscriptLoader = (transcriptId, page, pages) => {
+        const button = document.createElement('button');
+        button.className = 'load-more-btn';
+        button.textContent = `Show more of the transcript (${page + 1} of ${pages})`;
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                const response = await fetch(`/session/${transcriptId}/transcript?page=${page}`);
+                if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
+                const data = await response.json();
+                if (transcriptId !== currentTranscriptId) return;
+                button.remove();
+                transcriptionOutput.insertAdjacentHTML('beforeend', marked.parse(data.text));
+                if (page + 1 < data.pages) addTranscriptLoader(transcriptId, page + 1, data.pages);
+            } catch (error) {
+                button.disabled = false;
+                alert(`Failed to load the transcript: ${error.message}`);
+            }
+        });
+        transcriptionOutput.appendChild(button);
+    };
+
+    const createChatBubble = (message, sender) => {
+        const messageEl = document.createElement('div');
+        messageEl.className = `chat-bubble ${sender}-bubble`;
+        messageEl.innerHTML = marked.parse(message);
+        return messageEl;
+    };
+
+    // Renders the most recent messages; earlier ones are fetched a page at a time.
+    const renderChatHistory = (history, hasMore = false) => {
         chatMessages.innerHTML = '';
         if (history && history.length > 0) {
+            if (hasMore) addChatHistoryLoader(currentTranscriptId, history[0].id);
             history.forEach(chat => addChatMessage(chat.message, chat.sender));
         } else {
             addChatMessage("Hello! Ask me anything about the loaded lecture notes.", 'ai');
         }
     };
+
+    const addChatHistoryLoader = (transcriptId, beforeId) => {
+        const button = document.createElement('button');
+        button.className = 'load-more-btn';
+        button.textContent = 'Load earlier messages';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                const response = await fetch(`/session/${transcriptId}/chat?before=${beforeId}`);
+                if (!response.ok) throw new Error(`HTTP error! Status: ${response.status}`);
+                const data = await response.json();
+                if (transcriptId !== currentTranscriptId) return;
+                const previousHeight = chatMessages.scrollHeight;
+                button.remove();
+                const fragment = document.createDocumentFragment();
+                data.messages.forEach(chat => fragment.appendChild(createChatBubble(chat.message, chat.sender)));
+                chatMessages.prepend(fragment);
+                if (data.has_more && data.messages.length > 0) addChatHistoryLoader(transcriptId, data.messages[0].id);
+                // Keep the messages the user was reading in place.
+                chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+            } catch (error) {
+                button.disabled = false;
+                alert(`Failed to load earlier messages: ${error.message}`);
+            }
+        });
+        chatMessages.prepend(button);
+    };
     
     const addChatMessage = (message, sender) => {
+        chatMessages.appendChild(createChatBubble(message, sender));
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    };
+
+    // Posts a question to /chat/stream and renders the answer as its Server-Sent Events arrive.
+    const streamChatResponse = async (userMessage) => {
+        const response = await fetch('/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ message: userMessage }),
+        });
+        if (!response.ok || !response.body) {
+            let errorMessage = 'Failed to get response.';
+            try {
+                const data = await response.json();
+                errorMessage = data.error || errorMessage;
+            } catch (e) {}
+            throw new Error(errorMessage);
+        }
+
         const messageEl = document.createElement('div');
-        messageEl.className = `chat-bubble ${sender}-bubble`;
-        messageEl.innerHTML = marked.parse(message);
+        messageEl.className = 'chat-bubble ai-bubble';
         chatMessages.appendChild(messageEl);
-        chatMessages.scrollTop = chatMessages.scrollHeight;
+
+        let answer = '';
+        let renderPending = false;
+        const render = () => {
+            renderPending = false;
+            messageEl.innerHTML = marked.parse(answer);
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+
+                if (eventName === 'token') {
+                    answer += payload.text;
+                } else if (eventName === 'error') {
+                    answer += (answer ? '\n\n' : '') + `Error: ${payload.message}`;
+                }
+                if (!renderPending) {
+                    renderPending = true;
+                    requestAnimationFrame(render);
+                }
+            }
+        }
+        render();
     };
 
     const enableChat = (enabled = true) => {
@@ -526,14 +873,7 @@ document.addEventListener('DOMContentLoaded', () => {
         chatSubmitBtn.disabled = true;
 
         try {
-            const response = await fetch('/chat', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: userMessage }),
-            });
-            const data = await response.json();
-            if (!response.ok) throw new Error(data.error || 'Failed to get response.');
-            addChatMessage(data.response, 'ai');
+            await streamChatResponse(userMessage);
         } catch (error) {
             addChatMessage(`Error: ${error.message}`, 'ai');
         } finally {
@@ -561,38 +901,47 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     tabBtns.forEach(btn => {
-        btn.addEventListener('click', () => {
-            tabBtns.forEach(b => b.classList.remove('active'));
-            tabPanes.forEach(p => p.classList.remove('active'));
-
-            btn.classList.add('active');
-            document.getElementById(btn.dataset.tab).classList.add('active');
-        });
+        btn.addEventListener('click', () => showTab(btn.dataset.tab));
     });
 
+    searchInput.addEventListener('input', onSearchInput);
+
     // --- Modal Event Handlers ---
     confirmMoveBtn.addEventListener('click', moveSession);
     cancelMoveBtn.addEventListener('click', closeMoveModal);
+    cancelJobBtn.addEventListener('click', cancelTrackedJob);
     moveModal.addEventListener('click', (e) => {
         if (e.target === moveModal) closeMoveModal();
     });
 
+    const renderQueueStatus = (data) => {
+        let content = '';
+        const processingFiles = data.processing_files || (data.processing_file ? [data.processing_file] : []);
+        if (processingFiles.length > 0) {
+            content += `<p><strong>Currently Transcribing:</strong><br>${processingFiles.join('<br>')}</p>`;
+        } else {
+            content += '<p>No file is currently being transcribed.</p>';
+        }
+        if (data.notes_files && data.notes_files.length > 0) {
+            content += `<p style="margin-top: 1rem;"><strong>Generating Notes:</strong><br>${data.notes_files.join('<br>')}</p>`;
+        }
+        content += `<p style="margin-top: 1rem;"><strong>Files in Queue:</strong> ${data.queued_count}</p>`;
+        if (data.drain_eta_seconds) {
+            content += `<p><strong>Queue clears in about:</strong> ${formatDuration(data.drain_eta_seconds)}</p>`;
+        }
+        statusModalContent.innerHTML = content;
+    };
+
     statusBtn.addEventListener('click', async () => {
         statusModal.classList.remove('hidden');
+        if (latestQueueStatus) {
+            renderQueueStatus(latestQueueStatus);
+            return;
+        }
         statusModalContent.innerHTML = '<p>Loading status...</p>';
         try {
             const response = await fetch('/queue_status');
-            const data = await response.json();
-            
-            let content = '';
-            if (data.processing_file) {
-                content += `<p><strong>Currently Processing:</strong><br>${data.processing_file}</p>`;
-            } else {
-                content += '<p>No file is currently being processed.</p>';
-            }
-            content += `<p style="margin-top: 1rem;"><strong>Files in Queue:</strong> ${data.queued_count}</p>`;
-            
-            statusModalContent.innerHTML = content;
+            renderQueueStatus(await response.json());
         } catch (error) {
             statusModalContent.innerHTML = '<p>Could not load queue status.</p>';
         }
@@ -638,4 +987,5 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Initial Load ---
     loadHistory();
+    connectEvents();
 });
\ No newline at end of file
@@ -1,6 +1,6 @@
 // static/sw.js
 
-const CACHE_NAME = 'lecturescribe-cache-v1';
+const CACHE_NAME = 'lecturescribe-cache-v12';
 const urlsToCache = [
   '/',
   '/static/style.css',
@@ -0,0 +1,453 @@
+"""
+transcription.py
+
+Chunked, parallel Whisper transcription for the LectureScribe application.
+
+This module splits long recordings into overlapping chunks and transcribes them concurrently. It provides:
+
+- Pluggable transcription backends: openai-whisper, an int8-quantized CTranslate2 engine (faster-whisper), or any class named as "module:Class".
+- Silence-aware chunk planning, so chunk boundaries fall in pauses rather than mid-word.
+- A persistent pool of worker processes, each holding its own model.
+- A model manager that unloads idle models, keeps resident models within a memory budget and reports their memory use.
+- Stitching of chunk results into a single transcript with de-duplicated overlaps.
+- Per-chunk checkpoints, so an interrupted transcription resumes without redoing finished chunks.
+
+Long lectures are transcribed as many independent chunks in parallel instead of one serial pass, while short recordings still go through a single call.
+
+Author: Jaspreet Jawanda
+Email: jaspreetjawanda@proton.me
+Version: 2.1
+Status: Production
+"""
+
+import os
+import re
+import time
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import preprocess
+
+# --- Configuration ---
+TRANSCRIBE_BACKEND = os.environ.get('LECTURESCRIBE_TRANSCRIBE_BACKEND', 'openai-whisper')
+WHISPER_MODEL_NAME = os.environ.get('LECTURESCRIBE_WHISPER_MODEL', 'medium')
+FASTER_WHISPER_COMPUTE_TYPE = os.environ.get('LECTURESCRIBE_COMPUTE_TYPE', 'int8')
+SAMPLE_RATE = preprocess.SAMPLE_RATE
+
+TRANSCRIBE_PROCESSES = int(os.environ.get('LECTURESCRIBE_TRANSCRIBE_PROCESSES', '1'))
+CHUNK_SECONDS = 300             # Target length of a chunk
+CHUNK_OVERLAP_SECONDS = 2       # Audio shared by neighbouring chunks
+SILENCE_SEARCH_SECONDS = 20     # How far around the target boundary to look for a pause
+MIN_CHUNKED_SECONDS = 600       # Shorter recordings are transcribed in a single call
+
+FRAME_SECONDS = 0.02
+QUIET_WINDOW_SECONDS = 0.5
+
+# --- Backends ---
+def get_device():
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+class TranscriptionBackend:
+    """
+    Interface of a transcription engine. A backend loads its model once in
+    __init__ and then transcribes 16 kHz mono float32 audio, returning
+    {'segments': [{'start': ..., 'end': ..., 'text': ...}]} with times in seconds.
+    """
+
+    name = None
+
+    def __init__(self, model_name=WHISPER_MODEL_NAME, threads=None):
+        self.model_name = model_name
+        self.threads = threads
+
+    def transcribe(self, audio):
+        raise NotImplementedError
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """The reference openai-whisper implementation (PyTorch)."""
+
+    name = 'openai-whisper'
+
+    def __init__(self, model_name=WHISPER_MODEL_NAME, threads=None):
+        super().__init__(model_name, threads)
+        import torch
+        import whisper
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = get_device()
+        print(f"Loading Whisper model '{model_name}' on device: {self.device}")
+        self.model = whisper.load_model(model_name, device=self.device)
+
+    def transcribe(self, audio):
+        result = self.model.transcribe(audio, fp16=self.device == "cuda")
+        return {'segments': [{'start': s['start'], 'end': s['end'], 'text': s['text']} for s in result['segments']]}
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """CTranslate2-based Whisper (faster-whisper), int8-quantized on CPU by default."""
+
+    name = 'faster-whisper'
+
+    def __init__(self, model_name=WHISPER_MODEL_NAME, threads=None):
+        super().__init__(model_name, threads)
+        from faster_whisper import WhisperModel
+        device = get_device()
+        compute_type = FASTER_WHISPER_COMPUTE_TYPE if device == "cpu" else "float16"
+        print(f"Loading faster-whisper model '{model_name}' on device: {device} ({compute_type})")
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=threads or 0)
+
+    def transcribe(self, audio):
+        segments, _ = self.model.transcribe(audio, beam_size=5)
+        return {'segments': [{'start': s.start, 'end': s.end, 'text': s.text} for s in segments]}
+
+BACKENDS = {backend.name: backend for backend in (OpenAIWhisperBackend, FasterWhisperBackend)}
+
+def get_backend_class(name):
+    """Resolves a backend by registry name or as "package.module:ClassName"."""
+    if name in BACKENDS:
+        return BACKENDS[name]
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), class_name)
+    raise ValueError(f"Unknown transcription backend '{name}'. Available: {', '.join(BACKENDS)}")
+
+def load_backend(backend=TRANSCRIBE_BACKEND, model_name=WHISPER_MODEL_NAME, threads=None):
+    """Creates a backend instance with its model loaded."""
+    return get_backend_class(backend)(model_name, threads=threads)
+
+# --- Chunk Planning ---
+def _frame_energy(audio):
+    """Returns the RMS energy of consecutive frames of the signal."""
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    usable = len(audio) - len(audio) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:usable].reshape(-1, frame)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+def _quietest_point(energy, lo_frame, hi_frame):
+    """Returns the frame index at the centre of the quietest window in [lo_frame, hi_frame)."""
+    window = max(1, int(QUIET_WINDOW_SECONDS / FRAME_SECONDS))
+    segment = energy[lo_frame:hi_frame]
+    if len(segment) <= window:
+        return (lo_frame + hi_frame) // 2
+    smoothed = np.convolve(segment, np.ones(window) / window, mode='valid')
+    return lo_frame + int(np.argmin(smoothed)) + window // 2
+
+def plan_chunks(audio, chunk_seconds=CHUNK_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS):
+    """
+    Splits the audio into chunks that end on silence.
+
+    Returns a list of (core_start, core_end, start, end) sample offsets: the core
+    ranges tile the recording exactly, while [start, end) adds the overlap that
+    is actually transcribed.
+    """
+    total = len(audio)
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+    search = int(SILENCE_SEARCH_SECONDS * SAMPLE_RATE)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+
+    energy = _frame_energy(audio)
+    boundaries = [0]
+    while total - boundaries[-1] > chunk + search:
+        target = boundaries[-1] + chunk
+        cut_frame = _quietest_point(energy, (target - search) // frame, (target + search) // frame)
+        boundaries.append(cut_frame * frame)
+    boundaries.append(total)
+
+    chunks = []
+    for core_start, core_end in zip(boundaries, boundaries[1:]):
+        chunks.append((core_start, core_end, max(0, core_start - overlap), min(total, core_end + overlap)))
+    return chunks
+
+# --- Stitching ---
+def _normalize_word(word):
+    return re.sub(r'[^\w]', '', word.lower())
+
+def _merge_overlap(left_words, right_words, max_overlap=40):
+    """Returns how many leading words of right_words repeat the tail of left_words."""
+    left_norm = [_normalize_word(w) for w in left_words[-max_overlap:]]
+    right_norm = [_normalize_word(w) for w in right_words[:max_overlap]]
+    for size in range(min(len(left_norm), len(right_norm)), 1, -1):
+        if left_norm[-size:] == right_norm[:size]:
+            return size
+    return 0
+
+def stitch_chunks(chunk_results):
+    """
+    Joins per-chunk results (ordered by time) into one transcript.
+
+    Segments are kept only if their midpoint falls in their chunk's core range,
+    which removes most of the overlap; any words still repeated across a seam
+    are then dropped from the start of the later chunk.
+
+    Each returned segment also carries 'offset', the position in the text where
+    its first kept word starts. Segments left without words are omitted.
+    """
+    words = []
+    segments = []
+    length = 0      # len(" ".join(words)), kept as words are added
+    for result in chunk_results:
+        core_start = result['core_start'] / SAMPLE_RATE
+        core_end = result['core_end'] / SAMPLE_RATE
+        kept = [s for s in result['segments'] if core_start <= (s['start'] + s['end']) / 2 < core_end]
+        segment_words = [s['text'].split() for s in kept]
+        skip = _merge_overlap(words, [w for sw in segment_words for w in sw]) if words else 0
+        for segment, seg_words in zip(kept, segment_words):
+            dropped = min(skip, len(seg_words))
+            skip -= dropped
+            seg_words = seg_words[dropped:]
+            if not seg_words:
+                # Entirely a repeat of the previous chunk (or blank): nothing of it is in the text.
+                continue
+            offset = length + 1 if words else length
+            for word in seg_words:
+                length += len(word) + (1 if words else 0)
+                words.append(word)
+            segments.append({**segment, 'offset': offset})
+    return {'text': " ".join(words), 'segments': segments}
+
+# --- Chunk Worker Processes ---
+_chunk_backend = None
+
+def _init_chunk_worker(backend, model_name, threads):
+    """Initializer for chunk worker processes: loads one model per process."""
+    global _chunk_backend
+    _chunk_backend = load_backend(backend, model_name, threads)
+
+def _transcribe_chunk(chunk_audio, core_start, core_end, start):
+    """Transcribes one chunk and shifts its segment timestamps to the full recording."""
+    result = _chunk_backend.transcribe(chunk_audio)
+    offset = start / SAMPLE_RATE
+    segments = [{'start': s['start'] + offset, 'end': s['end'] + offset, 'text': s['text']} for s in result['segments']]
+    return {'core_start': core_start, 'core_end': core_end, 'segments': segments}
+
+# --- Model Residency ---
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MODEL_IDLE_SECONDS = int(os.environ.get('LECTURESCRIBE_MODEL_IDLE_SECONDS', '900'))   # Unload models unused this long; 0 keeps them
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('LECTURESCRIBE_MODEL_MEMORY_MB', '0'))    # Resident model memory for all workers; 0 keeps one model per worker
+# Typical resident size of one chunk process per model, used until a loaded model has been measured.
+MODEL_MEMORY_ESTIMATES_MB = {'tiny': 400, 'base': 550, 'small': 1200, 'medium': 3000, 'large': 6000}
+COMPACT_BACKENDS = {'faster-whisper': 0.4}     # Fraction of the estimate needed by quantized engines
+
+def _process_rss_mb(pid):
+    """Resident memory of a process in MB, or None where it cannot be read."""
+    try:
+        if psutil is not None:
+            return psutil.Process(pid).memory_info().rss / 2 ** 20
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except Exception:
+        # Best effort: the process may have exited, or there is no /proc (Windows without psutil).
+        return None
+
+class ModelManager:
+    """
+    Keeps one chunk process pool (one model per process) per backend and model of a
+    worker. Pools are loaded on demand, unloaded after MODEL_IDLE_SECONDS without
+    use, and the least recently used ones are unloaded first when loading another
+    would exceed the memory budget; without a budget, loading a model unloads the
+    others. Unloading ends the processes, which is the only way to hand a PyTorch
+    model's memory back to the operating system.
+    """
+
+    def __init__(self, processes=TRANSCRIBE_PROCESSES, budget_mb=MODEL_MEMORY_BUDGET_MB, idle_seconds=MODEL_IDLE_SECONDS):
+        self.processes = processes
+        self.budget_mb = budget_mb
+        self.idle_seconds = idle_seconds
+        self.threads = None
+        self._pools = {}            # (backend, model_name) -> {'pool', 'processes', 'loaded_at', 'last_used', 'resident_mb'}
+        self._measured_mb = {}      # (backend, model_name) -> largest measured size of one chunk process
+        self._lock = threading.Lock()
+
+    def estimate_mb(self, backend, model_name, processes):
+        per_process = self._measured_mb.get((backend, model_name))
+        if per_process is None:
+            per_process = MODEL_MEMORY_ESTIMATES_MB.get(model_name.split('.')[0].split('-')[0], MODEL_MEMORY_ESTIMATES_MB['medium'])
+            per_process *= COMPACT_BACKENDS.get(backend, 1.0)
+        return per_process * processes
+
+    def _resident_mb(self, entry, key):
+        return entry['resident_mb'] if entry['resident_mb'] is not None else self.estimate_mb(*key, entry['processes'])
+
+    def acquire(self, backend=TRANSCRIBE_BACKEND, model_name=WHISPER_MODEL_NAME, processes=None, threads=None):
+        """Returns the pool for a backend and model, loading it (and making room for it) if needed."""
+        key = (backend, model_name)
+        with self._lock:
+            entry = self._pools.get(key)
+            if entry is None:
+                processes = processes or self.processes
+                self.threads = threads or self.threads or max(1, (os.cpu_count() or 1) // processes)
+                if not self.budget_mb:
+                    for other in list(self._pools):
+                        self._unload(other)
+                else:
+                    needed = self.estimate_mb(backend, model_name, processes)
+                    for other in sorted(self._pools, key=lambda k: self._pools[k]['last_used']):
+                        if sum(self._resident_mb(e, k) for k, e in self._pools.items()) + needed <= self.budget_mb:
+                            break
+                        print(f"Unloading transcription model {other[0]}/{other[1]} to stay within the {self.budget_mb} MB model budget.")
+                        self._unload(other)
+                    if needed > self.budget_mb:
+                        print(f"Warning: {backend}/{model_name} needs about {needed:.0f} MB, more than the {self.budget_mb} MB model budget.")
+                pool = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_chunk_worker,
+                    initargs=(backend, model_name, self.threads)
+                )
+                entry = self._pools[key] = {'pool': pool, 'processes': processes, 'loaded_at': time.time(),
+                                            'last_used': time.time(), 'resident_mb': None}
+            entry['last_used'] = time.time()
+            return entry['pool']
+
+    def touch(self, pool):
+        """Marks a pool as just used and re-measures its memory."""
+        with self._lock:
+            for key, entry in self._pools.items():
+                if entry['pool'] is pool:
+                    entry['last_used'] = time.time()
+                    self._measure(key, entry)
+
+    def _measure(self, key, entry):
+        # _processes is the executor's own {pid: process} map; empty until the first task starts them.
+        sizes = [_process_rss_mb(pid) for pid in list(getattr(entry['pool'], '_processes', None) or {})]
+        sizes = [size for size in sizes if size is not None]
+        if sizes:
+            entry['resident_mb'] = sum(sizes)
+            self._measured_mb[key] = max(self._measured_mb.get(key, 0), max(sizes))
+
+    def _unload(self, key, terminate=False):
+        entry = self._pools.pop(key, None)
+        if entry is not None:
+            if terminate:
+                # Chunks in progress would otherwise run to the end, outliving a worker that is shutting down.
+                for process in list((getattr(entry['pool'], '_processes', None) or {}).values()):
+                    process.terminate()
+            entry['pool'].shutdown(wait=False, cancel_futures=True)
+
+    def unload(self, backend=None, model_name=None, pool=None, terminate=False):
+        """
+        Unloads one pool (by key or by pool object), or every pool when nothing is given.
+        With terminate, chunk processes are ended at once instead of after their current chunk.
+        """
+        with self._lock:
+            for key in [k for k, e in self._pools.items()
+                        if (pool is None or e['pool'] is pool) and backend in (None, k[0]) and model_name in (None, k[1])]:
+                self._unload(key, terminate)
+
+    def release_idle(self):
+        """Unloads the pools that have not been used for idle_seconds; returns their keys."""
+        if not self.idle_seconds:
+            return []
+        with self._lock:
+            idle = [key for key, entry in self._pools.items() if time.time() - entry['last_used'] > self.idle_seconds]
+            for key in idle:
+                self._unload(key)
+            return idle
+
+    def residency(self):
+        """Returns one entry per loaded model: backend, model, processes, resident MB (measured or estimated) and times."""
+        with self._lock:
+            result = []
+            for key, entry in self._pools.items():
+                self._measure(key, entry)
+                result.append({'backend': key[0], 'model_name': key[1], 'processes': entry['processes'],
+                               'resident_mb': round(self._resident_mb(entry, key), 1),
+                               'measured': entry['resident_mb'] is not None,
+                               'loaded_at': entry['loaded_at'], 'last_used_at': entry['last_used']})
+            return result
+
+models = ModelManager()
+
+def get_chunk_pool(processes=TRANSCRIBE_PROCESSES, backend=TRANSCRIBE_BACKEND, model_name=WHISPER_MODEL_NAME, threads=None):
+    """
+    Returns the process pool used for chunk transcription with a backend and model,
+    loading it through the model manager on first use.
+    """
+    return models.acquire(backend, model_name, processes, threads)
+
+def warm_up_chunk_pool(pool=None, processes=TRANSCRIBE_PROCESSES):
+    """Starts every chunk process and loads its model by transcribing a second of silence."""
+    pool = pool or get_chunk_pool(processes=processes)
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    for future in [pool.submit(_transcribe_chunk, silence, 0, len(silence), 0) for _ in range(processes)]:
+        future.result()
+    models.touch(pool)
+
+def shutdown_chunk_pool(pool=None, terminate=False):
+    """Unloads one pool, or every loaded model; terminate also ends chunks in progress."""
+    models.unload(pool=pool, terminate=terminate)
+
+# --- Public API ---
+def transcribe_file(audio_path, pool=None, progress_callback=None):
+    """
+    Transcribes an audio or video file, splitting long recordings into chunks
+    that are transcribed in parallel. Returns {'text': ..., 'segments': [...]}.
+    progress_callback, if given, is called with the fraction of audio transcribed
+    each time a chunk finishes.
+    """
+    return transcribe_audio(preprocess.decode_audio(audio_path), pool=pool, progress_callback=progress_callback)
+
+def transcribe_audio(audio, pool=None, progress_callback=None, backend=None, model_name=None,
+                     completed_chunks=None, chunk_callback=None):
+    """
+    Like transcribe_file, for audio already decoded to 16 kHz mono float32 samples.
+    backend and model_name select the engine for this call (default: the configured ones).
+
+    Chunks are checkpointable: completed_chunks maps (core_start, core_end) to the result
+    of a chunk finished by an earlier, interrupted run, and those chunks are not
+    transcribed again. chunk_callback, if given, is called with each newly finished
+    chunk's result (a dict with 'core_start', 'core_end' and 'segments') so the caller
+    can store it; an exception raised by either callback stops the transcription.
+    """
+    if len(audio) < MIN_CHUNKED_SECONDS * SAMPLE_RATE:
+        chunks = [(0, len(audio), 0, len(audio))]
+    else:
+        chunks = plan_chunks(audio)
+    completed_chunks = completed_chunks or {}
+    results = {(core_start, core_end): completed_chunks[(core_start, core_end)]
+               for core_start, core_end, _, _ in chunks if (core_start, core_end) in completed_chunks}
+    print(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s of audio in {len(chunks)} chunk(s)"
+          f"{f', {len(results)} already done' if results else ''}.")
+
+    pool = pool or get_chunk_pool(backend=backend or TRANSCRIBE_BACKEND, model_name=model_name or WHISPER_MODEL_NAME)
+    futures = []
+    try:
+        futures = [pool.submit(_transcribe_chunk, audio[start:end], core_start, core_end, start)
+                   for core_start, core_end, start, end in chunks if (core_start, core_end) not in results]
+        done_samples = sum(core_end - core_start for core_start, core_end in results)
+        if progress_callback and results:
+            progress_callback(done_samples / max(1, len(audio)))
+        for future in as_completed(futures):
+            result = future.result()
+            results[(result['core_start'], result['core_end'])] = result
+            if chunk_callback:
+                chunk_callback(result)
+            done_samples += result['core_end'] - result['core_start']
+            if progress_callback:
+                progress_callback(done_samples / max(1, len(audio)))
+        models.touch(pool)
+        return stitch_chunks([results[(core_start, core_end)] for core_start, core_end, _, _ in chunks])
+    except BrokenProcessPool:
+        # A chunk worker died (e.g. the model failed to load); start fresh on the next job.
+        shutdown_chunk_pool(pool)
+        raise
+    except BaseException:
+        # Stopped early (e.g. the job was cancelled): drop the chunks that have not started.
+        for future in futures:
+            future.cancel()
+        raise
@@ -0,0 +1,41 @@
+"""Tests for stitching chunk transcripts in scripts/transcription.py."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import transcription
+
+
+def chunk(core_start, core_end, segments):
+    rate = transcription.SAMPLE_RATE
+    return {'core_start': core_start * rate, 'core_end': core_end * rate,
+            'segments': [{'start': start, 'end': end, 'text': text} for start, end, text in segments]}
+
+
+def test_offsets_point_at_each_segment():
+    result = transcription.stitch_chunks([
+        chunk(0, 10, [(0, 4, ' The quick brown'), (4, 9, ' fox jumps over')]),
+        chunk(10, 20, [(10, 15, ' the lazy dog.')]),
+    ])
+    assert result['text'] == "The quick brown fox jumps over the lazy dog."
+    for segment in result['segments']:
+        assert result['text'][segment['offset']:].startswith(segment['text'].split()[0])
+
+
+def test_segment_repeated_across_seam_is_dropped():
+    # The second chunk's first segment sits in its core but repeats the end of the first chunk.
+    result = transcription.stitch_chunks([
+        chunk(0, 30, [(0, 20, ' The quick brown'), (20, 29, ' fox jumps over')]),
+        chunk(30, 60, [(29, 32, ' fox jumps over'), (32, 40, ' the lazy dog.')]),
+    ])
+    assert result['text'] == "The quick brown fox jumps over the lazy dog."
+    assert [s['text'].strip() for s in result['segments']] == ["The quick brown", "fox jumps over", "the lazy dog."]
+    offsets = [s['offset'] for s in result['segments']]
+    assert offsets == sorted(set(offsets))
+
+
+def test_blank_segments_are_omitted():
+    result = transcription.stitch_chunks([chunk(0, 10, [(0, 2, ' '), (2, 6, ' Hello there.')])])
+    assert result['text'] == "Hello there."
+    assert [(s['text'], s['offset']) for s in result['segments']] == [(' Hello there.', 0)]